@@ -0,0 +1,193 @@
+import os
+import logging
+import re
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from dotenv import load_dotenv
+from app.services.cache import TTLCache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "5000"))
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", str(24 * 3600)))
+# Optional SQLite file so cached answers survive restarts
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", "")
+
+response_cache = TTLCache("ai_responses", maxsize=AI_CACHE_SIZE, ttl=AI_CACHE_TTL)
+
+_inflight = {}  # key -> Future shared by concurrent identical questions
+_disk = {"conn": None, "lock": threading.Lock()}
+_stats = {
+    "memory_hits": 0,
+    "disk_hits": 0,
+    "misses": 0,
+    "coalesced": 0,
+    "generated": 0,
+    "saved_seconds": 0.0,
+    "generation_seconds": 0.0,
+}
+
+class _LeaderCancelled(Exception):
+    """The request generating a shared answer went away; its waiters generate for themselves."""
+
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    text = _PUNCTUATION.sub(" ", text.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def cache_key(question: str, context: dict = None) -> str:
+    context = context or {}
+    status = context.get("status")
+    status = status.value if hasattr(status, "value") else status
+    # Everything the shared prompt (prompt_builder.build_shared_prompt) is built from; it carries no name
+    raw = f"{context.get('country') or ''}|{status or ''}|{normalize_question(question)}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+# --- SQLite backing store ---
+
+def _disk_conn():
+    if not AI_CACHE_PATH:
+        return None
+    if _disk["conn"] is None:
+        conn = sqlite3.connect(AI_CACHE_PATH, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_cache ("
+            "key TEXT PRIMARY KEY, response TEXT, latency REAL, created_at REAL)"
+        )
+        conn.commit()
+        _disk["conn"] = conn
+    return _disk["conn"]
+
+
+def _disk_get(key: str):
+    with _disk["lock"]:
+        row = _disk_conn().execute(
+            "SELECT response, latency, created_at FROM ai_cache WHERE key = ?", (key,)
+        ).fetchone()
+    if row is None or row[2] + AI_CACHE_TTL < time.time():
+        return None
+    return row[0], row[1]
+
+
+def _disk_put(key: str, response: str, latency: float):
+    with _disk["lock"]:
+        conn = _disk_conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO ai_cache (key, response, latency, created_at) VALUES (?, ?, ?, ?)",
+            (key, response, latency, time.time()),
+        )
+        conn.commit()
+
+
+# --- Lookup with single-flight generation ---
+
+async def _lookup(key: str):
+    entry = response_cache.get(key)
+    if entry is not None:
+        _stats["memory_hits"] += 1
+        _stats["saved_seconds"] += entry[1]
+        return entry[0]
+
+    if AI_CACHE_PATH:
+        entry = await asyncio.to_thread(_disk_get, key)
+        if entry is not None:
+            response_cache.set(key, entry)
+            _stats["disk_hits"] += 1
+            _stats["saved_seconds"] += entry[1]
+            return entry[0]
+    return None
+
+
+async def _persist(key: str, response: str, latency: float):
+    if AI_CACHE_PATH:
+        try:
+            await asyncio.to_thread(_disk_put, key, response, latency)
+        except Exception as e:
+            logger.warning("AI cache write failed: %s", e)
+
+
+async def lookup_response(question: str, context: dict):
+    """Cached answer or None (used by the streaming path, which generates itself)."""
+    response = await _lookup(cache_key(question, context))
+    if response is None:
+        _stats["misses"] += 1
+    return response
+
+
+async def store_response(question: str, context: dict, response: str, latency: float):
+    key = cache_key(question, context)
+    _stats["generated"] += 1
+    _stats["generation_seconds"] += latency
+    response_cache.set(key, (response, latency))
+    await _persist(key, response, latency)
+
+
+async def cached_response(question: str, context: dict, generate) -> str:
+    """Return a cached answer, or await `generate()` once per distinct key."""
+    key = cache_key(question, context)
+
+    response = await _lookup(key)
+    if response is not None:
+        return response
+
+    while key in _inflight:
+        pending = _inflight[key]
+        try:
+            response, latency = await asyncio.shield(pending)
+        except _LeaderCancelled:
+            # One client disconnecting must not fail the others: the next waiter becomes the leader
+            continue
+        _stats["coalesced"] += 1
+        _stats["saved_seconds"] += latency
+        return response
+
+    _stats["misses"] += 1
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        started = time.perf_counter()
+        response = await generate()
+        latency = time.perf_counter() - started
+        _stats["generated"] += 1
+        _stats["generation_seconds"] += latency
+
+        response_cache.set(key, (response, latency))
+        future.set_result((response, latency))
+    except asyncio.CancelledError:
+        future.set_exception(_LeaderCancelled())
+        future.exception()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Nobody may be waiting; mark the exception as retrieved
+        future.exception()
+        raise
+    finally:
+        del _inflight[key]
+
+    await _persist(key, response, latency)
+    return response
+
+
+def get_ai_cache_metrics() -> dict:
+    hits = _stats["memory_hits"] + _stats["disk_hits"] + _stats["coalesced"]
+    lookups = hits + _stats["misses"]
+    return {
+        **_stats,
+        "saved_seconds": round(_stats["saved_seconds"], 3),
+        "generation_seconds": round(_stats["generation_seconds"], 3),
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        "memory": response_cache.stats(),
+    }
@@ -0,0 +1,247 @@
+import os
+import time
+import random
+import asyncio
+from collections import deque
+from dotenv import load_dotenv
+from app.services.instrumentation import record_span
+
+load_dotenv()
+
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "16"))
+# How long a request may wait for a free slot before we answer with a fallback
+AI_QUEUE_TIMEOUT = float(os.getenv("AI_QUEUE_TIMEOUT", "5"))
+AI_CALL_TIMEOUT = float(os.getenv("AI_CALL_TIMEOUT", "15"))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
+AI_RETRY_BASE = float(os.getenv("AI_RETRY_BASE", "0.5"))
+
+# Circuit breaker: trips when the recent window is mostly errors or slow calls
+AI_BREAKER_WINDOW = int(os.getenv("AI_BREAKER_WINDOW", "20"))
+AI_BREAKER_MIN_CALLS = int(os.getenv("AI_BREAKER_MIN_CALLS", "10"))
+AI_BREAKER_ERROR_RATE = float(os.getenv("AI_BREAKER_ERROR_RATE", "0.5"))
+AI_BREAKER_SLOW_SECONDS = float(os.getenv("AI_BREAKER_SLOW_SECONDS", "8"))
+AI_BREAKER_SLOW_RATE = float(os.getenv("AI_BREAKER_SLOW_RATE", "0.5"))
+AI_BREAKER_COOLDOWN = float(os.getenv("AI_BREAKER_COOLDOWN", "30"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class GatewayError(Exception):
+    """The AI backend could not be used for this request (caller should fall back)."""
+
+
+class CircuitOpenError(GatewayError):
+    pass
+
+
+class GatewayBusyError(GatewayError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self):
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.calls = deque(maxlen=AI_BREAKER_WINDOW)  # (ok, seconds)
+        self.trips = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < AI_BREAKER_COOLDOWN:
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            # Let exactly one probe through until it reports back
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def record(self, ok: bool, seconds: float):
+        if self.state == "half_open":
+            self._probing = False
+            if ok and seconds < AI_BREAKER_SLOW_SECONDS:
+                self.state = "closed"
+                self.calls.clear()
+            else:
+                self._trip()
+            return
+
+        self.calls.append((ok, seconds))
+        if len(self.calls) < AI_BREAKER_MIN_CALLS:
+            return
+        errors = sum(1 for call_ok, _ in self.calls if not call_ok)
+        slow = sum(1 for _, call_seconds in self.calls if call_seconds >= AI_BREAKER_SLOW_SECONDS)
+        if errors / len(self.calls) >= AI_BREAKER_ERROR_RATE or slow / len(self.calls) >= AI_BREAKER_SLOW_RATE:
+            self._trip()
+
+    def release_probe(self):
+        # The probe ended without a verdict (cancelled, consumer went away): let the next call probe
+        self._probing = False
+
+    def _trip(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        self.calls.clear()
+
+
+breaker = CircuitBreaker()
+_semaphore = None
+_state = {"waiting": 0, "in_flight": 0}
+_stats = {"calls": 0, "succeeded": 0, "failed": 0, "timeouts": 0, "retries": 0,
+          "rejected_open": 0, "rejected_busy": 0, "fallbacks": 0}
+
+
+def _slots() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+    return _semaphore
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    # google.api_core exceptions carry the HTTP status in .code
+    code = getattr(error, "code", None)
+    code = getattr(code, "value", code)
+    if isinstance(code, int) and code in RETRYABLE_STATUS:
+        return True
+    return type(error).__name__ in {"ResourceExhausted", "ServiceUnavailable", "InternalServerError",
+                                    "DeadlineExceeded", "TooManyRequests", "ConnectError", "ReadTimeout"}
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter so retries from many coroutines don't line up
+    return random.uniform(0, AI_RETRY_BASE * (2 ** attempt))
+
+
+async def _acquire() -> bool:
+    """Take a slot; returns True if this call is the half-open probe."""
+    if not breaker.allow():
+        _stats["rejected_open"] += 1
+        raise CircuitOpenError("AI circuit breaker is open")
+    probe = breaker.state == "half_open"
+
+    _state["waiting"] += 1
+    try:
+        await asyncio.wait_for(_slots().acquire(), timeout=AI_QUEUE_TIMEOUT)
+    except BaseException as e:
+        # A half-open probe that never ran must not block the breaker
+        if probe:
+            breaker.release_probe()
+        if isinstance(e, asyncio.TimeoutError):
+            _stats["rejected_busy"] += 1
+            raise GatewayBusyError("AI backend is saturated")
+        raise
+    finally:
+        _state["waiting"] -= 1
+    _state["in_flight"] += 1
+    return probe
+
+
+def _release():
+    _state["in_flight"] -= 1
+    _slots().release()
+
+
+async def call_llm(make_call):
+    """Run `await make_call()` with a concurrency slot, deadline, retries and the breaker."""
+    probe = await _acquire()
+    try:
+        attempt = 0
+        while True:
+            _stats["calls"] += 1
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(make_call(), timeout=AI_CALL_TIMEOUT)
+            except Exception as e:
+                elapsed = time.perf_counter() - started
+                _stats["failed"] += 1
+                if isinstance(e, asyncio.TimeoutError):
+                    _stats["timeouts"] += 1
+                breaker.record(False, elapsed)
+                record_span("llm.generate", elapsed, ok=False)
+                if attempt < AI_MAX_RETRIES and is_retryable(e) and breaker.state == "closed":
+                    attempt += 1
+                    _stats["retries"] += 1
+                    await asyncio.sleep(_backoff(attempt))
+                    continue
+                raise GatewayError(str(e) or type(e).__name__) from e
+
+            elapsed = time.perf_counter() - started
+            breaker.record(True, elapsed)
+            record_span("llm.generate", elapsed)
+            _stats["succeeded"] += 1
+            return result
+    finally:
+        _release()
+        # No-op once record() has ruled; clears a probe that was cancelled mid-call
+        if probe:
+            breaker.release_probe()
+
+
+async def stream_llm(make_stream):
+    """Async-generator version of call_llm. Retries only before the first chunk."""
+    probe = await _acquire()
+    try:
+        attempt = 0
+        while True:
+            _stats["calls"] += 1
+            started = time.perf_counter()
+            yielded = False
+            try:
+                deadline = started + AI_CALL_TIMEOUT
+                stream = await asyncio.wait_for(make_stream(), timeout=AI_CALL_TIMEOUT)
+                iterator = stream.__aiter__()
+                while True:
+                    remaining = deadline - time.perf_counter()
+                    try:
+                        chunk = await asyncio.wait_for(iterator.__anext__(), timeout=max(remaining, 0.01))
+                    except StopAsyncIteration:
+                        break
+                    yielded = True
+                    yield chunk
+            except GeneratorExit:
+                raise
+            except Exception as e:
+                elapsed = time.perf_counter() - started
+                _stats["failed"] += 1
+                if isinstance(e, asyncio.TimeoutError):
+                    _stats["timeouts"] += 1
+                breaker.record(False, elapsed)
+                record_span("llm.stream", elapsed, ok=False)
+                if not yielded and attempt < AI_MAX_RETRIES and is_retryable(e) and breaker.state == "closed":
+                    attempt += 1
+                    _stats["retries"] += 1
+                    await asyncio.sleep(_backoff(attempt))
+                    continue
+                raise GatewayError(str(e) or type(e).__name__) from e
+
+            elapsed = time.perf_counter() - started
+            breaker.record(True, elapsed)
+            record_span("llm.stream", elapsed)
+            _stats["succeeded"] += 1
+            return
+    finally:
+        _release()
+        # Also covers GeneratorExit when the consumer stops reading early
+        if probe:
+            breaker.release_probe()
+
+
+def record_fallback():
+    _stats["fallbacks"] += 1
+
+
+def get_gateway_metrics() -> dict:
+    return {
+        **_stats,
+        "queue_depth": _state["waiting"],
+        "in_flight": _state["in_flight"],
+        "max_concurrency": AI_MAX_CONCURRENCY,
+        "breaker_state": breaker.state,
+        "breaker_trips": breaker.trips,
+    }
@@ -1,53 +1,107 @@
-import os
-import google.generativeai as genai
-from dotenv import load_dotenv
+import logging
+import time
+from app.services.llm import get_llm
+from app.services.ai_cache import cached_response, lookup_response, store_response
+from app.services.faq import retrieve, format_snippets, search_faq, FAQ_SNIPPET_THRESHOLD
+from app.services.ai_gateway import call_llm, stream_llm, record_fallback, GatewayError
+from app.services.prompt_builder import build_prompt, build_shared_prompt, is_shareable, record_llm_call, summary_prompt
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+TROUBLE_MESSAGE = "I'm having a little trouble thinking right now. Please ask again in a moment."
 
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
-    model = genai.GenerativeModel('gemini-2.0-flash')
-else:
-    model = None
+def _fallback_answer(user_message: str) -> str:
+    # Gemini is unavailable or saturated: closest FAQ answer, else a polite retry message
+    record_fallback()
+    matches = search_faq(user_message, top_k=1)
+    if matches and matches[0][0] >= FAQ_SNIPPET_THRESHOLD:
+        return matches[0][1]["answer"]
+    return TROUBLE_MESSAGE
 
-async def get_visa_counselor_response(user_message: str, history: list = [], context: dict = None) -> str:
-    if not model:
+async def get_visa_counselor_response(user_message: str, history: list = None, context: dict = None) -> str:
+    # Common visa FAQs are answered locally, without a Gemini call
+    faq_answer, faq_snippets = retrieve(user_message)
+    if faq_answer:
+        return faq_answer
+
+    llm = get_llm()
+    if not llm.available:
         return "System Error: AI service currently unavailable."
 
-    # Construct context from history if needed
-    
-    system_prompt = """
-    You are the AI assistant for **Dashboard Visa Business**, an expert Study Visa Consultancy based in **Pakistan**.
-    Your name is 'VisaBot'.
-    
-    Your Context:
-    - **Target Audience**: Pakistani Students (Matric, FSc, O/A Levels).
-    - **Currency**: Convert costs to **PKR (Lakhs/Crores)** where helpful (Approx 1 USD = 280 PKR).
-    - **Local Docs**: Mention FRC (Family Registration Certificate), Polio Card, and IBCC attestation.
-    
-    Your goal is to:
-    1. EXCLUSIVELY discuss **Study Visas** for Canada, UK, USA, and Australia.
-    2. Collect student details if missing (Name, Age, Target Country).
-    3. Guide them to "Apply Now".
-    
-    If asked about other topics (cooking, sports, etc.), politely decline and steer back to Study Visas.
-    Keep responses concise (max 3 sentences) suitable for WhatsApp/Telegram.
-    """
-
-    context_str = ""
-    if context:
-        name = context.get("name") or "Student"
-        country = context.get("country") or "Unknown"
-        status = context.get("status") or "New"
-        context_str = f"\n    Current Student Context:\n    - Name: {name}\n    - Interested Info: {country}\n    - Application Status: {status}\n"
-
-    prompt = f"{system_prompt}{context_str}\n\nUser: {user_message}\nVisaGenie:"
+    # The static prompt lives in the model's system instruction; only this turn's part is sent.
+    # Standalone questions get the shared prompt, whose answer is cached across students.
+    notes = format_snippets(faq_snippets)
+    shared = is_shareable(user_message, context, history, bool(faq_snippets))
+    prompt = build_shared_prompt(user_message, context, notes) if shared else build_prompt(user_message, context, history, notes)
+
+    async def generate():
+        started = time.perf_counter()
+        text = await call_llm(lambda: llm.generate(prompt))
+        record_llm_call(time.perf_counter() - started)
+        return text
+
+    try:
+        if not shared:
+            # Built on this student's conversation: neither shareable nor reusable for a follow-up
+            return await generate()
+        # Near-identical questions with the same country/status share one answer
+        return await cached_response(user_message, context, generate)
+    except GatewayError as e:
+        logger.warning("AI gateway fallback: %s", e)
+        return _fallback_answer(user_message)
+    except Exception:
+        logger.exception("AI Error")
+        return TROUBLE_MESSAGE
+
+async def stream_visa_counselor_response(user_message: str, history: list = None, context: dict = None):
+    """Like get_visa_counselor_response, but yields the answer as it is generated."""
+    faq_answer, faq_snippets = retrieve(user_message)
+    if faq_answer:
+        yield faq_answer
+        return
+
+    llm = get_llm()
+    if not llm.available:
+        yield "System Error: AI service currently unavailable."
+        return
+
+    notes = format_snippets(faq_snippets)
+    shared = is_shareable(user_message, context, history, bool(faq_snippets))
+    if shared:
+        cached = await lookup_response(user_message, context)
+        if cached is not None:
+            yield cached
+            return
+
+    prompt = build_shared_prompt(user_message, context, notes) if shared else build_prompt(user_message, context, history, notes)
+    started = time.perf_counter()
+    parts = []
+    try:
+        async for chunk in stream_llm(lambda: llm.open_stream(prompt)):
+            parts.append(chunk)
+            yield chunk
+    except GatewayError as e:
+        logger.warning("AI gateway fallback: %s", e)
+        if not parts:
+            yield _fallback_answer(user_message)
+        return
+    except Exception:
+        logger.exception("AI Error")
+        if not parts:
+            yield TROUBLE_MESSAGE
+        return
+
+    latency = time.perf_counter() - started
+    record_llm_call(latency)
+    if shared:
+        await store_response(user_message, context, "".join(parts).strip(), latency)
 
+async def summarize_conversation(previous_summary: str, turns: list):
+    llm = get_llm()
+    if not llm.available:
+        return None
     try:
-        response = await model.generate_content_async(prompt)
-        return response.text.strip()
+        return await call_llm(lambda: llm.summarize(summary_prompt(previous_summary, turns)))
     except Exception as e:
-        print(f"AI Error: {e}")
-        return "I'm having a little trouble thinking right now. Please ask again in a moment."
+        logger.warning("AI summary error: %s", e)
+        return None
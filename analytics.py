@@ -1,48 +1,119 @@
-from fastapi import APIRouter
-from sqlalchemy import func, select
-from app.db.database import AsyncSessionLocal
-from app.models.application import VisaApplication
-from app.models.student import Student
+import json
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import AsyncSessionLocal, get_db
 from app.models.chat_log import ChatLog
+from app.services.chat_log_writer import pending_entries, entry_key
+from app.services.stats import get_stats_snapshot
+from app.services import broadcast
 
 router = APIRouter()
 
 @router.get("/stats")
 async def get_stats():
-    async with AsyncSessionLocal() as session:
-        # Total Students/Leads
-        total_leads = await session.scalar(select(func.count(Student.id)))
-        
-        # Visa Status Counts
-        approved = await session.scalar(select(func.count(VisaApplication.id)).where(VisaApplication.status == "approved"))
-        active = await session.scalar(select(func.count(VisaApplication.id)).where(VisaApplication.status != "rejected"))
-        
-        return {
-            "total_leads": total_leads,
-            "approved_visas": approved,
-            "active_applications": active,
-            "ai_engagement": "98.5%" # Mock for now or calculate based on chat logs
+    # Served from the in-memory stats engine (reconciled with the DB periodically)
+    return await get_stats_snapshot()
+
+async def _recent_chat(session: AsyncSession) -> list:
+    # Read from the primary: pending entries only cover rows not yet flushed, not ones the replica lags on
+    # Fetch last 50 messages from all chats
+    result = await session.execute(
+        select(ChatLog)
+        .order_by(ChatLog.created_at.desc())
+        .limit(50)
+    )
+    logs = result.scalars().all()
+
+    # Format for frontend
+    stream = [
+        {
+            "id": log.id,
+            "sender": log.sender,
+            "text": log.message,
+            "time": log.created_at.strftime("%I:%M %p"),
+            "student_id": log.student_id,
+            "_at": log.created_at
         }
+        for log in reversed(logs) # Return chronological order
+    ]
+
+    # Merge messages not yet flushed by the chat-log writer (no id yet)
+    seen = {entry_key(log.student_id, log.sender, log.message, log.created_at) for log in logs}
+    for row in pending_entries():
+        if entry_key(row["student_id"], row["sender"], row["message"], row["created_at"]) not in seen:
+            stream.append({
+                "id": None,
+                "sender": row["sender"],
+                "text": row["message"],
+                "time": row["created_at"].strftime("%I:%M %p"),
+                "student_id": row["student_id"],
+                "_at": row["created_at"]
+            })
+    stream.sort(key=lambda item: item["_at"])
+    for item in stream:
+        del item["_at"]
+    return stream[-50:]
 
 @router.get("/stream")
-async def get_chat_stream():
-    async with AsyncSessionLocal() as session:
-        # Fetch last 50 messages from all chats
-        result = await session.execute(
-            select(ChatLog)
-            .order_by(ChatLog.created_at.desc())
-            .limit(50)
-        )
-        logs = result.scalars().all()
-        
-        # Format for frontend
-        return [
-            {
-                "id": log.id,
-                "sender": log.sender,
-                "text": log.message,
-                "time": log.created_at.strftime("%I:%M %p"),
-                "student_id": log.student_id
-            }
-            for log in reversed(logs) # Return chronological order
-        ]
+async def get_chat_stream(session: AsyncSession = Depends(get_db)):
+    return await _recent_chat(session)
+
+def _sse(payload: dict, event_id: int = None) -> str:
+    head = f"id: {broadcast.format_event_id(event_id)}\n" if event_id is not None else ""
+    return f"{head}data: {json.dumps(payload)}\n\n"
+
+@router.get("/stream/live")
+async def live_chat_stream(request: Request, last_event_id: Optional[str] = Header(None)):
+    """Server-Sent Events: backlog once, then only new messages."""
+    # Subscribe first so nothing published while the backlog loads is missed
+    subscriber = broadcast.subscribe()
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+
+            backlog = None
+            resumed_from = broadcast.parse_event_id(last_event_id)
+            if resumed_from is not None:
+                backlog = broadcast.events_since(resumed_from)
+
+            if backlog is None:
+                # Fresh client (or resumed from too far back): last 50 messages
+                # Short-lived session: the stream itself can stay open for hours
+                async with AsyncSessionLocal() as session:
+                    recent = await _recent_chat(session)
+                # Taken after the query (no await in between): anything published while it ran is
+                # already in `recent` via the pending buffer, so it must not be sent again
+                cutoff = broadcast.last_event_id()
+                for item in recent:
+                    yield _sse(item)
+                # Marks the client's position so a reconnect only gets deltas
+                yield _sse({"type": "backlog_end"}, cutoff)
+            else:
+                cutoff = backlog[-1][0] if backlog else resumed_from
+                for event_id, payload in backlog:
+                    yield _sse(payload, event_id)
+
+            while not subscriber.overflowed:
+                try:
+                    event_id, payload = await asyncio.wait_for(subscriber.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                if event_id > cutoff:
+                    yield _sse(payload, event_id)
+            # Overflowed subscribers fall through here; EventSource reconnects with Last-Event-ID
+        finally:
+            broadcast.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
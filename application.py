@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum, Index, func
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -26,3 +26,11 @@ class VisaApplication(Base):
 
     student = relationship("Student", back_populates="applications")
     documents = relationship("Document", back_populates="application")
+
+    __table_args__ = (
+        Index("ix_visa_applications_student_id_created_at", "student_id", "created_at"), # crm profile
+        Index("ix_visa_applications_status", "status"), # stats
+        # leads list keyset; legacy rows have no updated_at
+        Index("ix_visa_applications_activity_at_id", func.coalesce(updated_at, created_at), "id"),
+        Index("uq_visa_applications_student_id_country", "student_id", "country", unique=True), # one lead per country
+    )
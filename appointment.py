@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.db.base import Base
@@ -11,6 +11,17 @@ class Appointment(Base):
     date_time = Column(DateTime)
     status = Column(String, default="scheduled") # scheduled, completed, cancelled
     notes = Column(String, nullable=True)
+    office = Column(String, nullable=True) # Lahore, Islamabad, Online
+    seat = Column(Integer, nullable=True) # which of the office's counselors takes the slot
     created_at = Column(DateTime, default=datetime.utcnow)
 
     student = relationship("Student", back_populates="appointments")
+
+    __table_args__ = (
+        Index("ix_appointments_student_id_date_time", "student_id", "date_time"),
+        # No double-booking: one scheduled appointment per counselor seat and slot
+        Index(
+            "uq_appointments_office_date_time_seat", "office", "date_time", "seat", unique=True,
+            postgresql_where=text("status = 'scheduled'"), sqlite_where=text("status = 'scheduled'"),
+        ),
+    )
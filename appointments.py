@@ -0,0 +1,31 @@
+from datetime import date, datetime, time
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from app.services.scheduling import OFFICES, PKT, available_slots, cancel_appointment, format_slot
+
+router = APIRouter()
+
+@router.get("/availability")
+async def get_availability(
+    office: Optional[str] = None,
+    day: Optional[date] = Query(None, alias="date"),
+    limit: int = Query(10, ge=1, le=100),
+):
+    # Served from the in-memory slot index; no appointments table scan
+    if office is not None and office not in OFFICES:
+        raise HTTPException(status_code=400, detail=f"Invalid office. Must be one of {list(OFFICES)}")
+
+    after = datetime.combine(day, time(0), tzinfo=PKT) if day else None
+    availability = {}
+    for name in [office] if office else OFFICES:
+        slots = available_slots(name, after=after, limit=limit)
+        if day:
+            slots = [slot for slot in slots if slot.date() == day]
+        availability[name] = [{"start": slot.isoformat(), "label": format_slot(slot)} for slot in slots]
+    return {"timezone": "Asia/Karachi", "availability": availability}
+
+@router.post("/{appointment_id}/cancel")
+async def cancel(appointment_id: int):
+    if not await cancel_appointment(appointment_id):
+        raise HTTPException(status_code=404, detail="No scheduled appointment with that id")
+    return {"message": "Appointment cancelled", "id": appointment_id}
@@ -0,0 +1,71 @@
+"""Micro-benchmark: per-message intent dispatch, old if-chain vs precompiled router.
+
+Usage: python bench_intents.py [iterations]
+"""
+import sys
+import timeit
+from app.services.intents import route
+
+MESSAGES = [
+    "hi", "/start", "status", "apply", "name: ali raza", "1", "canada", "uk",
+    "book", "date: tomorrow 3 pm", "what ielts score do i need for canada?",
+    "how much bank statement for uk in lakhs", "australia", "hlo", "/status",
+]
+
+
+def legacy_route(msg_body: str):
+    # Mirrors the original telegram_webhook branch order, dict rebuilds included
+    if msg_body in ["hi", "hello", "start", "/start", "hlo"]:
+        return "menu", None
+    if msg_body == "status" or msg_body == "/status":
+        return "status", None
+    if msg_body == "apply" or msg_body == "/apply":
+        return "apply", None
+    if msg_body.startswith("name:"):
+        return "name", msg_body.split("name:")[1].strip()
+    country_map = {
+        "1": "Canada", "canada": "Canada",
+        "2": "UK", "uk": "UK",
+        "3": "USA", "usa": "USA",
+        "4": "Australia", "australia": "Australia"
+    }
+    selected_country = country_map.get(msg_body)
+    if selected_country:
+        docs = {
+            "Canada": "🇨🇦 *Canada Study Visa (Pakistan Req):*",
+            "UK": "🇬🇧 *UK Study Visa (Pakistan Req):*",
+            "USA": "🇺🇸 *USA Study Visa (Pakistan Req):*",
+            "Australia": "🇦🇺 *Australia Study Visa (Pakistan Req):*"
+        }
+        docs[selected_country]
+        return "country", selected_country
+    if msg_body == "book" or msg_body == "/book":
+        return "book", None
+    if msg_body.startswith("date:"):
+        return "date", msg_body.split("date:")[1].strip()
+    return "ai", None
+
+
+def run(func, iterations: int) -> float:
+    def loop():
+        for message in MESSAGES:
+            func(message)
+    seconds = min(timeit.repeat(loop, number=iterations, repeat=5))
+    return seconds / (iterations * len(MESSAGES)) * 1e9
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    for message in MESSAGES:
+        assert route(message) == legacy_route(message), message
+
+    legacy_ns = run(legacy_route, iterations)
+    router_ns = run(route, iterations)
+    print(f"if-chain : {legacy_ns:8.1f} ns/message")
+    print(f"router   : {router_ns:8.1f} ns/message")
+    print(f"speedup  : {legacy_ns / router_ns:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
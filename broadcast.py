@@ -0,0 +1,99 @@
+import os
+import uuid
+import asyncio
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Recent events kept for clients resuming with Last-Event-ID
+BROADCAST_HISTORY = int(os.getenv("BROADCAST_HISTORY", "1000"))
+# Per-subscriber buffer; a tab that falls this far behind is disconnected
+BROADCAST_SUBSCRIBER_BUFFER = int(os.getenv("BROADCAST_SUBSCRIBER_BUFFER", "200"))
+
+
+class Subscriber:
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=BROADCAST_SUBSCRIBER_BUFFER)
+        self.overflowed = False
+
+
+# Event ids count from 1 in every process: clients get "<epoch>-<n>" so an id from
+# before a restart, or from another worker, is never mistaken for one of ours
+EPOCH = uuid.uuid4().hex[:8]
+
+_history = deque(maxlen=BROADCAST_HISTORY)  # (event_id, payload)
+_subscribers = set()
+_state = {"last_id": 0, "published": 0, "dropped_subscribers": 0}
+
+
+def publish(payload: dict) -> int:
+    _state["last_id"] += 1
+    event_id = _state["last_id"]
+    _history.append((event_id, payload))
+    _state["published"] += 1
+
+    for subscriber in list(_subscribers):
+        try:
+            subscriber.queue.put_nowait((event_id, payload))
+        except asyncio.QueueFull:
+            # Cut slow consumers loose; they reconnect and resume from history
+            subscriber.overflowed = True
+            _subscribers.discard(subscriber)
+            _state["dropped_subscribers"] += 1
+    return event_id
+
+
+def publish_chat(student_id: int, sender: str, message: str, created_at):
+    publish({
+        "sender": sender,
+        "text": message,
+        "time": created_at.strftime("%I:%M %p"),
+        "student_id": student_id,
+    })
+
+
+def last_event_id() -> int:
+    return _state["last_id"]
+
+
+def format_event_id(event_id: int) -> str:
+    return f"{EPOCH}-{event_id}"
+
+
+def parse_event_id(value: str):
+    """Our event number from a Last-Event-ID, or None if it came from another process (or is malformed)."""
+    epoch, _, number = (value or "").partition("-")
+    if epoch != EPOCH or not number.isdigit():
+        return None
+    return int(number)
+
+
+def events_since(event_id: int):
+    """Events after `event_id`, or None if they are no longer all in history."""
+    if event_id > _state["last_id"]:
+        # Not an id this process has issued
+        return None
+    if event_id == _state["last_id"]:
+        return []
+    if not _history or _history[0][0] > event_id + 1:
+        return None
+    return [event for event in _history if event[0] > event_id]
+
+
+def subscribe() -> Subscriber:
+    subscriber = Subscriber()
+    _subscribers.add(subscriber)
+    return subscriber
+
+
+def unsubscribe(subscriber: Subscriber):
+    _subscribers.discard(subscriber)
+
+
+def get_broadcast_metrics() -> dict:
+    return {
+        **_state,
+        "subscribers": len(_subscribers),
+        "history": len(_history),
+    }
@@ -0,0 +1,141 @@
+import os
+import logging
+import json
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Optional Redis URL used to fan invalidations out to the other uvicorn workers
+CACHE_PUBSUB_URL = os.getenv("CACHE_PUBSUB_URL")
+CACHE_PUBSUB_CHANNEL = os.getenv("CACHE_PUBSUB_CHANNEL", "visa-cache-invalidate")
+
+_PROCESS_ID = uuid.uuid4().hex
+
+_caches = {}
+_bus = {"redis": None, "task": None}
+
+
+class TTLCache:
+    """LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        _caches[name] = self
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key, default=None):
+        # Like get() but without touching LRU order or counters
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return default
+        return entry[1]
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key):
+        entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def get_cache_stats() -> dict:
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+async def publish_invalidation(cache_name: str, key):
+    """Tell the other workers to drop `key`; the caller handles its own copy."""
+    redis = _bus["redis"]
+    if redis is None:
+        return
+    payload = json.dumps({"origin": _PROCESS_ID, "cache": cache_name, "key": key})
+    try:
+        await redis.publish(CACHE_PUBSUB_CHANNEL, payload)
+    except Exception as e:
+        logger.warning("Cache invalidation publish failed: %s", e)
+
+
+async def _listen(pubsub):
+    async for message in pubsub.listen():
+        if message.get("type") != "message":
+            continue
+        try:
+            data = json.loads(message["data"])
+        except (TypeError, ValueError):
+            continue
+        if data.get("origin") == _PROCESS_ID:
+            continue
+        cache = _caches.get(data.get("cache"))
+        if cache is not None:
+            cache.pop(data.get("key"))
+
+
+async def start_cache_bus():
+    if not CACHE_PUBSUB_URL or _bus["redis"] is not None:
+        return
+    try:
+        import redis.asyncio as aioredis
+    except ImportError:
+        logger.warning("CACHE_PUBSUB_URL is set but the redis package is not installed; cache bus disabled.")
+        return
+
+    _bus["redis"] = aioredis.from_url(CACHE_PUBSUB_URL)
+    pubsub = _bus["redis"].pubsub()
+    await pubsub.subscribe(CACHE_PUBSUB_CHANNEL)
+    _bus["task"] = asyncio.create_task(_listen(pubsub))
+
+
+async def stop_cache_bus():
+    if _bus["task"] is not None:
+        _bus["task"].cancel()
+        await asyncio.gather(_bus["task"], return_exceptions=True)
+        _bus["task"] = None
+    if _bus["redis"] is not None:
+        await _bus["redis"].aclose()
+        _bus["redis"] = None
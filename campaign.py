@@ -0,0 +1,44 @@
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Index
+from sqlalchemy.orm import relationship
+from datetime import datetime
+from app.db.base import Base
+
+class Campaign(Base):
+    __tablename__ = "campaigns"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String)
+    channel = Column(String) # telegram, whatsapp
+    message = Column(Text) # "{name}" is replaced with the student's name
+    country = Column(String, nullable=True) # segment filters; None matches any
+    application_status = Column(String, nullable=True)
+    state = Column(String, default="draft") # draft, running, paused, completed, failed
+    last_student_id = Column(Integer, default=0) # checkpoint: every student up to here is done
+    lease_expires_at = Column(DateTime, nullable=True) # held by the one worker running it
+    lease_owner = Column(String(32), nullable=True) # token of the run holding the lease
+    sent_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    recipients = relationship("CampaignRecipient", back_populates="campaign")
+
+class CampaignRecipient(Base):
+    __tablename__ = "campaign_recipients"
+
+    id = Column(Integer, primary_key=True, index=True)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"))
+    student_id = Column(Integer, ForeignKey("students.id"))
+    status = Column(String, default="sending") # sending, sent, failed, unknown (interrupted mid-send)
+    error = Column(String, nullable=True)
+    attempts = Column(Integer, default=0)
+    sent_at = Column(DateTime, nullable=True)
+
+    campaign = relationship("Campaign", back_populates="recipients")
+
+    __table_args__ = (
+        # The claim: a student gets at most one message per campaign, across restarts and workers
+        Index("uq_campaign_recipients_campaign_id_student_id", "campaign_id", "student_id", unique=True),
+        Index("ix_campaign_recipients_campaign_id_status", "campaign_id", "status"), # outcome counts
+    )
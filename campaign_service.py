@@ -0,0 +1,427 @@
+import os
+import time
+import uuid
+import random
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import and_, delete, insert, or_, update, func
+from sqlalchemy.future import select
+from app.db.database import AsyncSessionLocal
+from app.models.application import VisaApplication
+from app.models.campaign import Campaign, CampaignRecipient
+from app.models.student import Student
+from app.services.outbound import acquire_send_slot
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Students fetched per keyset page; also the checkpoint interval
+CAMPAIGN_BATCH_SIZE = int(os.getenv("CAMPAIGN_BATCH_SIZE", "500"))
+# Sends in flight per campaign; the provider rate limits still apply on top
+CAMPAIGN_CONCURRENCY = int(os.getenv("CAMPAIGN_CONCURRENCY", "20"))
+CAMPAIGN_MAX_RETRIES = int(os.getenv("CAMPAIGN_MAX_RETRIES", "3"))
+CAMPAIGN_RETRY_BASE = float(os.getenv("CAMPAIGN_RETRY_BASE", "1"))
+# A runner renews its lease every third of this; a campaign whose lease lapses is resumed elsewhere
+CAMPAIGN_LEASE_SECONDS = float(os.getenv("CAMPAIGN_LEASE_SECONDS", "60"))
+# Pick up campaigns left "running" by a restart or a crashed worker
+CAMPAIGN_RESUME_ON_STARTUP = os.getenv("CAMPAIGN_RESUME_ON_STARTUP", "true").lower() == "true"
+
+CHANNELS = ("telegram", "whatsapp")
+
+_state = {"tasks": {}, "owners": {}, "progress": {}, "resumer": None}  # campaign_id -> asyncio.Task / lease token / live counters
+_stats = {"started": 0, "completed": 0, "failed": 0, "sent": 0, "send_failures": 0,
+          "retried": 0, "skipped_claimed": 0, "batches": 0}
+
+
+def _senders():
+    # Imported lazily: the API modules import the outbound dispatcher
+    from app.services.telegram_service import deliver_telegram_message
+    from app.api.whatsapp import deliver_whatsapp_message
+    return {"telegram": deliver_telegram_message, "whatsapp": deliver_whatsapp_message}
+
+
+def render_message(template: str, name: str) -> str:
+    return template.replace("{name}", name or "Future Scholar")
+
+
+def segment_query(campaign: Campaign, after_id: int):
+    """Next page of students in the campaign's segment after `after_id`, in id order.
+
+    Only students reachable on the campaign's channel: whatsapp_id holds a phone number or a
+    Telegram chat id depending on where the student wrote from.
+    """
+    applications = select(VisaApplication.student_id)
+    if campaign.country:
+        applications = applications.where(VisaApplication.country == campaign.country)
+    if campaign.application_status:
+        applications = applications.where(VisaApplication.status == campaign.application_status)
+    return (
+        select(Student.id, Student.whatsapp_id, Student.name)
+        .where(Student.id > after_id, Student.channel == campaign.channel, Student.id.in_(applications))
+        .order_by(Student.id)
+        .limit(CAMPAIGN_BATCH_SIZE)
+    )
+
+
+def _claim_statement(dialect: str, campaign_id: int, student_ids: list):
+    rows = [{"campaign_id": campaign_id, "student_id": student_id, "status": "sending", "attempts": 0}
+            for student_id in student_ids]
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        return None
+    return (
+        upsert(CampaignRecipient).values(rows)
+        .on_conflict_do_nothing(index_elements=["campaign_id", "student_id"])
+        .returning(CampaignRecipient.student_id)
+    )
+
+
+async def _claim(campaign_id: int, student_ids: list) -> set:
+    """Insert recipient rows before sending; only students whose row we created get a message."""
+    async with AsyncSessionLocal() as session:
+        statement = _claim_statement(session.bind.dialect.name, campaign_id, student_ids)
+        if statement is None:
+            # No upsert: claim what nobody has claimed yet (single runner per campaign only)
+            taken = set((await session.scalars(
+                select(CampaignRecipient.student_id)
+                .where(CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.student_id.in_(student_ids))
+            )).all())
+            claimed = [student_id for student_id in student_ids if student_id not in taken]
+            if claimed:
+                await session.execute(insert(CampaignRecipient), [
+                    {"campaign_id": campaign_id, "student_id": student_id, "status": "sending", "attempts": 0}
+                    for student_id in claimed
+                ])
+            claimed = set(claimed)
+        else:
+            claimed = set((await session.scalars(statement)).all())
+        await session.commit()
+    return claimed
+
+
+async def _send(channel: str, chat_id: str, text: str, sender) -> tuple:
+    """Returns (status, error, attempts)."""
+    error = None
+    for attempt in range(CAMPAIGN_MAX_RETRIES + 1):
+        await acquire_send_slot(channel, chat_id)
+        retryable = False
+        try:
+            response = await sender(chat_id, text)
+            if response is None:
+                return "failed", f"{channel} is not configured", attempt + 1
+            if response.is_success:
+                return "sent", None, attempt + 1
+            error = f"HTTP {response.status_code}"
+            retryable = response.status_code == 429 or response.status_code >= 500
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            retryable = True
+        if not retryable or attempt == CAMPAIGN_MAX_RETRIES:
+            break
+        _stats["retried"] += 1
+        await asyncio.sleep(CAMPAIGN_RETRY_BASE * (2 ** attempt) * (0.5 + random.random() / 2))
+    return "failed", error[:500], attempt + 1
+
+
+async def _record_outcome(campaign_id: int, student_id: int, status: str, error: str, attempts: int):
+    sent = status == "sent"
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(CampaignRecipient)
+            .where(CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.student_id == student_id)
+            .values(status=status, error=error, attempts=attempts, sent_at=datetime.utcnow() if sent else None)
+        )
+        await session.execute(
+            update(Campaign).where(Campaign.id == campaign_id).values(
+                sent_count=Campaign.sent_count + (1 if sent else 0),
+                failed_count=Campaign.failed_count + (0 if sent else 1),
+            )
+        )
+        await session.commit()
+
+
+async def _release_claims(campaign_id: int, student_ids: list):
+    # Claimed but never attempted: drop the claim so the next run sends to them
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            delete(CampaignRecipient)
+            .where(CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.status == "sending",
+                   CampaignRecipient.student_id.in_(student_ids))
+        )
+        await session.commit()
+
+
+async def _send_batch(campaign: Campaign, rows: list, claimed: set, sender, progress: dict):
+    semaphore = asyncio.Semaphore(CAMPAIGN_CONCURRENCY)
+    attempted = set()
+
+    async def send_one(row):
+        async with semaphore:
+            attempted.add(row.id)
+            text = render_message(campaign.message, row.name)
+            status, error, attempts = await _send(campaign.channel, row.whatsapp_id, text, sender)
+            # Shielded: once the provider has answered, the outcome is written even if we are being cancelled
+            await asyncio.shield(_record_outcome(campaign.id, row.id, status, error, attempts))
+        key = "sent" if status == "sent" else "failed"
+        progress[key] += 1
+        _stats["sent" if key == "sent" else "send_failures"] += 1
+
+    tasks = [asyncio.create_task(send_one(row)) for row in rows if row.id in claimed]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # Paused, shutting down, or an outcome write failed: stop the other sends before leaving.
+        # Sends in flight stay 'sending' (marked unknown on resume); the rest are released.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        never_attempted = [student_id for student_id in claimed if student_id not in attempted]
+        if never_attempted:
+            try:
+                await asyncio.shield(_release_claims(campaign.id, never_attempted))
+            except Exception:
+                logger.exception("Could not release %d unsent claims of campaign %s", len(never_attempted), campaign.id)
+
+
+async def _checkpoint(campaign_id: int, last_student_id: int):
+    async with AsyncSessionLocal() as session:
+        await session.execute(update(Campaign).where(Campaign.id == campaign_id).values(last_student_id=last_student_id))
+        await session.commit()
+
+
+async def _set_state(campaign_id: int, owner: str = None, **values):
+    # With an owner, only while that run still holds the lease
+    statement = update(Campaign).where(Campaign.id == campaign_id)
+    if owner is not None:
+        statement = statement.where(Campaign.lease_owner == owner)
+    async with AsyncSessionLocal() as session:
+        await session.execute(statement.values(**values))
+        await session.commit()
+
+
+def _lease_expiry() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=CAMPAIGN_LEASE_SECONDS)
+
+
+async def _take_lease(campaign_id: int, from_states: list, owner: str) -> bool:
+    """Atomically become the campaign's only runner: from `from_states`, or from 'running' with a lapsed lease."""
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(Campaign)
+            .where(Campaign.id == campaign_id, or_(
+                Campaign.state.in_(from_states),
+                and_(Campaign.state == "running",
+                     or_(Campaign.lease_expires_at.is_(None), Campaign.lease_expires_at < now)),
+            ))
+            .values(state="running", lease_owner=owner, lease_expires_at=_lease_expiry(), finished_at=None,
+                    started_at=func.coalesce(Campaign.started_at, now))
+        )
+        await session.commit()
+    return bool(result.rowcount)
+
+
+async def _renew_lease(campaign_id: int, owner: str) -> bool:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(Campaign)
+            .where(Campaign.id == campaign_id, Campaign.state == "running", Campaign.lease_owner == owner)
+            .values(lease_expires_at=_lease_expiry())
+        )
+        await session.commit()
+    return bool(result.rowcount)
+
+
+async def _heartbeat(campaign_id: int, runner: asyncio.Task, owner: str):
+    # Local view of our lease; once it has passed another worker may already be running the campaign
+    expires = time.monotonic() + CAMPAIGN_LEASE_SECONDS
+    while True:
+        await asyncio.sleep(CAMPAIGN_LEASE_SECONDS / 3)
+        attempted_at = time.monotonic()
+        try:
+            renewed = await asyncio.wait_for(_renew_lease(campaign_id, owner),
+                                             timeout=max(expires - attempted_at, 0.1))
+        except asyncio.TimeoutError:
+            renewed = False
+        except Exception:
+            logger.exception("Could not renew the lease of campaign %s", campaign_id)
+            # Another try fits before the lease runs out
+            if time.monotonic() + CAMPAIGN_LEASE_SECONDS / 3 < expires:
+                continue
+            renewed = False
+        if not renewed:
+            # Paused, taken over after our lease lapsed, or lapsed while renewing: stop sending
+            logger.warning("Campaign %s lost its lease; stopping this runner", campaign_id)
+            runner.cancel()
+            return
+        expires = attempted_at + CAMPAIGN_LEASE_SECONDS
+
+
+async def _run(campaign_id: int, owner: str):
+    async with AsyncSessionLocal() as session:
+        # Rows claimed by a run that died mid-send may or may not have gone out: never resend them.
+        # Safe here: we hold the lease, so no other runner has sends in flight.
+        await session.execute(
+            update(CampaignRecipient)
+            .where(CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.status == "sending")
+            .values(status="unknown")
+        )
+        await session.commit()
+        campaign = await session.get(Campaign, campaign_id)
+
+    sender = _senders()[campaign.channel]
+    progress = _state["progress"][campaign_id] = {"sent": 0, "failed": 0, "skipped": 0, "started": time.monotonic()}
+    _stats["started"] += 1
+    after_id = campaign.last_student_id or 0
+    while True:
+        # Keyset pages on short sessions: no cursor or snapshot held open across sends and retry sleeps
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(segment_query(campaign, after_id))).all()
+        if not rows:
+            break
+        _stats["batches"] += 1
+        claimed = await _claim(campaign_id, [row.id for row in rows])
+        skipped = len(rows) - len(claimed)
+        progress["skipped"] += skipped
+        _stats["skipped_claimed"] += skipped
+
+        await _send_batch(campaign, rows, claimed, sender, progress)
+        after_id = rows[-1].id
+        await _checkpoint(campaign_id, after_id)
+
+    await _set_state(campaign_id, owner, state="completed", finished_at=datetime.utcnow(),
+                     lease_expires_at=None, lease_owner=None)
+    _stats["completed"] += 1
+
+
+async def _supervise(campaign_id: int, owner: str):
+    heartbeat = asyncio.create_task(_heartbeat(campaign_id, asyncio.current_task(), owner))
+    try:
+        await _run(campaign_id, owner)
+    except asyncio.CancelledError:
+        # Paused or shutting down; the checkpoint and claimed rows make the next run pick up cleanly
+        raise
+    except Exception:
+        _stats["failed"] += 1
+        logger.exception("Campaign %s failed", campaign_id)
+        await _set_state(campaign_id, owner, state="failed", finished_at=datetime.utcnow(),
+                         lease_expires_at=None, lease_owner=None)
+    finally:
+        heartbeat.cancel()
+        _state["tasks"].pop(campaign_id, None)
+
+
+def _new_owner() -> str:
+    # One token per run, so a runner that lost its lease cannot renew someone else's
+    return uuid.uuid4().hex
+
+
+def _launch(campaign_id: int, owner: str):
+    task = asyncio.create_task(_supervise(campaign_id, owner))
+    _state["tasks"][campaign_id] = task
+    _state["owners"][campaign_id] = owner
+    task.add_done_callback(lambda _: _state["owners"].pop(campaign_id, None))
+
+
+async def start_campaign(campaign_id: int) -> bool:
+    """Start or resume a campaign; False if it is already running (in any worker) or finished."""
+    if campaign_id in _state["tasks"]:
+        return False
+    owner = _new_owner()
+    if not await _take_lease(campaign_id, ["draft", "paused", "failed"], owner):
+        return False
+    _launch(campaign_id, owner)
+    return True
+
+
+async def pause_campaign(campaign_id: int) -> bool:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(Campaign)
+            .where(Campaign.id == campaign_id, Campaign.state == "running")
+            .values(state="paused", lease_expires_at=None, lease_owner=None)
+        )
+        await session.commit()
+    # A runner in another worker notices at its next heartbeat
+    task = _state["tasks"].get(campaign_id)
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    return bool(result.rowcount)
+
+
+def campaign_progress(campaign_id: int):
+    """Live counters for a campaign running in this process (None otherwise)."""
+    progress = _state["progress"].get(campaign_id)
+    if progress is None:
+        return None
+    elapsed = time.monotonic() - progress["started"]
+    return {
+        "running": campaign_id in _state["tasks"],
+        "sent": progress["sent"],
+        "failed": progress["failed"],
+        "skipped": progress["skipped"],
+        "elapsed_seconds": round(elapsed, 1),
+        "messages_per_second": round((progress["sent"] + progress["failed"]) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+async def _resume_orphans():
+    """Pick up campaigns left 'running' whose runner is gone (restart, crashed worker)."""
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as session:
+        orphaned = (await session.scalars(
+            select(Campaign.id).where(
+                Campaign.state == "running",
+                or_(Campaign.lease_expires_at.is_(None), Campaign.lease_expires_at < now),
+            )
+        )).all()
+    for campaign_id in orphaned:
+        # Several workers may see the same orphan; only one wins the lease
+        owner = _new_owner()
+        if campaign_id not in _state["tasks"] and await _take_lease(campaign_id, [], owner):
+            logger.info("Resuming campaign %s", campaign_id)
+            _launch(campaign_id, owner)
+
+
+async def _resume_loop():
+    while True:
+        try:
+            await _resume_orphans()
+        except Exception:
+            logger.exception("Could not resume campaigns")
+        await asyncio.sleep(CAMPAIGN_LEASE_SECONDS)
+
+
+async def start_campaigns():
+    if CAMPAIGN_RESUME_ON_STARTUP and _state["resumer"] is None:
+        _state["resumer"] = asyncio.create_task(_resume_loop())
+
+
+async def stop_campaigns():
+    if _state["resumer"] is not None:
+        _state["resumer"].cancel()
+        await asyncio.gather(_state["resumer"], return_exceptions=True)
+        _state["resumer"] = None
+    owners = dict(_state["owners"])
+    tasks = list(_state["tasks"].values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # Still "running", but with no lease: the next worker to start resumes them right away
+    for campaign_id, owner in owners.items():
+        try:
+            await _set_state(campaign_id, owner, lease_expires_at=None, lease_owner=None)
+        except Exception:
+            logger.exception("Could not release campaign %s", campaign_id)
+
+
+def get_campaign_metrics() -> dict:
+    return {**_stats, "running": len(_state["tasks"]), "batch_size": CAMPAIGN_BATCH_SIZE,
+            "concurrency": CAMPAIGN_CONCURRENCY}
@@ -0,0 +1,133 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy import func
+from sqlalchemy.future import select
+from app.db.database import AsyncSessionLocal
+from app.models.application import ApplicationStatus
+from app.models.campaign import Campaign, CampaignRecipient
+from app.services.campaign_service import CHANNELS, campaign_progress, pause_campaign, start_campaign
+
+router = APIRouter()
+
+class CampaignCreate(BaseModel):
+    name: str
+    channel: str
+    message: str
+    country: Optional[str] = None
+    application_status: Optional[str] = None
+    start: bool = False
+
+def _campaign_dict(campaign: Campaign) -> dict:
+    return {
+        "id": campaign.id,
+        "name": campaign.name,
+        "channel": campaign.channel,
+        "country": campaign.country,
+        "application_status": campaign.application_status,
+        "state": campaign.state,
+        "sent": campaign.sent_count,
+        "failed": campaign.failed_count,
+        "last_student_id": campaign.last_student_id,
+        "created_at": campaign.created_at.isoformat() if campaign.created_at else None,
+        "started_at": campaign.started_at.isoformat() if campaign.started_at else None,
+        "finished_at": campaign.finished_at.isoformat() if campaign.finished_at else None,
+    }
+
+@router.post("/")
+async def create_campaign(payload: CampaignCreate):
+    if payload.channel not in CHANNELS:
+        raise HTTPException(status_code=400, detail=f"Invalid channel. Must be one of {list(CHANNELS)}")
+    valid_statuses = [s.value for s in ApplicationStatus]
+    if payload.application_status and payload.application_status not in valid_statuses:
+        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of {valid_statuses}")
+
+    campaign = Campaign(
+        name=payload.name,
+        channel=payload.channel,
+        message=payload.message,
+        country=payload.country,
+        application_status=payload.application_status,
+        state="draft",
+        last_student_id=0,
+        sent_count=0,
+        failed_count=0,
+    )
+    async with AsyncSessionLocal() as session:
+        session.add(campaign)
+        await session.commit()
+        await session.refresh(campaign)
+    if payload.start:
+        await start_campaign(campaign.id)
+        campaign.state = "running"
+    return _campaign_dict(campaign)
+
+@router.get("/")
+async def list_campaigns(limit: int = Query(50, ge=1, le=200)):
+    async with AsyncSessionLocal() as session:
+        result = await session.scalars(select(Campaign).order_by(Campaign.id.desc()).limit(limit))
+        return [_campaign_dict(campaign) for campaign in result.all()]
+
+@router.get("/{campaign_id}")
+async def get_campaign(campaign_id: int):
+    async with AsyncSessionLocal() as session:
+        campaign = await session.get(Campaign, campaign_id)
+        if not campaign:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+        outcomes = await session.execute(
+            select(CampaignRecipient.status, func.count(CampaignRecipient.id))
+            .where(CampaignRecipient.campaign_id == campaign_id)
+            .group_by(CampaignRecipient.status)
+        )
+        return {
+            **_campaign_dict(campaign),
+            "outcomes": {status: count for status, count in outcomes},
+            # Throughput of the run in this process, if there is one
+            "progress": campaign_progress(campaign_id),
+        }
+
+@router.get("/{campaign_id}/recipients")
+async def get_campaign_recipients(
+    campaign_id: int,
+    status: Optional[str] = None,
+    after_id: int = 0,
+    limit: int = Query(100, ge=1, le=500),
+):
+    # Keyset pagination over per-recipient outcomes
+    query = (
+        select(CampaignRecipient)
+        .where(CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.id > after_id)
+        .order_by(CampaignRecipient.id)
+        .limit(limit)
+    )
+    if status:
+        query = query.where(CampaignRecipient.status == status)
+    async with AsyncSessionLocal() as session:
+        recipients = (await session.scalars(query)).all()
+    return {
+        "items": [
+            {
+                "id": r.id,
+                "student_id": r.student_id,
+                "status": r.status,
+                "error": r.error,
+                "attempts": r.attempts,
+                "sent_at": r.sent_at.isoformat() if r.sent_at else None,
+            }
+            for r in recipients
+        ],
+        "next_after_id": recipients[-1].id if len(recipients) == limit else None,
+    }
+
+@router.post("/{campaign_id}/start")
+async def start(campaign_id: int):
+    # Also resumes a paused or failed campaign from its checkpoint
+    if not await start_campaign(campaign_id):
+        raise HTTPException(status_code=409, detail="Campaign is already running, completed, or does not exist")
+    return {"message": "Campaign started", "id": campaign_id}
+
+@router.post("/{campaign_id}/pause")
+async def pause(campaign_id: int):
+    if not await pause_campaign(campaign_id):
+        raise HTTPException(status_code=409, detail="Campaign is not running")
+    return {"message": "Campaign paused", "id": campaign_id}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.db.base import Base
@@ -13,3 +13,8 @@ class ChatLog(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     student = relationship("Student", back_populates="chat_logs")
+
+    __table_args__ = (
+        Index("ix_chat_logs_student_id_created_at", "student_id", "created_at"), # lead history
+        Index("ix_chat_logs_created_at", "created_at"), # analytics stream
+    )
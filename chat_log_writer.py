@@ -0,0 +1,178 @@
+import os
+import json
+import logging
+import asyncio
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from dotenv import load_dotenv
+from app.db.database import AsyncSessionLocal
+from app.models.chat_log import ChatLog
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CHATLOG_BATCH_SIZE = int(os.getenv("CHATLOG_BATCH_SIZE", "200"))
+CHATLOG_FLUSH_INTERVAL = float(os.getenv("CHATLOG_FLUSH_INTERVAL", "1.0"))
+CHATLOG_MAX_BUFFER = int(os.getenv("CHATLOG_MAX_BUFFER", "5000"))
+# Rows that cannot be written are appended here as JSON lines (and logged); empty: log only
+CHATLOG_DEAD_LETTER_PATH = os.getenv("CHATLOG_DEAD_LETTER_PATH", "")
+
+_buffer = []  # rows waiting for the next flush
+_in_flight = []  # rows being written right now (still visible to readers)
+_state = {"task": None, "wake": None, "drained": None, "lock": None, "failures": 0}
+_stats = {"buffered": 0, "flushed": 0, "flushes": 0, "failed_flushes": 0, "backpressure_waits": 0,
+          "dead_lettered": 0}
+
+
+def _ensure_started():
+    if _state["task"] is not None:
+        return
+    _state["wake"] = asyncio.Event()
+    _state["drained"] = asyncio.Event()
+    _state["drained"].set()
+    _state["lock"] = asyncio.Lock()
+    _state["task"] = asyncio.create_task(_flusher())
+
+
+async def add_many(rows: list):
+    """Buffer chat-log rows ({student_id, sender, message[, created_at]})."""
+    _ensure_started()
+    # Backpressure: if the database falls behind, writers wait for a flush
+    while len(_buffer) >= CHATLOG_MAX_BUFFER:
+        _stats["backpressure_waits"] += 1
+        _state["drained"].clear()
+        _state["wake"].set()
+        await _state["drained"].wait()
+
+    now = datetime.utcnow()
+    for row in rows:
+        row.setdefault("created_at", now)
+    # Appended together, so rows from one turn land in the same INSERT
+    _buffer.extend(rows)
+    _stats["buffered"] += len(rows)
+    if len(_buffer) >= CHATLOG_BATCH_SIZE:
+        _state["wake"].set()
+
+
+async def add(student_id: int, sender: str, message: str):
+    await add_many([{"student_id": student_id, "sender": sender, "message": message}])
+
+
+def _is_bad_row(error: Exception) -> bool:
+    # Errors that retrying the same rows will never fix (FK violation, value too long, ...).
+    # Anything else (connection lost, timeout, a schema bug) is retried with backoff, never bisected.
+    return isinstance(error, (IntegrityError, DataError))
+
+
+def _dead_letter_write(lines: list):
+    with open(CHATLOG_DEAD_LETTER_PATH, "a", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+async def _dead_letter(row: dict, error: Exception):
+    _stats["dead_lettered"] += 1
+    line = json.dumps({**row, "error": str(error)}, default=str)
+    logger.error("Chat log row dropped: %s", line)
+    if CHATLOG_DEAD_LETTER_PATH:
+        try:
+            await asyncio.to_thread(_dead_letter_write, [line + "\n"])
+        except OSError as e:
+            logger.warning("Chat log dead-letter write failed: %s", e)
+
+
+async def _insert(rows: list):
+    async with AsyncSessionLocal() as session:
+        # One executemany INSERT and one commit for the whole batch
+        await session.execute(insert(ChatLog), rows)
+        await session.commit()
+
+
+async def _write(rows: list) -> list:
+    """Insert rows, splitting around bad ones; returns the rows to retry later."""
+    try:
+        await _insert(rows)
+        _stats["flushed"] += len(rows)
+        return []
+    except Exception as e:
+        if not _is_bad_row(e):
+            # Database unavailable: retry the whole batch on a later flush
+            logger.warning("Chat log flush failed (%d rows), will retry: %s", len(rows), e)
+            return rows
+        if len(rows) == 1:
+            await _dead_letter(rows[0], e)
+            return []
+    # Bisect, so one poison row costs O(log n) extra INSERTs and the rest still lands
+    middle = len(rows) // 2
+    return await _write(rows[:middle]) + await _write(rows[middle:])
+
+
+async def flush():
+    global _buffer
+    if _state["lock"] is None:
+        return
+    async with _state["lock"]:
+        if not _buffer:
+            return
+        rows, _buffer = _buffer, []
+        _in_flight.extend(rows)
+        try:
+            retry = await _write(rows)
+            _stats["flushes"] += 1
+            if retry:
+                _stats["failed_flushes"] += 1
+                _state["failures"] += 1
+                _buffer = retry + _buffer
+            else:
+                _state["failures"] = 0
+        finally:
+            _in_flight.clear()
+            if len(_buffer) < CHATLOG_MAX_BUFFER:
+                _state["drained"].set()
+
+
+async def _flusher():
+    while True:
+        # Back off while the database is failing
+        interval = min(CHATLOG_FLUSH_INTERVAL * 2 ** _state["failures"], 30.0)
+        try:
+            await asyncio.wait_for(_state["wake"].wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        _state["wake"].clear()
+        try:
+            await flush()
+        except Exception:
+            logger.exception("Chat log flusher error")
+
+
+async def start_chat_log_writer():
+    _ensure_started()
+
+
+async def stop_chat_log_writer():
+    task = _state["task"]
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        _state["task"] = None
+    # Final drain so nothing buffered is lost on shutdown
+    await flush()
+
+
+def pending_entries(student_id: int = None) -> list:
+    """Rows accepted but not yet committed, oldest first."""
+    rows = _in_flight + _buffer
+    if student_id is not None:
+        rows = [row for row in rows if row["student_id"] == student_id]
+    return list(rows)
+
+
+def entry_key(student_id, sender, message, created_at):
+    # Lets readers drop a pending row that has been committed in the meantime
+    return (student_id, sender, message, created_at)
+
+
+def get_chat_log_metrics() -> dict:
+    return {**_stats, "pending": len(_buffer) + len(_in_flight)}
@@ -0,0 +1,72 @@
+"""Verify that each hot query is planned with its index.
+
+Usage: python check_query_plans.py   (uses DATABASE_URL; exits 1 on failure)
+"""
+import sys
+import asyncio
+from sqlalchemy import func, text
+from sqlalchemy.future import select
+from app.db.database import engine
+from app.models.application import VisaApplication
+from app.models.chat_log import ChatLog
+from app.services.crm import _profile_query
+
+HOT_QUERIES = [
+    (
+        "lead history",
+        select(ChatLog).where(ChatLog.student_id == 1).order_by(ChatLog.created_at.asc()),
+        "ix_chat_logs_student_id_created_at",
+    ),
+    (
+        "analytics stream",
+        select(ChatLog).order_by(ChatLog.created_at.desc()).limit(50),
+        "ix_chat_logs_created_at",
+    ),
+    (
+        "crm profile",
+        _profile_query("923000000000"),
+        "ix_visa_applications_student_id_created_at",
+    ),
+    (
+        "stats by status",
+        select(func.count(VisaApplication.id)).where(VisaApplication.status == "approved"),
+        "ix_visa_applications_status",
+    ),
+    (
+        "leads list",
+        select(VisaApplication.id)
+        .order_by(func.coalesce(VisaApplication.updated_at, VisaApplication.created_at).desc(), VisaApplication.id.desc())
+        .limit(51),
+        "ix_visa_applications_activity_at_id",
+    ),
+]
+
+
+async def explain(conn, statement) -> str:
+    sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "postgresql":
+        result = await conn.execute(text(f"EXPLAIN (FORMAT TEXT) {sql}"))
+    else:
+        result = await conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))
+    return "\n".join(" ".join(str(col) for col in row) for row in result)
+
+
+async def main() -> int:
+    failures = 0
+    async with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            # Small dev tables are cheaper to seq-scan; we only want to know the index is usable
+            await conn.execute(text("SET enable_seqscan = off"))
+        for name, statement, index in HOT_QUERIES:
+            plan = await explain(conn, statement)
+            ok = index in plan
+            failures += 0 if ok else 1
+            print(f"[{'OK' if ok else 'MISSING'}] {name}: expects {index}")
+            if not ok:
+                print("    " + plan.replace("\n", "\n    "))
+    await engine.dispose()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
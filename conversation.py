@@ -0,0 +1,209 @@
+import logging
+import asyncio
+from datetime import datetime, time
+from app.services.outbound import enqueue_message
+from app.services.ai_service import get_visa_counselor_response, stream_visa_counselor_response, summarize_conversation
+from app.services.progressive import AI_STREAMING, deliver_progressively
+from app.services.prompt_builder import load_recent_turns, turns_to_summarize, summary_update, SUMMARY_KEY
+from app.services.chat_log_writer import entry_key
+from app.services.crm import create_new_lead, update_student_profile, crm_turn, log_interaction
+from app.services.intents import route, DOCUMENT_TEMPLATES
+from app.services.scheduling import OFFICES, DEFAULT_OFFICE, PKT, available_slots, book_slot, format_slot, parse_request
+
+logger = logging.getLogger(__name__)
+
+# Fire-and-forget work started by a turn (kept referenced until done)
+_background = set()
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+class Turn:
+    """One inbound message on a channel, plus helpers to reply to it."""
+
+    def __init__(self, channel: str, chat_id: str, text: str, crm, logged: dict = None):
+        self.channel = channel
+        self.chat_id = chat_id
+        self.text = text
+        self.crm = crm
+        self.logged = logged  # this message's chat-log row
+        self.profile = crm.profile
+        self.student_id = crm.student_id
+
+    async def reply(self, text: str, log: bool = False):
+        await enqueue_message(self.channel, self.chat_id, text)
+        if log:
+            self.crm.log("bot", text)
+
+
+# --- Intent handlers ---
+
+async def _menu(turn: Turn, arg):
+    welcome_msg = (
+        f"Welcome to *Dashboard Visa Business*! 🎓✈️\n"
+        f"Hi {turn.profile['name'] or 'Future Scholar'}, we are here to help you study abroad.\n\n"
+        "Select your dream destination:\n"
+        "1. Canada 🇨🇦\n"
+        "2. UK 🇬🇧\n"
+        "3. USA 🇺🇸\n"
+        "4. Australia 🇦🇺\n\n"
+        "Type *Status* to check your application.\n"
+        "Type *Apply* to start your process."
+    )
+    await turn.reply(welcome_msg, log=True)
+    return "replied_menu"
+
+async def _status(turn: Turn, arg):
+    status_msg = (
+        f"📂 *Application Status*\n"
+        f"Name: {turn.profile['name'] or 'Not Provided'}\n"
+        f"Country: {turn.profile['country'] or 'Not Selected'}\n"
+        f"Current Status: *{turn.profile['status']}*\n\n"
+        "Need to update documents? Just send them here."
+    )
+    await turn.reply(status_msg)
+    return "replied_status"
+
+async def _apply(turn: Turn, arg):
+    if not turn.profile['country']:
+        await turn.reply("Please select a country first (e.g., type 'Canada').")
+        return "replied_error"
+
+    await turn.reply("Great! To start your application, please reply with your *Full Name* like this:\n\nName: John Doe")
+    return "replied_apply_start"
+
+async def _name(turn: Turn, arg):
+    name_received = arg.title()
+    await update_student_profile(turn.chat_id, {"name": name_received})
+    await turn.reply(f"Thanks {name_received}! Your profile is updated. An agent will review your file shortly.")
+    return "replied_name_saved"
+
+async def _country(turn: Turn, selected_country):
+    # Save Lead in CRM
+    await create_new_lead(turn.chat_id, selected_country, student_id=turn.student_id)
+
+    # Send Documents List (Pakistan Context)
+    response_msg = (
+        f"Great choice! Here are the documents required for {selected_country}:\n\n"
+        f"{DOCUMENT_TEMPLATES[selected_country]}\n\n"
+        "Type *Apply* to proceed."
+    )
+    await turn.reply(response_msg)
+    return "replied_docs"
+
+def _next_slots_text(office: str = None, after=None) -> str:
+    offices = [office] if office else list(OFFICES)
+    lines = []
+    for name in offices:
+        slots = available_slots(name, after=after)
+        if slots:
+            lines.append(f"{name}: " + " | ".join(format_slot(slot) for slot in slots))
+    return "\n".join(lines)
+
+async def _book(turn: Turn, arg):
+    book_msg = (
+        "📅 *Book an Appointment*\n"
+        "We have slots available for consultation in Lahore/Islamabad or Online.\n\n"
+        f"{_next_slots_text()}\n\n"
+        "Reply with your preferred date:\n"
+        "e.g., *Date: Tomorrow 3 PM Lahore*"
+    )
+    await turn.reply(book_msg)
+    return "replied_book"
+
+async def _date(turn: Turn, arg):
+    local, day, office = parse_request(arg)
+    office = office or DEFAULT_OFFICE
+    if local is None and day is not None:
+        # A day but no time: offer that day's free slots (or the next ones after it)
+        slots = _next_slots_text(office, after=datetime.combine(day, time(0), tzinfo=PKT))
+        await turn.reply(
+            f"📅 What time on {day:%a %d %b} suits you? "
+            + (f"Free slots in {office}:\n{slots}\n\n" if slots else "We have no free slots around then.\n\n")
+            + "Reply like *Date: Tomorrow 3 PM Lahore*."
+        )
+        return "replied_book_day_only"
+    if local is None:
+        await turn.reply(
+            "📅 Sorry, I couldn't read that date. Please reply like *Date: Tomorrow 3 PM Lahore*.\n\n"
+            f"{_next_slots_text(office)}"
+        )
+        return "replied_book_unparsed"
+
+    appointment = await book_slot(turn.student_id, office, local, notes=arg)
+    if appointment is None:
+        alternatives = _next_slots_text(office, after=local)
+        await turn.reply(
+            f"📅 {format_slot(local)} is not available in {office}.\n\n"
+            + (f"Next free slots:\n{alternatives}" if alternatives else "Please try another day.")
+        )
+        return "replied_book_unavailable"
+
+    await turn.reply(f"✅ Appointment Confirmed: {format_slot(local)} (PKT) — {office}.\nOur counselor will contact you before the session.", log=True)
+    return "replied_book_confirm"
+
+async def _refresh_summary(chat_id: str, profile: dict, turns: list):
+    previous = ((profile.get("profile_data") or {}).get(SUMMARY_KEY) or {}).get("text")
+    text = await summarize_conversation(previous, turns)
+    if text:
+        await update_student_profile(chat_id, {"profile_data": summary_update(text, turns)})
+
+async def _stream_ai(channel: str, chat_id: str, student_id: int, text: str, profile: dict, current: tuple = None):
+    try:
+        # Runs after the turn has handed this message to the chat-log writer; it is the question, not history
+        history = await load_recent_turns(student_id, profile, exclude=current)
+        chunks = stream_visa_counselor_response(text, history=history, context=profile)
+        ai_response = await deliver_progressively(channel, chat_id, chunks)
+        # Logged once, with the final text
+        if student_id and ai_response:
+            await log_interaction(student_id, "bot", ai_response)
+
+        older = turns_to_summarize(profile, history)
+        if older:
+            await _refresh_summary(chat_id, profile, older)
+    except Exception:
+        logger.exception("Streaming AI reply failed")
+
+async def _ai(turn: Turn, arg):
+    if AI_STREAMING:
+        # The webhook returns now; the reply streams in the background
+        current = entry_key(turn.student_id, "user", turn.logged["message"], turn.logged["created_at"])
+        _spawn(_stream_ai(turn.channel, turn.chat_id, turn.student_id, turn.text, turn.profile, current))
+        return "replied_streaming"
+
+    # AI: Get Response (Context Aware)
+    history = await load_recent_turns(turn.student_id, turn.profile)
+    ai_response = await get_visa_counselor_response(turn.text, history=history, context=turn.profile)
+    await turn.reply(ai_response, log=True)
+
+    # Fold turns that left the prompt window into the rolling summary, off the reply path
+    older = turns_to_summarize(turn.profile, history)
+    if older:
+        _spawn(_refresh_summary(turn.chat_id, turn.profile, older))
+    return "received"
+
+
+HANDLERS = {
+    "menu": _menu,
+    "status": _status,
+    "apply": _apply,
+    "name": _name,
+    "country": _country,
+    "book": _book,
+    "date": _date,
+    "ai": _ai,
+}
+
+
+async def handle_text(channel: str, chat_id: str, text: str) -> str:
+    """Run one text message through the bot flow; returns a status label."""
+    msg_body = text.strip().lower()
+    intent, arg = route(msg_body)
+
+    # One CRM round-trip to load; chat logs are written together on exit
+    async with crm_turn(chat_id, channel) as crm:
+        logged = crm.log("user", msg_body)
+        return await HANDLERS[intent](Turn(channel, chat_id, text, crm, logged), arg)
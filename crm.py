@@ -1,7 +1,21 @@
+import os
+import copy
+from datetime import datetime
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.future import select
 from app.db.database import AsyncSessionLocal
 from app.models.student import Student
 from app.models.application import VisaApplication, ApplicationStatus
+from app.services.cache import TTLCache, publish_invalidation
+from app.services import chat_log_writer, stats, broadcast
+
+# Profiles change a handful of times per application; cache them per whatsapp_id
+profile_cache = TTLCache(
+    "student_profiles",
+    maxsize=int(os.getenv("PROFILE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PROFILE_CACHE_TTL", "300")),
+)
 
 async def get_or_create_student(whatsapp_id: str, name: str = None):
     async with AsyncSessionLocal() as session:
@@ -13,40 +27,136 @@ async def get_or_create_student(whatsapp_id: str, name: str = None):
             session.add(student)
             await session.commit()
             await session.refresh(student)
+            stats.record_student_created()
         
         return student
 
-async def create_new_lead(whatsapp_id: str, country_interest: str):
-    student = await get_or_create_student(whatsapp_id)
-    
+def _upsert_application(dialect: str, student_id: int, country: str, now: datetime):
+    values = {"student_id": student_id, "country": country, "status": ApplicationStatus.NEW_LEAD.value,
+              "created_at": now, "updated_at": now}
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        return insert(VisaApplication).values(**values).returning(VisaApplication.created_at, VisaApplication.status)
+    # Picking a country again touches that application so it becomes the latest; status is kept
+    return (
+        upsert(VisaApplication).values(**values)
+        .on_conflict_do_update(index_elements=["student_id", "country"], set_={"updated_at": now})
+        .returning(VisaApplication.created_at, VisaApplication.status)
+    )
+
+async def create_new_lead(whatsapp_id: str, country_interest: str, student_id: int = None) -> bool:
+    """Open an application for this country, or make the existing one the latest.
+
+    Returns True if a new application was created.
+    """
+    # Callers that already loaded the profile pass student_id and skip a lookup
+    if student_id is None:
+        student = await get_or_create_student(whatsapp_id)
+        student_id = student.id
+
+    now = datetime.utcnow()
+    status = None
     async with AsyncSessionLocal() as session:
-        # Check if already has application for this country
-        # For simplicity, just create new one
-        new_app = VisaApplication(
-            student_id=student.id,
-            country=country_interest,
-            status=ApplicationStatus.NEW_LEAD
-        )
-        session.add(new_app)
+        # Upsert on (student_id, country): picking the same country again keeps the existing application and its status
+        try:
+            row = (await session.execute(
+                _upsert_application(session.bind.dialect.name, student_id, country_interest, now)
+            )).first()
+            await session.commit()
+            # created_at is only ours if the row was inserted rather than updated
+            created = row.created_at == now
+            status = row.status
+        except IntegrityError:
+            # Dialects without upsert: the application exists, just touch it
+            await session.rollback()
+            await session.execute(
+                update(VisaApplication)
+                .where(VisaApplication.student_id == student_id, VisaApplication.country == country_interest)
+                .values(updated_at=now)
+            )
+            await session.commit()
+            created = False
+
+    if created:
+        stats.record_application_created(country_interest, ApplicationStatus.NEW_LEAD)
+
+    # Write-through: this application is now the latest one
+    if status is None:
+        profile_cache.pop(whatsapp_id)
+    elif profile_cache.peek(whatsapp_id) is not None:
+        status = status.value if hasattr(status, "value") else status
+        profile_cache.set(whatsapp_id, {**profile_cache.peek(whatsapp_id), "country": country_interest, "status": status})
+    await publish_invalidation(profile_cache.name, whatsapp_id)
+    return created
+
+def _latest_application_order():
+    # Most recently touched first: a country picked again becomes current (legacy rows have no updated_at)
+    return func.coalesce(VisaApplication.updated_at, VisaApplication.created_at).desc(), VisaApplication.id.desc()
+
+def _profile_query(whatsapp_id: str):
+    # Student joined to its latest application, so the profile is one round-trip
+    latest_app_id = (
+        select(VisaApplication.id)
+        .where(VisaApplication.student_id == Student.id)
+        .order_by(*_latest_application_order())
+        .limit(1)
+        .correlate(Student)
+        .scalar_subquery()
+    )
+    return (
+        select(Student.id, Student.name, Student.profile_data, Student.channel,
+               VisaApplication.country, VisaApplication.status)
+        .outerjoin(VisaApplication, VisaApplication.id == latest_app_id)
+        .where(Student.whatsapp_id == whatsapp_id)
+    )
+
+def _insert_student_if_missing(dialect: str, whatsapp_id: str, channel: str = None):
+    values = {"whatsapp_id": whatsapp_id, "channel": channel, "profile_data": {}}
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        return insert(Student).values(**values)
+    # Concurrent first messages from the same chat must not fail on the unique key
+    return upsert(Student).values(**values).on_conflict_do_nothing(index_elements=["whatsapp_id"])
+
+async def load_student_profile(session, whatsapp_id: str, channel: str = None) -> dict:
+    row = (await session.execute(_profile_query(whatsapp_id))).first()
+    if row is None:
+        result = await session.execute(_insert_student_if_missing(session.bind.dialect.name, whatsapp_id, channel))
+        await session.commit()
+        if result.rowcount:
+            stats.record_student_created()
+        row = (await session.execute(_profile_query(whatsapp_id))).first()
+    elif channel and row.channel is None:
+        # Students created before the channel was recorded learn it from their next message
+        await session.execute(update(Student).where(Student.id == row.id).values(channel=channel))
         await session.commit()
-        return new_app
 
-async def get_student_profile(whatsapp_id: str):
-    student = await get_or_create_student(whatsapp_id)
-    async with AsyncSessionLocal() as session:
-        # Get latest application status
-        result = await session.execute(
-            select(VisaApplication).where(VisaApplication.student_id == student.id).order_by(VisaApplication.created_at.desc())
-        )
-        application = result.scalars().first()
-        
-        return {
-            "id": student.id,
-            "name": student.name,
-            "country": application.country if application else None,
-            "status": application.status if application else "No Application",
-            "profile_data": student.profile_data
-        }
+    return {
+        "id": row.id,
+        "name": row.name,
+        "country": row.country,
+        "status": row.status if row.status else "No Application",
+        "profile_data": row.profile_data
+    }
+
+async def get_student_profile(whatsapp_id: str, channel: str = None):
+    profile = profile_cache.get(whatsapp_id)
+    if profile is None:
+        async with AsyncSessionLocal() as session:
+            profile = await load_student_profile(session, whatsapp_id, channel)
+        profile_cache.set(whatsapp_id, profile)
+    # Deep copy: callers mutate nested values such as profile_data, which must not reach the cached entry
+    return copy.deepcopy(profile)
+
+async def invalidate_student_profile(whatsapp_id: str):
+    profile_cache.pop(whatsapp_id)
+    await publish_invalidation(profile_cache.name, whatsapp_id)
 
 async def update_student_profile(whatsapp_id: str, data: dict):
     async with AsyncSessionLocal() as session:
@@ -60,18 +170,74 @@ async def update_student_profile(whatsapp_id: str, data: dict):
                 student.email = data["email"]
             
             # Merge profile_data
-            current_data = student.profile_data or {}
+            # Copy so SQLAlchemy sees a new value for the JSON column
+            current_data = dict(student.profile_data or {})
             current_data.update(data.get("profile_data", {}))
             student.profile_data = current_data
             
             await session.commit()
+
+            cached = profile_cache.peek(whatsapp_id)
+            if cached is not None:
+                profile_cache.set(whatsapp_id, {**cached, "name": student.name, "profile_data": dict(current_data)})
+            await publish_invalidation(profile_cache.name, whatsapp_id)
             return True
         return False
 
-from app.models.chat_log import ChatLog
+async def latest_application_id(student_id: int):
+    # Same "latest" as the profile query, so documents attach to the application the student sees
+    async with AsyncSessionLocal() as session:
+        return await session.scalar(
+            select(VisaApplication.id)
+            .where(VisaApplication.student_id == student_id)
+            .order_by(*_latest_application_order())
+            .limit(1)
+        )
 
 async def log_interaction(student_id: int, sender: str, message: str):
-    async with AsyncSessionLocal() as session:
-        log = ChatLog(student_id=student_id, sender=sender, message=message)
-        session.add(log)
-        await session.commit()
+    # Buffered and written in bulk by the chat-log writer
+    created_at = datetime.utcnow()
+    await chat_log_writer.add_many([
+        {"student_id": student_id, "sender": sender, "message": message, "created_at": created_at}
+    ])
+    broadcast.publish_chat(student_id, sender, message, created_at)
+
+class CrmTurn:
+    """Unit of work for one inbound message.
+
+    Loads the student profile on entry and hands every chat-log row
+    recorded during the turn to the chat-log writer together on exit,
+    so they are committed in the same batch.
+    """
+
+    def __init__(self, whatsapp_id: str, channel: str = None):
+        self.whatsapp_id = whatsapp_id
+        self.channel = channel
+        self.profile = None
+        self._logs = []
+
+    @property
+    def student_id(self):
+        return self.profile.get("id") if self.profile else None
+
+    def log(self, sender: str, message: str) -> dict:
+        # Timestamped now so the user message always sorts before the reply
+        entry = {"sender": sender, "message": message, "created_at": datetime.utcnow()}
+        self._logs.append(entry)
+        return entry
+
+    async def __aenter__(self):
+        self.profile = await get_student_profile(self.whatsapp_id, self.channel)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if not self._logs or not self.student_id:
+            return
+        rows = [{"student_id": self.student_id, **log} for log in self._logs]
+        self._logs = []
+        await chat_log_writer.add_many(rows)
+        for row in rows:
+            broadcast.publish_chat(self.student_id, row["sender"], row["message"], row["created_at"])
+
+def crm_turn(whatsapp_id: str, channel: str = None) -> CrmTurn:
+    return CrmTurn(whatsapp_id, channel)
@@ -1,18 +1,124 @@
 import os
+import time
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from dotenv import load_dotenv
+from app.services.instrumentation import observe
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Optional streaming replica for read-only routes that tolerate lag (lead list)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or None
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+# SQL echo is for local debugging only; it slows every query down
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+
+# Per process: size x uvicorn workers (+ overflow) must stay under Postgres max_connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Recycle before load balancers / PgBouncer drop idle connections
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Server-side cap per statement; 0 disables
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+# asyncpg: SQLAlchemy's and asyncpg's prepared statement caches. Set 0 behind PgBouncer in transaction mode.
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", "100"))
+
+_pool_stats = {}  # role -> checkout counters
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection."""
+
+    role = "primary"
+
+    def _do_get(self):
+        stats = _pool_stats.setdefault(self.role, {"checkouts": 0, "timeouts": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0})
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            stats["timeouts"] += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            stats["checkouts"] += 1
+            stats["wait_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+            observe("db_pool_checkout_wait_seconds", waited, role=self.role)
+
+
+def create_db_engine(url: str, role: str = "primary"):
+    url = make_url(url)
+    options = {"echo": DB_ECHO}
+    connect_args = {}
+
+    if url.get_backend_name() != "sqlite":
+        # SQLite keeps SQLAlchemy's default pool (StaticPool for :memory:); sizing doesn't apply
+        options.update(
+            poolclass=type(f"TimedQueuePool_{role}", (TimedQueuePool,), {"role": role}),
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+
+    if url.get_driver_name() == "asyncpg":
+        url = url.update_query_dict({"prepared_statement_cache_size": str(DB_PREPARED_STATEMENT_CACHE_SIZE)})
+        connect_args["statement_cache_size"] = DB_PREPARED_STATEMENT_CACHE_SIZE
+        if DB_STATEMENT_TIMEOUT_MS:
+            connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    elif url.get_backend_name() == "postgresql" and DB_STATEMENT_TIMEOUT_MS:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
+    return create_async_engine(url, connect_args=connect_args, **options)
+
+
+engine = create_db_engine(DATABASE_URL)
+# Without a replica, reads share the primary engine and pool
+read_engine = create_db_engine(DATABASE_READ_URL, role="replica") if DATABASE_READ_URL else engine
 
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
+AsyncReadSessionLocal = sessionmaker(
+    read_engine, class_=AsyncSession, expire_on_commit=False
+)
 
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
+
+async def get_read_db():
+    # Replica reads may lag the primary by a moment; don't use for read-after-write
+    async with AsyncReadSessionLocal() as session:
+        yield session
+
+async def dispose_engines():
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+
+def get_pool_metrics() -> dict:
+    metrics = {}
+    for role, pooled in (("primary", engine), ("replica", read_engine)):
+        if role == "replica" and pooled is engine:
+            continue
+        pool = pooled.sync_engine.pool
+        stats = _pool_stats.get(role, {"checkouts": 0, "timeouts": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0})
+        metrics[role] = {
+            "size": pool.size() if hasattr(pool, "size") else None,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            **stats,
+            "wait_seconds": round(stats["wait_seconds"], 4),
+            "max_wait_seconds": round(stats["max_wait_seconds"], 4),
+            "avg_wait_ms": round(stats["wait_seconds"] / stats["checkouts"] * 1000, 3) if stats["checkouts"] else 0.0,
+        }
+    return metrics
@@ -0,0 +1,84 @@
+"""CPU-bound document checks, run inside the document process pool.
+
+Kept free of app imports for the same reason as stt_worker: pool processes
+import it on start and must stay lightweight.
+"""
+import os
+import re
+
+# (magic prefix, offset, mime type)
+SIGNATURES = [
+    (b"%PDF-", 0, "application/pdf"),
+    (b"\xff\xd8\xff", 0, "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", 0, "image/png"),
+    (b"WEBP", 8, "image/webp"),
+    (b"ftypheic", 4, "image/heic"),
+    (b"ftypmif1", 4, "image/heic"),
+    (b"PK\x03\x04", 0, "application/zip"),
+]
+ALLOWED_TYPES = {"application/pdf", "image/jpeg", "image/png", "image/webp", "image/heic",
+                 "application/vnd.openxmlformats-officedocument.wordprocessingml.document"}
+THUMBNAIL_SIZE = (256, 256)
+
+_PDF_PAGE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+
+
+def sniff(path: str) -> str:
+    with open(path, "rb") as f:
+        head = f.read(64)
+    for magic, offset, mime_type in SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            if mime_type == "application/zip" and _is_docx(path):
+                return "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+            return mime_type
+    return "application/octet-stream"
+
+
+def _is_docx(path: str) -> bool:
+    import zipfile
+    try:
+        with zipfile.ZipFile(path) as archive:
+            return "word/document.xml" in archive.namelist()
+    except zipfile.BadZipFile:
+        return False
+
+
+def pdf_page_count(path: str):
+    try:
+        from pypdf import PdfReader
+        return len(PdfReader(path).pages)
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    # Rough fallback: count page objects (misses pages inside compressed object streams)
+    with open(path, "rb") as f:
+        count = len(_PDF_PAGE.findall(f.read()))
+    return count or None
+
+
+def make_thumbnail(path: str, thumbnail_path: str):
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(path) as image:
+            image.thumbnail(THUMBNAIL_SIZE)
+            os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+            image.convert("RGB").save(thumbnail_path, "JPEG", quality=80)
+        return thumbnail_path
+    except Exception:
+        # HEIC without a plugin, truncated uploads, etc.
+        return None
+
+
+def analyze(path: str, thumbnail_path: str) -> dict:
+    mime_type = sniff(path)
+    result = {"mime_type": mime_type, "allowed": mime_type in ALLOWED_TYPES, "page_count": None, "thumbnail_url": None}
+    if mime_type == "application/pdf":
+        result["page_count"] = pdf_page_count(path)
+    elif mime_type.startswith("image/"):
+        result["page_count"] = 1
+        result["thumbnail_url"] = make_thumbnail(path, thumbnail_path)
+    return result
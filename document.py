@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.db.base import Base
@@ -13,4 +13,20 @@ class Document(Base):
     status = Column(String, default="pending") # pending, verified, rejected
     uploaded_at = Column(DateTime, default=datetime.utcnow)
 
+    # Intake metadata: file_url points into content-addressed storage keyed by sha256
+    sha256 = Column(String(64), nullable=True)
+    size_bytes = Column(Integer, nullable=True)
+    original_name = Column(String, nullable=True)
+    source = Column(String, nullable=True) # telegram, whatsapp
+    mime_type = Column(String, nullable=True) # sniffed from content, not trusted from the client
+    page_count = Column(Integer, nullable=True)
+    thumbnail_url = Column(String, nullable=True)
+
     application = relationship("VisaApplication", back_populates="documents")
+
+    __table_args__ = (
+        Index("ix_documents_application_id_uploaded_at", "application_id", "uploaded_at"),
+        Index("ix_documents_sha256", "sha256"), # analysis reuse
+        # The same file sent twice for one application is stored once, even when both arrive together
+        Index("uq_documents_application_id_sha256", "application_id", "sha256", unique=True),
+    )
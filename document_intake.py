@@ -0,0 +1,322 @@
+import os
+import re
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.future import select
+from app.db.database import AsyncSessionLocal
+from app.models.document import Document
+from app.services import doc_worker
+from app.services.http_client import FileTooLargeError
+from app.services.instrumentation import record_span
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_STORAGE_DIR = os.getenv("DOCUMENT_STORAGE_DIR", "storage/documents")
+DOCUMENT_THUMBNAIL_DIR = os.getenv("DOCUMENT_THUMBNAIL_DIR", "storage/thumbnails")
+# Telegram bots cannot download more than 20 MB
+DOCUMENT_MAX_BYTES = int(os.getenv("DOCUMENT_MAX_BYTES", str(20 * 2 ** 20)))
+DOCUMENT_CHUNK_SIZE = int(os.getenv("DOCUMENT_CHUNK_SIZE", str(256 * 1024)))
+DOCUMENT_QUEUE_SIZE = int(os.getenv("DOCUMENT_QUEUE_SIZE", "200"))
+# Concurrent downloads; analysis has its own process pool
+DOCUMENT_DOWNLOADS = int(os.getenv("DOCUMENT_DOWNLOADS", "4"))
+DOCUMENT_WORKERS = int(os.getenv("DOCUMENT_WORKERS", "2"))
+DOCUMENT_ANALYZE_TIMEOUT = float(os.getenv("DOCUMENT_ANALYZE_TIMEOUT", "60"))
+
+# Caption/filename keyword -> Document.document_type
+DOCUMENT_KEYWORDS = {
+    "passport": "passport",
+    "transcript": "transcript",
+    "marksheet": "transcript",
+    "degree": "degree",
+    "ielts": "ielts",
+    "pte": "ielts",
+    "bank": "bank_statement",
+    "statement": "bank_statement",
+    "cnic": "cnic",
+    "cas": "cas_letter",
+    "experience": "experience_letter",
+    "photo": "photo",
+}
+# Whole words only ("chapter" is not a PTE result); letters bound a word so "my_passport.pdf" and
+# "ielts2024" still match, and an optional plural s covers "bank statements"
+_KEYWORD_PATTERNS = [
+    (re.compile(rf"(?<![a-z]){re.escape(keyword)}s?(?![a-z])"), document_type)
+    for keyword, document_type in DOCUMENT_KEYWORDS.items()
+]
+
+NO_APPLICATION_MESSAGE = ("📎 Got your file! Please select a country first (e.g., type 'Canada') "
+                          "so we know which application it belongs to, then send it again.")
+TOO_LARGE_MESSAGE = f"📎 That file is too large. Please send files under {DOCUMENT_MAX_BYTES // 2 ** 20} MB."
+BUSY_MESSAGE = "📎 We're receiving a lot of files right now. Please send it again in a few minutes."
+FAILED_MESSAGE = "📎 Sorry, we couldn't save that file. Please try sending it again."
+DUPLICATE_MESSAGE = "📎 We already have this file on your application. No need to send it again."
+REJECTED_MESSAGE = "📎 We couldn't open that file. Please send a PDF, photo (JPG/PNG) or Word document."
+
+_state = {"pool": None, "queue": None, "workers": []}
+_stats = {"queued": 0, "rejected_busy": 0, "stored": 0, "duplicates": 0, "blobs_reused": 0,
+          "no_application": 0, "failed": 0, "too_large": 0, "analyzed": 0, "analysis_reused": 0,
+          "rejected_type": 0, "bytes_downloaded": 0}
+
+
+async def start_document_intake():
+    if _state["queue"] is not None:
+        return
+    os.makedirs(os.path.join(DOCUMENT_STORAGE_DIR, "tmp"), exist_ok=True)
+    _state["queue"] = asyncio.Queue(maxsize=DOCUMENT_QUEUE_SIZE)
+    # spawn, not fork: the parent has an event loop, DB pool and sockets open
+    _state["pool"] = ProcessPoolExecutor(max_workers=DOCUMENT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    _state["workers"] = [asyncio.create_task(_worker()) for _ in range(DOCUMENT_DOWNLOADS)]
+
+
+async def stop_document_intake():
+    for task in _state["workers"]:
+        task.cancel()
+    await asyncio.gather(*_state["workers"], return_exceptions=True)
+    _state["workers"] = []
+    if _state["pool"] is not None:
+        _state["pool"].shutdown(wait=False, cancel_futures=True)
+        _state["pool"] = None
+    _state["queue"] = None
+
+
+def document_type_for(*hints) -> str:
+    text = " ".join(hint for hint in hints if hint).lower()
+    for pattern, document_type in _KEYWORD_PATTERNS:
+        if pattern.search(text):
+            return document_type
+    return "other"
+
+
+def _insert_document(dialect: str, values: dict):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        return insert(Document).values(**values).returning(Document.id)
+    # No row back means this application already has the file
+    return (
+        upsert(Document).values(**values)
+        .on_conflict_do_nothing(index_elements=["application_id", "sha256"])
+        .returning(Document.id)
+    )
+
+
+def submit_document(channel: str, chat_id: str, file_id: str, file_name: str = None,
+                    caption: str = None, file_size: int = 0) -> str:
+    """Queue an attachment for intake; returns None if accepted, else a message to send back."""
+    if file_size and file_size > DOCUMENT_MAX_BYTES:
+        _stats["too_large"] += 1
+        return TOO_LARGE_MESSAGE
+    if _state["queue"] is None:
+        return FAILED_MESSAGE
+    job = {"channel": channel, "chat_id": chat_id, "file_id": file_id,
+           "file_name": file_name, "caption": caption, "queued_at": time.monotonic()}
+    try:
+        _state["queue"].put_nowait(job)
+    except asyncio.QueueFull:
+        _stats["rejected_busy"] += 1
+        return BUSY_MESSAGE
+    _stats["queued"] += 1
+    return None
+
+
+# --- Content-addressed storage ---
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(DOCUMENT_STORAGE_DIR, sha256[:2], sha256)
+
+
+def _commit_blob(temp_path: str, sha256: str) -> bool:
+    """Move a finished download into place; False if the content was already stored."""
+    final_path = blob_path(sha256)
+    if os.path.exists(final_path):
+        os.remove(temp_path)
+        return False
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(temp_path, final_path)
+    return True
+
+
+async def store_stream(response) -> tuple:
+    """Write a streaming response to storage chunk by chunk; returns (sha256, size, newly_stored)."""
+    temp_path = os.path.join(DOCUMENT_STORAGE_DIR, "tmp", uuid.uuid4().hex)
+    digest = hashlib.sha256()
+    size = 0
+    handle = await asyncio.to_thread(open, temp_path, "wb")
+    try:
+        async for chunk in response.aiter_bytes(DOCUMENT_CHUNK_SIZE):
+            size += len(chunk)
+            if size > DOCUMENT_MAX_BYTES:
+                raise FileTooLargeError(f"download exceeded {DOCUMENT_MAX_BYTES} bytes")
+            digest.update(chunk)
+            await asyncio.to_thread(handle.write, chunk)
+    except BaseException:
+        await asyncio.to_thread(handle.close)
+        await asyncio.to_thread(_remove_quietly, temp_path)
+        raise
+    await asyncio.to_thread(handle.close)
+
+    sha256 = digest.hexdigest()
+    newly_stored = await asyncio.to_thread(_commit_blob, temp_path, sha256)
+    _stats["bytes_downloaded"] += size
+    return sha256, size, newly_stored
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _open_attachment(channel: str, file_id: str):
+    # Imported lazily: the API modules import this service
+    if channel == "telegram":
+        from app.services.telegram_service import open_telegram_file
+        return open_telegram_file(file_id, DOCUMENT_MAX_BYTES)
+    from app.api.whatsapp import open_whatsapp_media
+    return open_whatsapp_media(file_id, DOCUMENT_MAX_BYTES)
+
+
+# --- Pipeline ---
+
+async def _analyze(document_id: int, sha256: str):
+    async with AsyncSessionLocal() as session:
+        # The same bytes were analyzed before (another student, or a re-send): reuse it
+        previous = (await session.execute(
+            select(Document.mime_type, Document.page_count, Document.thumbnail_url, Document.status)
+            .where(Document.sha256 == sha256, Document.mime_type.isnot(None))
+            .limit(1)
+        )).first()
+
+    if previous is not None:
+        _stats["analysis_reused"] += 1
+        result = {"mime_type": previous.mime_type, "page_count": previous.page_count,
+                  "thumbnail_url": previous.thumbnail_url, "allowed": previous.mime_type in doc_worker.ALLOWED_TYPES}
+    else:
+        loop = asyncio.get_running_loop()
+        thumbnail_path = os.path.join(DOCUMENT_THUMBNAIL_DIR, sha256[:2], f"{sha256}.jpg")
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = await asyncio.wait_for(
+                loop.run_in_executor(_state["pool"], doc_worker.analyze, blob_path(sha256), thumbnail_path),
+                timeout=DOCUMENT_ANALYZE_TIMEOUT,
+            )
+            ok = True
+        finally:
+            record_span("document.analyze", time.perf_counter() - started, ok)
+        _stats["analyzed"] += 1
+
+    values = {"mime_type": result["mime_type"], "page_count": result["page_count"],
+              "thumbnail_url": result["thumbnail_url"]}
+    if not result["allowed"]:
+        values["status"] = "rejected"
+        _stats["rejected_type"] += 1
+    async with AsyncSessionLocal() as session:
+        await session.execute(update(Document).where(Document.id == document_id).values(**values))
+        await session.commit()
+    return result["allowed"]
+
+
+async def _ingest(job: dict):
+    # Imported here: crm pulls in the cache bus and chat-log writer
+    from app.services.crm import get_student_profile, latest_application_id, log_interaction
+    from app.services.outbound import enqueue_message
+
+    channel, chat_id = job["channel"], job["chat_id"]
+
+    async def reply(text: str):
+        await enqueue_message(channel, chat_id, text)
+
+    profile = await get_student_profile(chat_id, channel)
+    application_id = await latest_application_id(profile["id"])
+    if application_id is None:
+        _stats["no_application"] += 1
+        await reply(NO_APPLICATION_MESSAGE)
+        return
+
+    try:
+        async with _open_attachment(channel, job["file_id"]) as response:
+            sha256, size, newly_stored = await store_stream(response)
+    except FileTooLargeError:
+        _stats["too_large"] += 1
+        await reply(TOO_LARGE_MESSAGE)
+        return
+    if not newly_stored:
+        _stats["blobs_reused"] += 1
+
+    document_type = document_type_for(job["caption"], job["file_name"])
+    values = {
+        "application_id": application_id,
+        "document_type": document_type,
+        "file_url": blob_path(sha256),
+        "status": "pending",
+        "uploaded_at": datetime.utcnow(),
+        "sha256": sha256,
+        "size_bytes": size,
+        "original_name": job["file_name"],
+        "source": channel,
+    }
+    # Concurrent downloads of the same file race here; the unique index decides
+    async with AsyncSessionLocal() as session:
+        try:
+            document_id = await session.scalar(_insert_document(session.bind.dialect.name, values))
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            document_id = None
+
+    if document_id is None:
+        _stats["duplicates"] += 1
+        await reply(DUPLICATE_MESSAGE)
+        return
+    _stats["stored"] += 1
+    await log_interaction(profile["id"], "user", f"📎 {job['file_name'] or document_type.replace('_', ' ')}")
+
+    try:
+        allowed = await _analyze(document_id, sha256)
+    except Exception:
+        # The file is stored; without analysis it simply waits for manual review
+        logger.exception("Document analysis failed for document %s", document_id)
+        allowed = True
+    if not allowed:
+        await reply(REJECTED_MESSAGE)
+        return
+    label = document_type.replace("_", " ") if document_type != "other" else "document"
+    await reply(f"📄 Received your {label}! Our team will verify it and update your application status.")
+
+
+async def _worker():
+    from app.services.outbound import enqueue_message
+    while True:
+        job = await _state["queue"].get()
+        try:
+            await _ingest(job)
+        except Exception:
+            _stats["failed"] += 1
+            logger.exception("Document intake failed for %s chat %s", job["channel"], job["chat_id"])
+            await enqueue_message(job["channel"], job["chat_id"], FAILED_MESSAGE)
+        finally:
+            _state["queue"].task_done()
+
+
+def get_document_metrics() -> dict:
+    return {
+        **_stats,
+        "queue_depth": _state["queue"].qsize() if _state["queue"] is not None else 0,
+        "queue_size": DOCUMENT_QUEUE_SIZE,
+        "workers": DOCUMENT_WORKERS,
+    }
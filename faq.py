@@ -0,0 +1,126 @@
+import os
+import logging
+import re
+import json
+import zlib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FAQ_CORPUS_PATH = os.getenv("FAQ_CORPUS_PATH", os.path.join(os.path.dirname(__file__), "faq_corpus.json"))
+# Above this cosine score the FAQ answer is sent as-is, without calling Gemini
+FAQ_ANSWER_THRESHOLD = float(os.getenv("FAQ_ANSWER_THRESHOLD", "0.5"))
+# ...and only if it beats the runner-up by this much (e.g. "IELTS for Germany"
+# scores UK and USA alike, so neither answer is safe)
+FAQ_ANSWER_MARGIN = float(os.getenv("FAQ_ANSWER_MARGIN", "0.05"))
+# Above this score a match is passed to Gemini as a reference snippet
+FAQ_SNIPPET_THRESHOLD = float(os.getenv("FAQ_SNIPPET_THRESHOLD", "0.25"))
+FAQ_TOP_K = int(os.getenv("FAQ_TOP_K", "3"))
+FAQ_DIMENSIONS = 2 ** 14
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_index = {"entries": None, "matrix": None, "owners": None, "idf": None}
+_stats = {"answered": 0, "with_snippets": 0, "no_match": 0}
+
+
+def _features(text: str) -> list:
+    # Word unigrams + bigrams, plus character trigrams for typos ("ielst", "cananda")
+    words = _TOKEN.findall(text.lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f" {word} "
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return features
+
+
+def _hashed_counts(text: str):
+    vector = np.zeros(FAQ_DIMENSIONS, dtype=np.float32)
+    for feature in _features(text):
+        vector[zlib.crc32(feature.encode()) % FAQ_DIMENSIONS] += 1.0
+    return vector
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def load_faq_index():
+    """Vectorize the corpus once (TF-IDF over hashed n-grams)."""
+    if np is None:
+        logger.warning("numpy is not installed; FAQ retrieval disabled.")
+        return False
+
+    with open(FAQ_CORPUS_PATH, encoding="utf-8") as f:
+        entries = json.load(f)
+
+    texts, owners = [], []
+    for position, entry in enumerate(entries):
+        for text in [entry["question"], *entry.get("alternates", [])]:
+            texts.append(text)
+            owners.append(position)
+
+    counts = np.stack([_hashed_counts(text) for text in texts])
+    document_frequency = (counts > 0).sum(axis=0)
+    idf = np.log((1 + len(texts)) / (1 + document_frequency)).astype(np.float32) + 1.0
+
+    _index["entries"] = entries
+    _index["matrix"] = _normalize(np.log1p(counts) * idf)
+    _index["owners"] = np.array(owners)
+    _index["idf"] = idf
+    return True
+
+
+def search_faq(question: str, top_k: int = FAQ_TOP_K) -> list:
+    """Top-k (score, entry) pairs, best first, one per FAQ entry."""
+    if _index["matrix"] is None and not load_faq_index():
+        return []
+
+    query = _normalize(np.log1p(_hashed_counts(question)) * _index["idf"])
+    scores = _index["matrix"] @ query
+
+    # Best-scoring phrasing per entry, then the top-k entries
+    best = np.full(len(_index["entries"]), -1.0, dtype=np.float32)
+    np.maximum.at(best, _index["owners"], scores)
+    k = min(top_k, len(best))
+    top = np.argpartition(-best, k - 1)[:k]
+    top = top[np.argsort(-best[top])]
+    return [(float(best[i]), _index["entries"][i]) for i in top]
+
+
+def retrieve(question: str):
+    """Returns (direct_answer, snippets). At most one of them is non-empty."""
+    matches = search_faq(question)
+    runner_up = matches[1][0] if len(matches) > 1 else 0.0
+    if matches and matches[0][0] >= FAQ_ANSWER_THRESHOLD and matches[0][0] - runner_up >= FAQ_ANSWER_MARGIN:
+        _stats["answered"] += 1
+        return matches[0][1]["answer"], []
+
+    snippets = [entry for score, entry in matches if score >= FAQ_SNIPPET_THRESHOLD]
+    _stats["with_snippets" if snippets else "no_match"] += 1
+    return None, snippets
+
+
+def format_snippets(snippets: list) -> str:
+    if not snippets:
+        return ""
+    lines = "\n".join(f"    - Q: {entry['question']} A: {entry['answer']}" for entry in snippets)
+    return f"\n    Reference notes (use if relevant):\n{lines}\n"
+
+
+def get_faq_metrics() -> dict:
+    total = sum(_stats.values())
+    return {
+        **_stats,
+        "entries": len(_index["entries"] or []),
+        "answer_rate": round(_stats["answered"] / total, 4) if total else 0.0,
+        "threshold": FAQ_ANSWER_THRESHOLD,
+    }
@@ -0,0 +1,179 @@
+import os
+import time
+import httpx
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from app.services.instrumentation import record_span
+
+load_dotenv()
+
+# Outbound messaging client settings (shared by Telegram and WhatsApp)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "5.0"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.0"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "2.0"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+
+# Both api.telegram.org and graph.facebook.com negotiate HTTP/2 over ALPN
+PROVIDERS = {
+    "telegram": "https://api.telegram.org",
+    "whatsapp": "https://graph.facebook.com",
+}
+
+try:
+    import h2  # noqa: F401  (httpx needs it for http2=True)
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+
+class FileTooLargeError(ValueError):
+    """A user-sent file exceeds the size we are willing to download."""
+
+
+_clients = {}
+_metrics = {}
+# Load tests route provider traffic through an httpx.MockTransport instead of the network
+_transport = {"override": None}
+
+
+def _new_metrics():
+    return {
+        "requests": 0,
+        "errors": 0,
+        "tcp_connects": 0,
+        "tls_handshakes": 0,
+        "pool_waits": 0,
+        "pool_wait_seconds": 0.0,
+        "request_seconds": 0.0,
+        "http2_requests": 0,
+    }
+
+
+def _build_client(provider: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=PROVIDERS[provider],
+        transport=_transport["override"],
+        http2=HTTP2_ENABLED and _HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            HTTP_TIMEOUT,
+            connect=HTTP_CONNECT_TIMEOUT,
+            pool=HTTP_POOL_TIMEOUT,
+        ),
+    )
+
+
+async def start_http_clients():
+    for provider in PROVIDERS:
+        if provider not in _clients:
+            _clients[provider] = _build_client(provider)
+            _metrics.setdefault(provider, _new_metrics())
+
+
+async def close_http_clients():
+    for provider in list(_clients):
+        client = _clients.pop(provider)
+        await client.aclose()
+
+
+async def set_transport(transport):
+    """Send all provider requests through `transport` (None restores the network)."""
+    _transport["override"] = transport
+    await close_http_clients()
+
+
+def get_http_client(provider: str) -> httpx.AsyncClient:
+    # Lazily opened so scripts that never run the FastAPI startup still work
+    client = _clients.get(provider)
+    if client is None or client.is_closed:
+        client = _clients[provider] = _build_client(provider)
+        _metrics.setdefault(provider, _new_metrics())
+    return client
+
+
+def _make_tracer(provider: str, started: float):
+    stats = _metrics[provider]
+    first_event = []
+
+    async def trace(event_name: str, info: dict):
+        # The first connection-level event marks the end of waiting for a pool slot
+        if not first_event:
+            first_event.append(event_name)
+            waited = time.perf_counter() - started
+            stats["pool_wait_seconds"] += waited
+            if waited > 0.001:
+                stats["pool_waits"] += 1
+        if event_name == "connection.connect_tcp.complete":
+            stats["tcp_connects"] += 1
+        elif event_name == "connection.start_tls.complete":
+            stats["tls_handshakes"] += 1
+
+    return trace
+
+
+async def provider_request(provider: str, method: str, url: str, **kwargs) -> httpx.Response:
+    client = get_http_client(provider)
+    stats = _metrics[provider]
+    started = time.perf_counter()
+    extensions = kwargs.pop("extensions", {})
+    extensions["trace"] = _make_tracer(provider, started)
+
+    stats["requests"] += 1
+    ok = False
+    try:
+        response = await client.request(method, url, extensions=extensions, **kwargs)
+        ok = response.is_success
+    except Exception:
+        stats["errors"] += 1
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        stats["request_seconds"] += elapsed
+        record_span(f"{provider}.request", elapsed, ok)
+
+    if response.http_version == "HTTP/2":
+        stats["http2_requests"] += 1
+    return response
+
+
+@asynccontextmanager
+async def provider_stream(provider: str, method: str, url: str, **kwargs):
+    """Like provider_request, but the body is read incrementally (large downloads)."""
+    client = get_http_client(provider)
+    stats = _metrics[provider]
+    started = time.perf_counter()
+    extensions = kwargs.pop("extensions", {})
+    extensions["trace"] = _make_tracer(provider, started)
+
+    stats["requests"] += 1
+    ok = False
+    try:
+        async with client.stream(method, url, extensions=extensions, **kwargs) as response:
+            yield response
+            ok = response.is_success
+    except Exception:
+        stats["errors"] += 1
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        stats["request_seconds"] += elapsed
+        record_span(f"{provider}.download", elapsed, ok)
+
+
+def get_http_metrics() -> dict:
+    return {
+        provider: {
+            **stats,
+            "pool_wait_seconds": round(stats["pool_wait_seconds"], 6),
+            "request_seconds": round(stats["request_seconds"], 6),
+            "http2": HTTP2_ENABLED and _HTTP2_AVAILABLE,
+        }
+        for provider, stats in _metrics.items()
+    }
@@ -0,0 +1,117 @@
+import os
+import logging
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# How many recent update/message ids to remember. Telegram and WhatsApp give up
+# re-delivering within hours, so a few minutes' worth of traffic is plenty.
+WEBHOOK_DEDUP_WINDOW = int(os.getenv("WEBHOOK_DEDUP_WINDOW", "50000"))
+# Empty keeps ids in memory only; with several uvicorn workers give each its own file
+WEBHOOK_DEDUP_PATH = os.getenv("WEBHOOK_DEDUP_PATH", "")
+
+
+class RecentIds:
+    """Bounded set: the oldest id is forgotten once `maxlen` newer ones arrived."""
+
+    def __init__(self, maxlen: int):
+        self._order = deque(maxlen=maxlen)
+        self._members = set()
+
+    def __contains__(self, key) -> bool:
+        return key in self._members
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def add(self, key) -> bool:
+        """Remember `key`; returns False if it was already there."""
+        if key in self._members:
+            return False
+        if len(self._order) == self._order.maxlen:
+            self._members.discard(self._order[0])
+        self._order.append(key)
+        self._members.add(key)
+        return True
+
+
+_seen = RecentIds(WEBHOOK_DEDUP_WINDOW)
+_db = None
+_db_lock = threading.Lock()
+_stats = {"accepted": 0, "duplicates": 0}
+
+
+# --- SQLite persistence (survives restarts) ---
+
+def _db_open(path: str):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS webhook_seen (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT, seen_at REAL)")
+    conn.commit()
+    return conn
+
+
+def _db_load() -> list:
+    with _db_lock:
+        rows = _db.execute(
+            "SELECT key FROM (SELECT id, key FROM webhook_seen ORDER BY id DESC LIMIT ?) ORDER BY id",
+            (WEBHOOK_DEDUP_WINDOW,),
+        ).fetchall()
+    return [row[0] for row in rows]
+
+
+def _db_insert(key: str):
+    with _db_lock:
+        cursor = _db.execute("INSERT INTO webhook_seen (key, seen_at) VALUES (?, ?)", (key, time.time()))
+        # Trim in steps so the table stays about the size of the in-memory window
+        if cursor.lastrowid % 1000 == 0:
+            _db.execute("DELETE FROM webhook_seen WHERE id <= ?", (cursor.lastrowid - WEBHOOK_DEDUP_WINDOW,))
+        _db.commit()
+
+
+async def start_idempotency():
+    global _db
+    if WEBHOOK_DEDUP_PATH and _db is None:
+        _db = _db_open(WEBHOOK_DEDUP_PATH)
+        for key in await asyncio.to_thread(_db_load):
+            _seen.add(key)
+
+
+async def stop_idempotency():
+    global _db
+    if _db is not None:
+        _db.close()
+        _db = None
+
+
+async def first_delivery(source: str, delivery_id) -> bool:
+    """True the first time an update/message id is seen; False for re-deliveries.
+
+    The id is recorded before the update is processed, so a retry that arrives
+    while the original is still running is dropped too.
+    """
+    if delivery_id is None:
+        return True
+    key = f"{source}:{delivery_id}"
+    if not _seen.add(key):
+        _stats["duplicates"] += 1
+        return False
+    _stats["accepted"] += 1
+    if _db is not None:
+        try:
+            await asyncio.to_thread(_db_insert, key)
+        except Exception as e:
+            logger.warning("Webhook dedup persist failed: %s", e)
+    return True
+
+
+def get_idempotency_metrics() -> dict:
+    return {**_stats, "remembered": len(_seen), "window": WEBHOOK_DEDUP_WINDOW, "persistent": _db is not None}
@@ -0,0 +1,341 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+import contextvars
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# "json" for log shippers, "text" for a terminal
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Requests slower than this are logged with their DB and span breakdown
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+
+# Opt-in sampling profiler (needs pyinstrument); reports are kept only for slow requests
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "false").lower() == "true"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.05"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "500"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+logger = logging.getLogger(__name__)
+
+# Per-request accumulator, visible to DB hooks and spans running under the request
+_request = contextvars.ContextVar("request_metrics", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+# (metric name, sorted label items) -> Histogram / count
+_histograms = {}
+_counters = defaultdict(int)
+_HELP = {
+    "http_request_duration_seconds": "Request latency by route",
+    "http_requests_total": "Requests by route and status",
+    "db_queries_per_request": "SQL statements executed per request",
+    "db_seconds_per_request": "Time spent in SQL per request",
+    "db_query_duration_seconds": "Single SQL statement latency",
+    "db_pool_checkout_wait_seconds": "Time spent waiting for a pooled DB connection",
+    "span_duration_seconds": "Timed calls to Gemini and messaging providers",
+    "span_errors_total": "Timed calls that raised or returned an error",
+}
+
+
+def observe(name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = Histogram(buckets)
+    histogram.observe(value)
+
+
+def increment(name: str, **labels):
+    _counters[(name, tuple(sorted(labels.items())))] += 1
+
+
+# --- Spans ---
+
+def record_span(name: str, seconds: float, ok: bool = True):
+    observe("span_duration_seconds", seconds, span=name)
+    if not ok:
+        increment("span_errors_total", span=name)
+    current = _request.get()
+    if current is not None:
+        current["spans"][name] = current["spans"].get(name, 0.0) + seconds
+
+
+@contextmanager
+def span(name: str):
+    started = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        record_span(name, time.perf_counter() - started, ok)
+
+
+# --- SQLAlchemy hooks ---
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info["query_started"].pop()
+        observe("db_query_duration_seconds", seconds)
+        current = _request.get()
+        if current is not None:
+            current["queries"] += 1
+            current["db_seconds"] += seconds
+
+
+# --- ASGI middleware ---
+
+class InstrumentationMiddleware:
+    """Per-route latency, DB usage and span breakdown for every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+        self._profiling = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = uuid.uuid4().hex[:16]
+        current = {"request_id": request_id, "queries": 0, "db_seconds": 0.0, "spans": {}}
+        token = _request.set(current)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message.setdefault("headers", []).append((b"x-request-id", request_id.encode()))
+            await send(message)
+
+        profiler = self._start_profiler()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request.reset(token)
+            # Route template, not the raw path, so ids don't explode the label set
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            observe("http_request_duration_seconds", elapsed, method=method, route=route)
+            observe("db_queries_per_request", current["queries"], COUNT_BUCKETS, route=route)
+            observe("db_seconds_per_request", current["db_seconds"], route=route)
+            increment("http_requests_total", method=method, route=route, status=str(status["code"]))
+
+            if elapsed * 1000 >= SLOW_REQUEST_MS:
+                logger.warning("slow request", extra={
+                    "route": route, "method": method, "status": status["code"],
+                    "duration_ms": round(elapsed * 1000, 1), "db_queries": current["queries"],
+                    "db_ms": round(current["db_seconds"] * 1000, 1),
+                    "spans_ms": {name: round(seconds * 1000, 1) for name, seconds in current["spans"].items()},
+                })
+            if profiler is not None:
+                await self._finish_profiler(profiler, elapsed, method, route, request_id)
+
+    def _start_profiler(self):
+        # One profile at a time; the profiler hooks the whole thread
+        if not PROFILE_REQUESTS or Profiler is None or self._profiling or random.random() >= PROFILE_SAMPLE_RATE:
+            return None
+        self._profiling = True
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        return profiler
+
+    async def _finish_profiler(self, profiler, elapsed: float, method: str, route: str, request_id: str):
+        try:
+            profiler.stop()
+            if elapsed * 1000 < PROFILE_SLOW_MS:
+                return
+            name = f"{int(time.time())}-{method}-{route.strip('/').replace('/', '_').replace('{', '').replace('}', '') or 'root'}-{request_id}.html"
+            path = os.path.join(PROFILE_DIR, name)
+            await asyncio.to_thread(_write_profile, path, profiler.output_html())
+            logger.info("slow request profiled", extra={"route": route, "profile": path})
+        except Exception:
+            logger.exception("request profiling failed")
+        finally:
+            self._profiling = False
+
+
+def _write_profile(path: str, html: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(html)
+
+
+def get_route_metrics() -> dict:
+    queries = {dict(labels)["route"]: histogram for (name, labels), histogram in _histograms.items()
+               if name == "db_queries_per_request"}
+    routes = {}
+    for (name, labels), histogram in _histograms.items():
+        if name != "http_request_duration_seconds":
+            continue
+        labels = dict(labels)
+        db = queries.get(labels["route"])
+        # Percentiles are bucket upper bounds
+        routes[f"{labels['method']} {labels['route']}"] = {
+            "count": histogram.count,
+            "avg_ms": round(histogram.sum / histogram.count * 1000, 2),
+            "p50_ms_le": _ms(histogram.quantile(0.5)),
+            "p95_ms_le": _ms(histogram.quantile(0.95)),
+            "p99_ms_le": _ms(histogram.quantile(0.99)),
+            "avg_db_queries": round(db.sum / db.count, 2) if db else None,
+        }
+    return routes
+
+
+def _ms(seconds):
+    return "+Inf" if seconds == float("inf") else round(seconds * 1000, 1)
+
+
+# --- Prometheus exposition ---
+
+def _labels(items, extra=None) -> str:
+    pairs = list(items) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def render_prometheus(gauges: dict = None) -> str:
+    """Text exposition format. `gauges` maps metric name -> value for point-in-time stats."""
+    lines = []
+    families = defaultdict(list)
+    for (name, labels), histogram in _histograms.items():
+        families[name].append((labels, histogram))
+    for name, series in sorted(families.items()):
+        lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in series:
+            cumulative = 0
+            for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, ('le', bound))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+    counters = defaultdict(list)
+    for (name, labels), value in _counters.items():
+        counters[name].append((labels, value))
+    for name, series in sorted(counters.items()):
+        lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in series:
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Logging ---
+
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        current = _request.get()
+        if current is not None:
+            entry["request_id"] = current["request_id"]
+        # Anything passed via extra= becomes a field
+        entry.update({key: value for key, value in vars(record).items() if key not in _RESERVED})
+        if record.exc_info:
+            entry["exc"] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# Telegram puts the bot token in every URL path (/bot123456:ABC-xyz/sendMessage)
+_TELEGRAM_TOKEN = re.compile(r"/bot\d+:[\w-]+")
+_PLAIN_FORMATTER = logging.Formatter()
+
+
+def redact(text: str) -> str:
+    return _TELEGRAM_TOKEN.sub("/bot<redacted>", text)
+
+
+class RedactingFilter(logging.Filter):
+    """Strips credentials from messages and tracebacks (httpx errors quote the request URL)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        cleaned = redact(message)
+        if cleaned != message:
+            record.msg, record.args = cleaned, None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = redact(_PLAIN_FORMATTER.formatException(record.exc_info))
+        return True
+
+
+def configure_logging():
+    handler = logging.StreamHandler(sys.stdout)
+    handler.addFilter(RedactingFilter())
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(LOG_LEVEL)
+    # httpx logs every request URL at INFO: per-message log I/O, and the Telegram token is in the path
+    for name in ("httpx", "httpcore"):
+        logging.getLogger(name).setLevel(logging.WARNING)
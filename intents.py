@@ -0,0 +1,55 @@
+import re
+
+# --- Conversation data (shared by every channel) ---
+
+INTENT_KEYWORDS = {
+    "menu": ["hi", "hello", "start", "/start", "hlo"],
+    "status": ["status", "/status"],
+    "apply": ["apply", "/apply"],
+    "book": ["book", "/book"],
+}
+
+COUNTRY_ALIASES = {
+    "Canada": ["1", "canada"],
+    "UK": ["2", "uk"],
+    "USA": ["3", "usa"],
+    "Australia": ["4", "australia"],
+}
+
+# "Name: John Doe", "Date: Tomorrow 3 PM"
+PREFIX_INTENTS = ["name", "date"]
+
+DOCUMENT_TEMPLATES = {
+    "Canada": "🇨🇦 *Canada Study Visa (Pakistan Req):*\n- Passport (valid 6mo)\n- IELTS (6.0+ / PTE 60)\n- Matric & FSc/Inter Transcripts (IBCC Attested)\n- FRC (Family Reg Cert)\n- Bank Statement (40 Lakhs+)\n- Polio Card",
+    "UK": "🇬🇧 *UK Study Visa (Pakistan Req):*\n- Passport\n- CAS Letter\n- IELTS/PTE/OIETC\n- Bank Statement (28 days old, ~50 Lakhs)\n- TB Test (IOM)\n- FRC",
+    "USA": "🇺🇸 *USA Study Visa (Pakistan Req):*\n- Passport\n- I-20 Form\n- DS-160\n- SEVIS Fee ($350)\n- Interview Prep (Critical)\n- Bank Statement (60-80 Lakhs)",
+    "Australia": "🇦🇺 *Australia Study Visa (Pakistan Req):*\n- Passport\n- CoE\n- OSHC (Health Ins)\n- GTE/GS Statement\n- FRC & Polio Card\n- Bank Statement (Running Finance pref)"
+}
+
+
+# --- Precompiled lookup tables (built once at import) ---
+
+def _build_exact_table() -> dict:
+    table = {}
+    for intent, keywords in INTENT_KEYWORDS.items():
+        for keyword in keywords:
+            table[keyword] = (intent, None)
+    for country, aliases in COUNTRY_ALIASES.items():
+        for alias in aliases:
+            table[alias] = ("country", country)
+    return table
+
+
+EXACT_TABLE = _build_exact_table()
+PREFIX_PATTERN = re.compile(r"^(" + "|".join(map(re.escape, PREFIX_INTENTS)) + r"):(.*)$", re.DOTALL)
+
+
+def route(msg_body: str):
+    """Map a normalized (stripped, lower-cased) message to (intent, argument)."""
+    hit = EXACT_TABLE.get(msg_body)
+    if hit is not None:
+        return hit
+    match = PREFIX_PATTERN.match(msg_body)
+    if match:
+        return match.group(1), match.group(2).strip()
+    return "ai", None
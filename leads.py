@@ -1,11 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+import json
+import base64
+from collections import deque
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, tuple_
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
-from typing import List, Optional
+from typing import List, Optional, Union
 from pydantic import BaseModel
-from app.db.database import AsyncSessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import AsyncSessionLocal, get_db, get_read_db
 from app.models.application import VisaApplication, ApplicationStatus
 from app.models.student import Student
+from app.models.chat_log import ChatLog
+from app.services.crm import invalidate_student_profile
+from app.services.chat_log_writer import pending_entries, entry_key
+from app.services.stats import record_status_change
 
 router = APIRouter()
 
@@ -29,77 +39,242 @@ class LeadResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class LeadPage(BaseModel):
+    items: List[LeadResponse]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+
 class UpdateLeadRequest(BaseModel):
     status: str
 
+# --- Keyset cursor on (timestamp, id) ---
+def _encode_cursor(timestamp: datetime, row_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 # --- Endpoints ---
 
-@router.get("/", response_model=List[LeadResponse])
-async def get_leads():
-    async with AsyncSessionLocal() as session:
-        # Fetch applications with student data
-        result = await session.execute(
-            select(VisaApplication)
-            .options(selectinload(VisaApplication.student))
-            .order_by(VisaApplication.updated_at.desc())
+@router.get("/", response_model=Union[LeadPage, List[LeadResponse]])
+async def get_leads(
+    response: Response,
+    # paged=true returns {items, next_cursor, total}; without it the body stays the plain list
+    # existing callers expect, with the cursor and total in X-Next-Cursor / X-Total-Count
+    paged: bool = False,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    country: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    include_total: bool = False,
+    session: AsyncSession = Depends(get_read_db),
+):
+    filters = []
+    if status:
+        valid_statuses = [s.value for s in ApplicationStatus]
+        if status not in valid_statuses:
+            raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of {valid_statuses}")
+        filters.append(VisaApplication.status == status)
+    if country:
+        filters.append(VisaApplication.country == country)
+    if created_from:
+        filters.append(VisaApplication.created_at >= created_from)
+    if created_to:
+        filters.append(VisaApplication.created_at < created_to)
+
+    # Legacy rows have no updated_at; the expression matches ix_visa_applications_activity_at_id
+    activity_at = func.coalesce(VisaApplication.updated_at, VisaApplication.created_at)
+
+    # Only the columns the list view renders, newest first
+    query = (
+        select(
+            VisaApplication.id,
+            VisaApplication.country,
+            VisaApplication.status,
+            VisaApplication.created_at,
+            activity_at.label("activity_at"),
+            Student.name,
+            Student.whatsapp_id,
+            Student.email,
+            Student.profile_data,
+        )
+        .join(Student, Student.id == VisaApplication.student_id)
+        .where(*filters)
+        .order_by(activity_at.desc(), VisaApplication.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        cursor_activity_at, cursor_id = _decode_cursor(cursor)
+        query = query.where(tuple_(activity_at, VisaApplication.id) < tuple_(cursor_activity_at, cursor_id))
+
+    rows = (await session.execute(query)).all()
+
+    total = None
+    if include_total:
+        # Same join as the page query, so the total counts the rows it can return
+        total = await session.scalar(
+            select(func.count(VisaApplication.id))
+            .join(Student, Student.id == VisaApplication.student_id)
+            .where(*filters)
         )
-        leads = result.scalars().all()
-        
-        # Convert to response format
-        response = []
-        for lead in leads:
-            response.append({
-                "id": lead.id,
-                "country": lead.country,
-                "status": lead.status.value if hasattr(lead.status, 'value') else lead.status,
-                "created_at": lead.created_at.isoformat() if lead.created_at else "",
-                "student": {
-                    "name": lead.student.name,
-                    "whatsapp_id": lead.student.whatsapp_id,
-                    "email": lead.student.email,
-                    "profile_data": lead.student.profile_data
-                }
-            })
-        return response
+
+    # One extra row tells us whether another page exists
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].activity_at, rows[-1].id)
+
+    items = [
+        {
+            "id": row.id,
+            "country": row.country,
+            "status": row.status.value if hasattr(row.status, 'value') else row.status,
+            "created_at": row.created_at.isoformat() if row.created_at else "",
+            "student": {
+                "name": row.name,
+                "whatsapp_id": row.whatsapp_id,
+                "email": row.email,
+                "profile_data": row.profile_data
+            }
+        }
+        for row in rows
+    ]
+    if not paged:
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        if total is not None:
+            response.headers["X-Total-Count"] = str(total)
+        return items
+    return {"items": items, "next_cursor": next_cursor, "total": total}
 
 @router.patch("/{lead_id}")
-async def update_lead_status(lead_id: int, update_data: UpdateLeadRequest):
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(VisaApplication).where(VisaApplication.id == lead_id))
-        serialized_lead = result.scalar_one_or_none()
-        
-        if not serialized_lead:
-            raise HTTPException(status_code=404, detail="Lead not found")
-        
-        # Validate status enum if possible, or just accept string for flexibility
-        # For now, trusting the input or mapping loosely
-        valid_statuses = [s.value for s in ApplicationStatus]
-        if update_data.status not in valid_statuses:
-             raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of {valid_statuses}")
+async def update_lead_status(lead_id: int, update_data: UpdateLeadRequest, session: AsyncSession = Depends(get_db)):
+    result = await session.execute(
+        select(VisaApplication, Student.whatsapp_id)
+        .join(Student, Student.id == VisaApplication.student_id)
+        .where(VisaApplication.id == lead_id)
+    )
+    row = result.first()
+    
+    if not row:
+        raise HTTPException(status_code=404, detail="Lead not found")
+    serialized_lead, whatsapp_id = row
+    
+    # Validate status enum if possible, or just accept string for flexibility
+    # For now, trusting the input or mapping loosely
+    valid_statuses = [s.value for s in ApplicationStatus]
+    if update_data.status not in valid_statuses:
+         raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of {valid_statuses}")
+
+    old_status = serialized_lead.status
+    serialized_lead.status = ApplicationStatus(update_data.status)
+    await session.commit()
+    record_status_change(old_status, serialized_lead.status)
+    await session.refresh(serialized_lead)
 
-        serialized_lead.status = ApplicationStatus(update_data.status)
-        await session.commit()
-        await session.refresh(serialized_lead)
-        
-        return {"status": "success", "new_status": serialized_lead.status}
+    # The bot's cached profile may show this application's status
+    await invalidate_student_profile(whatsapp_id)
+    
+    return {"status": "success", "new_status": serialized_lead.status}
+
+HISTORY_STREAM_BATCH = 500
+
+def _history_item(sender: str, message: str, created_at: datetime) -> dict:
+    return {
+        "sender": sender,
+        "message": message,
+        "timestamp": created_at.isoformat()
+    }
+
+def _history_query(student_id: int, since: Optional[datetime]):
+    query = (
+        select(ChatLog.id, ChatLog.student_id, ChatLog.sender, ChatLog.message, ChatLog.created_at)
+        .where(ChatLog.student_id == student_id)
+        .order_by(ChatLog.created_at.asc(), ChatLog.id.asc())
+    )
+    if since:
+        query = query.where(ChatLog.created_at > since)
+    return query
+
+def _unflushed_history(student_id: int, since: Optional[datetime], recent_keys: set) -> list:
+    # Messages still buffered in the chat-log writer
+    return [
+        _history_item(row["sender"], row["message"], row["created_at"])
+        for row in pending_entries(student_id)
+        if entry_key(row["student_id"], row["sender"], row["message"], row["created_at"]) not in recent_keys
+        and (since is None or row["created_at"] > since)
+    ]
 
 @router.get("/{student_id}/history")
-async def get_lead_history(student_id: int):
-    async with AsyncSessionLocal() as session:
-        # Fetch chat logs
-        from app.models.chat_log import ChatLog
-        result = await session.execute(
-            select(ChatLog)
-            .where(ChatLog.student_id == student_id)
-            .order_by(ChatLog.created_at.asc())
-        )
-        logs = result.scalars().all()
-        
-        return [
-            {
-                "sender": log.sender,
-                "message": log.message,
-                "timestamp": log.created_at.isoformat()
-            }
-            for log in logs
-        ]
+async def get_lead_history(
+    student_id: int,
+    since: Optional[datetime] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    """Full history, streamed from a server-side cursor so memory stays flat."""
+
+    async def rows():
+        recent_keys = deque(maxlen=50)
+        # Its own session: a request-scoped one would close before the response body streams.
+        # Primary, not the replica: rows flushed but not yet replicated would be in neither
+        # the replica nor the writer's pending buffer.
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(
+                _history_query(student_id, since).execution_options(yield_per=HISTORY_STREAM_BATCH)
+            )
+            async for row in result:
+                recent_keys.append(entry_key(row.student_id, row.sender, row.message, row.created_at))
+                yield _history_item(row.sender, row.message, row.created_at)
+        for item in _unflushed_history(student_id, since, set(recent_keys)):
+            yield item
+
+    async def ndjson():
+        async for item in rows():
+            yield json.dumps(item) + "\n"
+
+    async def json_array():
+        # Same JSON array as before, written out chunk by chunk
+        separator = "["
+        async for item in rows():
+            yield separator + json.dumps(item)
+            separator = ","
+        yield "[]" if separator == "[" else "]"
+
+    if format == "ndjson":
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+    return StreamingResponse(json_array(), media_type="application/json")
+
+@router.get("/{student_id}/history/page")
+async def get_lead_history_page(
+    student_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    since: Optional[datetime] = None,
+    # Primary: a since/cursor poll must not step past rows the replica hasn't received yet
+    session: AsyncSession = Depends(get_db),
+):
+    query = _history_query(student_id, since).limit(limit + 1)
+    if cursor:
+        cursor_created_at, cursor_id = _decode_cursor(cursor)
+        query = query.where(tuple_(ChatLog.created_at, ChatLog.id) > tuple_(cursor_created_at, cursor_id))
+
+    rows = (await session.execute(query)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    items = [_history_item(row.sender, row.message, row.created_at) for row in rows]
+    if next_cursor is None:
+        # Last page: include what the chat-log writer has not flushed yet
+        recent_keys = {entry_key(row.student_id, row.sender, row.message, row.created_at) for row in rows[-50:]}
+        items.extend(_unflushed_history(student_id, since, recent_keys))
+    return {"items": items, "next_cursor": next_cursor}
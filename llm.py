@@ -0,0 +1,196 @@
+import os
+import logging
+import math
+import random
+import asyncio
+import hashlib
+from datetime import timedelta
+from dotenv import load_dotenv
+from app.services.prompt_builder import SYSTEM_PROMPT
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# "gemini" (default) or "fake" for offline load tests
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+# Explicit context caching needs a versioned model and a long enough prompt;
+# when it can't be used we still send the static prompt as system_instruction
+GEMINI_CACHE_SYSTEM_PROMPT = os.getenv("GEMINI_CACHE_SYSTEM_PROMPT", "false").lower() == "true"
+GEMINI_CACHE_MODEL = os.getenv("GEMINI_CACHE_MODEL", f"models/{GEMINI_MODEL}-001")
+GEMINI_CACHE_TTL_HOURS = float(os.getenv("GEMINI_CACHE_TTL_HOURS", "24"))
+
+# Fake backend: "fixed:0.4", "uniform:0.2,1.0" or "lognormal:<median>,<sigma>"
+LLM_FAKE_LATENCY = os.getenv("LLM_FAKE_LATENCY", "lognormal:0.6,0.4")
+LLM_FAKE_ERROR_RATE = float(os.getenv("LLM_FAKE_ERROR_RATE", "0"))
+LLM_FAKE_SEED = int(os.getenv("LLM_FAKE_SEED", "42"))
+
+
+class LLMProvider:
+    """Interface every backend implements. Strings in, strings out."""
+
+    name = "base"
+
+    @property
+    def available(self) -> bool:
+        return False
+
+    async def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    async def open_stream(self, prompt: str):
+        """Return an async iterator of text chunks."""
+        raise NotImplementedError
+
+    async def summarize(self, prompt: str) -> str:
+        # Plain completion without the counselor system instruction
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self):
+        self._genai = None
+        self._model = None
+        self._plain_model = None
+
+    @property
+    def available(self) -> bool:
+        return bool(GOOGLE_API_KEY)
+
+    def _ensure(self):
+        # google.generativeai is slow to import; only pay for it on first use
+        if self._model is not None:
+            return
+        import google.generativeai as genai
+        genai.configure(api_key=GOOGLE_API_KEY)
+        self._genai = genai
+        self._model = self._build_model()
+        self._plain_model = genai.GenerativeModel(GEMINI_MODEL)
+
+    def _build_model(self):
+        genai = self._genai
+        if GEMINI_CACHE_SYSTEM_PROMPT:
+            try:
+                from google.generativeai import caching
+                cached = caching.CachedContent.create(
+                    model=GEMINI_CACHE_MODEL,
+                    system_instruction=SYSTEM_PROMPT,
+                    ttl=timedelta(hours=GEMINI_CACHE_TTL_HOURS),
+                )
+                return genai.GenerativeModel.from_cached_content(cached_content=cached)
+            except Exception as e:
+                logger.warning("Gemini context cache unavailable, using system_instruction: %s", e)
+        return genai.GenerativeModel(GEMINI_MODEL, system_instruction=SYSTEM_PROMPT)
+
+    async def generate(self, prompt: str) -> str:
+        self._ensure()
+        response = await self._model.generate_content_async(prompt)
+        return response.text.strip()
+
+    async def open_stream(self, prompt: str):
+        self._ensure()
+        response = await self._model.generate_content_async(prompt, stream=True)
+
+        async def chunks():
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        return chunks()
+
+    async def summarize(self, prompt: str) -> str:
+        self._ensure()
+        response = await self._plain_model.generate_content_async(prompt)
+        return response.text.strip()
+
+
+class FakeLLMError(Exception):
+    # Looks like a 503 to the gateway, so it is retried and counted by the breaker
+    code = 503
+
+
+class FakeLLMProvider(LLMProvider):
+    """Deterministic local stand-in with configurable latency and error injection."""
+
+    name = "fake"
+
+    ANSWERS = [
+        "For most Canadian colleges you need IELTS 6.0 overall with no band below 5.5. Type *Apply* to start your file.",
+        "A UK student visa needs a CAS letter, IELTS/PTE and a 28-day-old bank statement of about 50 Lakhs.",
+        "Gaps of up to 2 years are usually accepted with an experience letter. Our counselor can review your case.",
+        "Australia requires a GS statement, OSHC cover and funds of roughly 60-70 Lakhs. Type *Book* to talk to us.",
+        "I can only help with study visas for Canada, UK, USA and Australia. Which country are you interested in?",
+    ]
+
+    def __init__(self, latency: str = LLM_FAKE_LATENCY, error_rate: float = LLM_FAKE_ERROR_RATE, seed: int = LLM_FAKE_SEED):
+        kind, _, params = latency.partition(":")
+        self.latency_kind = kind
+        self.latency_params = [float(p) for p in params.split(",") if p]
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    def _latency(self) -> float:
+        params = self.latency_params
+        if self.latency_kind == "fixed":
+            return params[0]
+        if self.latency_kind == "uniform":
+            return self.rng.uniform(params[0], params[1])
+        median, sigma = params if params else (0.6, 0.4)
+        return self.rng.lognormvariate(math.log(median), sigma)
+
+    def _answer(self, prompt: str) -> str:
+        # Same prompt, same answer
+        digest = int(hashlib.md5(prompt.encode()).hexdigest(), 16)
+        return self.ANSWERS[digest % len(self.ANSWERS)]
+
+    def _maybe_fail(self):
+        if self.rng.random() < self.error_rate:
+            raise FakeLLMError("injected fake LLM failure")
+
+    async def generate(self, prompt: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(self._latency())
+        self._maybe_fail()
+        return self._answer(prompt)
+
+    async def open_stream(self, prompt: str):
+        self.calls += 1
+        total = self._latency()
+        # Roughly a third of the time goes to the first token, like a real model
+        await asyncio.sleep(total / 3)
+        self._maybe_fail()
+        words = self._answer(prompt).split(" ")
+        step = (total * 2 / 3) / max(len(words), 1)
+
+        async def chunks():
+            for index in range(0, len(words), 4):
+                await asyncio.sleep(step * 4)
+                yield " ".join(words[index:index + 4]) + " "
+        return chunks()
+
+    async def summarize(self, prompt: str) -> str:
+        await asyncio.sleep(self._latency() / 2)
+        return "Student asked about study visa requirements; details collected so far are in the profile."
+
+
+_provider = {"current": None}
+
+
+def get_llm() -> LLMProvider:
+    if _provider["current"] is None:
+        _provider["current"] = FakeLLMProvider() if LLM_BACKEND == "fake" else GeminiProvider()
+    return _provider["current"]
+
+
+def set_llm(provider: LLMProvider):
+    """Swap the backend (benchmarks, tests)."""
+    _provider["current"] = provider
@@ -0,0 +1,398 @@
+"""End-to-end webhook load test: realistic Telegram/WhatsApp traffic against app.main, fully offline.
+
+The FastAPI app is driven through httpx's ASGI transport. Telegram/WhatsApp APIs are answered by
+an in-process mock transport, the LLM is the deterministic fake backend, and the database is a
+throwaway SQLite file (needs aiosqlite) unless DATABASE_URL points somewhere else, e.g. a local Postgres.
+
+Usage:
+    python loadtest.py --requests 2000 --concurrency 50 --output loadtest_results.json
+    python loadtest.py --baseline loadtest_results.json --max-regression 0.2   # exits 1 on regression
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import contextvars
+import tracemalloc
+from datetime import datetime
+from collections import Counter
+
+# (weight, messages). "voice" is Telegram-only.
+SCENARIOS = {
+    "menu": (20, ["hi", "/start", "hello", "hlo"]),
+    "country": (20, ["canada", "uk", "usa", "australia", "1", "2"]),
+    "status": (15, ["status", "/status"]),
+    "apply": (5, ["apply", "/apply"]),
+    "name": (5, ["Name: Ali Raza", "Name: Sana Khan", "name: hamza tariq"]),
+    "ai": (25, [
+        "What IELTS score do I need for Canada?",
+        "how much bank statement is required for uk in lakhs",
+        "Is a 3 year study gap acceptable for Australia?",
+        "can i work part time while studying in the usa",
+        "which documents are needed for a CAS letter",
+        "I have 5.5 bands, which universities can I apply to?",
+        "what is the GS statement for australia",
+        "do i need to pay the IHS fee for the uk visa",
+    ]),
+    "voice": (10, None),
+}
+
+_request = contextvars.ContextVar("loadtest_request", default=None)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=300, help="distinct chats sending messages")
+    parser.add_argument("--whatsapp-share", type=float, default=0.4)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--llm-latency", default="lognormal:0.6,0.4", help="fake LLM latency distribution")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--provider-latency", type=float, default=0.02, help="seconds per faked Telegram/WhatsApp call")
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("--no-tracemalloc", action="store_true", help="skip Python heap tracking (lower overhead)")
+    parser.add_argument("--output", default="loadtest_results.json")
+    parser.add_argument("--baseline", help="previous results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed relative slowdown vs baseline")
+    return parser.parse_args()
+
+
+def configure_env(args):
+    # Must run before any app module is imported: they read the environment at import time
+    if not os.getenv("DATABASE_URL"):
+        path = os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "loadtest.db")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{path}"
+    os.environ["DB_AUTO_CREATE"] = "true"
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["LLM_FAKE_LATENCY"] = args.llm_latency
+    os.environ["LLM_FAKE_ERROR_RATE"] = str(args.llm_error_rate)
+    os.environ["LLM_FAKE_SEED"] = str(args.seed)
+    os.environ["AI_STREAMING"] = "false"
+    os.environ["CACHE_PUBSUB_URL"] = ""
+    os.environ["OUTBOUND_SPOOL_PATH"] = ""
+    os.environ["AI_CACHE_PATH"] = ""
+    # Credentials only need to exist; every provider call hits the mock transport
+    os.environ["TELEGRAM_BOT_TOKEN"] = "loadtest-token"
+    os.environ["WHATSAPP_TOKEN"] = "loadtest-token"
+    os.environ["WHATSAPP_PHONE_NUMBER_ID"] = "100000000000001"
+
+
+class FakeProviders:
+    """httpx mock handler standing in for api.telegram.org and graph.facebook.com."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = Counter()
+        self.message_id = 0
+
+    async def __call__(self, request):
+        import httpx
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.message_id += 1
+        if request.url.host == "api.telegram.org":
+            if request.url.path.startswith("/file/"):
+                self.calls["telegram.file"] += 1
+                return httpx.Response(200, content=b"OggS" + bytes(14000))
+            method = request.url.path.rsplit("/", 1)[-1]
+            self.calls["telegram." + method] += 1
+            if method == "getFile":
+                file_id = request.url.params.get("file_id")
+                return httpx.Response(200, json={"ok": True, "result": {
+                    "file_id": file_id, "file_size": 14000, "file_path": f"voice/{file_id}.oga"}})
+            return httpx.Response(200, json={"ok": True, "result": {"message_id": self.message_id}})
+        self.calls["whatsapp.messages"] += 1
+        return httpx.Response(200, json={
+            "messaging_product": "whatsapp",
+            "messages": [{"id": f"wamid.loadtest.{self.message_id}"}],
+        })
+
+
+def telegram_payload(update_id: int, chat_id: int, text: str = None) -> dict:
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+    }
+    if text is None:
+        message["voice"] = {"file_id": f"voice-{update_id}", "file_unique_id": f"v{update_id}",
+                            "duration": 7, "mime_type": "audio/ogg", "file_size": 14000}
+    else:
+        message["text"] = text
+    return {"update_id": update_id, "message": message}
+
+
+def whatsapp_payload(update_id: int, wa_id: str, text: str) -> dict:
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "loadtest",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"phone_number_id": os.environ["WHATSAPP_PHONE_NUMBER_ID"]},
+                    "contacts": [{"wa_id": wa_id, "profile": {"name": "Load"}}],
+                    "messages": [{
+                        "from": wa_id,
+                        "id": f"wamid.in.{update_id}",
+                        "timestamp": str(int(time.time())),
+                        "type": "text",
+                        "text": {"body": text},
+                    }],
+                },
+            }],
+        }],
+    }
+
+
+def build_plan(args, total: int, rng: random.Random, first_id: int) -> list:
+    names = list(SCENARIOS)
+    weights = [SCENARIOS[name][0] for name in names]
+    plan = []
+    for offset in range(total):
+        update_id = first_id + offset
+        scenario = rng.choices(names, weights)[0]
+        messages = SCENARIOS[scenario][1]
+        user = rng.randrange(args.users)
+        if scenario != "voice" and rng.random() < args.whatsapp_share:
+            payload = whatsapp_payload(update_id, f"92300{user:07d}", rng.choice(messages))
+            plan.append((scenario, "whatsapp", "/api/whatsapp/webhook", payload))
+        else:
+            text = None if messages is None else rng.choice(messages)
+            payload = telegram_payload(update_id, 500000 + user, text)
+            plan.append((scenario, "telegram", "/api/telegram/webhook", payload))
+    return plan
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def at(q):
+        # Nearest-rank
+        return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+    return {
+        "p50": round(at(0.50) * 1000, 3),
+        "p95": round(at(0.95) * 1000, 3),
+        "p99": round(at(0.99) * 1000, 3),
+        "max": round(ordered[-1] * 1000, 3),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 3),
+    }
+
+
+async def fire(client, plan: list, concurrency: int) -> list:
+    results = []
+    items = iter(plan)
+
+    async def worker():
+        for scenario, channel, path, payload in items:
+            record = {"scenario": scenario, "channel": channel, "db": 0}
+            token = _request.set(record)
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=payload)
+                record["code"] = response.status_code
+                record["status"] = response.json().get("status") if response.status_code == 200 else None
+            except Exception as e:
+                record["code"] = None
+                record["status"] = f"error: {type(e).__name__}"
+            finally:
+                record["seconds"] = time.perf_counter() - started
+                _request.reset(token)
+            results.append(record)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def summarize(results: list, duration: float) -> dict:
+    errors = [r for r in results if r["code"] != 200]
+    db_total = sum(r["db"] for r in results)
+    return {
+        "requests": len(results),
+        "errors": len(errors),
+        "duration_seconds": round(duration, 3),
+        "rps": round(len(results) / duration, 2) if duration else 0.0,
+        "latency_ms": percentiles([r["seconds"] for r in results]),
+        "db_round_trips_per_request": round(db_total / len(results), 3) if results else 0.0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(rss / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+
+async def run(args) -> dict:
+    import httpx
+    from sqlalchemy import event
+    from app.main import app
+    from app.db.database import engine
+    from app.services.http_client import set_transport
+    from app.services.outbound import get_outbound_metrics
+    from app.services.ai_gateway import get_gateway_metrics
+    from app.services.llm import get_llm
+
+    # SQL echo would dominate the timings
+    engine.sync_engine.echo = False
+    db_counter = {"statements": 0}
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        db_counter["statements"] += 1
+        record = _request.get()
+        if record is not None:
+            record["db"] += 1
+
+    providers = FakeProviders(args.provider_latency)
+    await set_transport(httpx.MockTransport(providers))
+
+    rng = random.Random(args.seed)
+    warmup = build_plan(args, args.warmup, rng, 1)
+    plan = build_plan(args, args.requests, rng, args.warmup + 1)
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            await fire(client, warmup, args.concurrency)
+
+            if not args.no_tracemalloc:
+                tracemalloc.start()
+            statements_before = db_counter["statements"]
+            started = time.perf_counter()
+            results = await fire(client, plan, args.concurrency)
+            duration = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+            tracemalloc.stop()
+            statements_in_run = db_counter["statements"] - statements_before
+
+            # Let queued replies reach the fake providers before shutdown
+            drain_started = time.perf_counter()
+            while get_outbound_metrics()["pending"] and time.perf_counter() - drain_started < args.drain_timeout:
+                await asyncio.sleep(0.05)
+            drain = time.perf_counter() - drain_started
+
+    summary = summarize(results, duration)
+    # Includes background work (batched chat-log inserts, stats) the per-request count can't see
+    summary["db_statements_total"] = statements_in_run
+    summary["peak_python_heap_mb"] = round(peak / 2 ** 20, 2) if peak is not None else None
+    summary["max_rss_mb"] = max_rss_mb()
+    summary["outbound_drain_seconds"] = round(drain, 3)
+
+    return {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "database": engine.dialect.name,
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "summary": summary,
+        "scenarios": {
+            name: summarize([r for r in results if r["scenario"] == name], duration)
+            for name in SCENARIOS
+        },
+        "channels": {
+            channel: summarize([r for r in results if r["channel"] == channel], duration)
+            for channel in ("telegram", "whatsapp")
+        },
+        "statuses": dict(Counter(str(r["status"]) for r in results)),
+        "provider_calls": dict(providers.calls),
+        "llm_calls": getattr(get_llm(), "calls", None),
+        "outbound": get_outbound_metrics(),
+        "ai_gateway": get_gateway_metrics(),
+    }
+
+
+def compare(current: dict, baseline: dict, allowed: float) -> list:
+    """Return human-readable regressions of current vs baseline."""
+    problems = []
+    checks = [
+        ("latency p95 (ms)", lambda r: r["summary"]["latency_ms"].get("p95"), True),
+        ("latency p99 (ms)", lambda r: r["summary"]["latency_ms"].get("p99"), True),
+        ("db round-trips/request", lambda r: r["summary"]["db_round_trips_per_request"], True),
+        ("requests/sec", lambda r: r["summary"]["rps"], False),
+    ]
+    for name in SCENARIOS:
+        checks.append((f"{name} p95 (ms)", lambda r, n=name: r["scenarios"][n]["latency_ms"].get("p95"), True))
+
+    for label, get, lower_is_better in checks:
+        try:
+            now, before = get(current), get(baseline)
+        except KeyError:
+            continue
+        if not now or not before:
+            continue
+        change = (now - before) / before
+        if (lower_is_better and change > allowed) or (not lower_is_better and -change > allowed):
+            problems.append(f"{label}: {before} -> {now} ({change:+.0%})")
+    return problems
+
+
+def print_report(results: dict):
+    summary = results["summary"]
+    latency = summary["latency_ms"]
+    print(f"\n{summary['requests']} requests in {summary['duration_seconds']}s "
+          f"({summary['rps']} req/s), {summary['errors']} errors, db={results['database']}")
+    print(f"latency ms: p50={latency['p50']} p95={latency['p95']} p99={latency['p99']} max={latency['max']}")
+    print(f"db round-trips/request: {summary['db_round_trips_per_request']} "
+          f"(total statements incl. background: {summary['db_statements_total']})")
+    print(f"peak python heap: {summary['peak_python_heap_mb']} MB, max RSS: {summary['max_rss_mb']} MB")
+    print(f"\n{'scenario':<10}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'db/req':>8}")
+    for name, stats in results["scenarios"].items():
+        if stats["requests"]:
+            ms = stats["latency_ms"]
+            print(f"{name:<10}{stats['requests']:>7}{ms['p50']:>10}{ms['p95']:>10}{ms['p99']:>10}"
+                  f"{stats['db_round_trips_per_request']:>8}")
+
+
+def main():
+    args = parse_args()
+    baseline = None
+    if args.baseline:
+        # Read first: --baseline may be the same file as --output
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    configure_env(args)
+    results = asyncio.run(run(args))
+    print_report(results)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if baseline is not None:
+        problems = compare(results, baseline, args.max_regression)
+        if problems:
+            print(f"\nRegressions vs {args.baseline} (baseline commit {baseline.get('git_commit')}):")
+            for problem in problems:
+                print(f"  - {problem}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.max_regression:.0%} vs {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
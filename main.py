@@ -1,9 +1,29 @@
+import os
+import logging
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from app.api import whatsapp, leads, telegram
-from app.db.database import engine
+from app.db.database import engine, read_engine, dispose_engines
 from app.db.base import Base
+from app.services.http_client import start_http_clients, close_http_clients
+from app.services.outbound import start_outbound_dispatcher, stop_outbound_dispatcher
+from app.services.cache import start_cache_bus, stop_cache_bus
+from app.services.chat_log_writer import start_chat_log_writer, stop_chat_log_writer
+from app.services.stats import start_stats_engine, stop_stats_engine
+from app.services.faq import load_faq_index
+from app.services.idempotency import start_idempotency, stop_idempotency
+from app.services.voice import start_voice_pipeline, stop_voice_pipeline
+from app.services.document_intake import start_document_intake, stop_document_intake
+from app.services.scheduling import start_scheduler, stop_scheduler
+from app.services.campaign_service import start_campaigns, stop_campaigns
+from app.services.instrumentation import configure_logging, instrument_engine, InstrumentationMiddleware
+
+configure_logging()
+logger = logging.getLogger(__name__)
+instrument_engine(engine)
+if read_engine is not engine:
+    instrument_engine(read_engine)
 
 app = FastAPI(title="Study Visa Genie API")
 
@@ -14,33 +34,70 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lead list paging for callers that use the plain-list response
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],
 )
 
+# Per-route latency histograms, DB queries per request, slow-request logs
+app.add_middleware(InstrumentationMiddleware)
+
 # Exception Handling
 @app.middleware("http")
 async def global_exception_handler(request: Request, call_next):
     try:
         return await call_next(request)
     except Exception as exc:
+        logger.exception("Unhandled error on %s %s", request.method, request.url.path)
         return JSONResponse(
             status_code=500,
             content={"message": f"Internal Server Error: {exc}"},
         )
 
-# Startup: Create Tables
+# Startup: Create Tables (fresh/dev databases only; existing ones are migrated with `alembic upgrade head`)
+DB_AUTO_CREATE = os.getenv("DB_AUTO_CREATE", "true").lower() == "true"
+
 @app.on_event("startup")
 async def startup():
-    async with engine.begin() as conn:
-        # Create tables
-        # Import all models here to register them with metadata
-        from app.models.student import Student
-        from app.models.application import VisaApplication
-        from app.models.chat_log import ChatLog
-        from app.models.appointment import Appointment
-        from app.models.document import Document
-        from app.models.admin import AdminUser
-        
-        await conn.run_sync(Base.metadata.create_all)
+    if DB_AUTO_CREATE:
+        async with engine.begin() as conn:
+            # Create tables
+            # Import all models here to register them with metadata
+            from app.models.student import Student
+            from app.models.application import VisaApplication
+            from app.models.chat_log import ChatLog
+            from app.models.appointment import Appointment
+            from app.models.document import Document
+            from app.models.admin import AdminUser
+            from app.models.campaign import Campaign, CampaignRecipient
+
+            await conn.run_sync(Base.metadata.create_all)
+
+    # Outbound messaging: one pooled client for the app lifetime
+    await start_http_clients()
+    await start_outbound_dispatcher()
+    await start_cache_bus()
+    await start_chat_log_writer()
+    await start_stats_engine()
+    await start_idempotency()
+    await start_voice_pipeline()
+    await start_document_intake()
+    await start_scheduler()
+    await start_campaigns()
+    load_faq_index()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_campaigns()
+    await stop_scheduler()
+    await stop_document_intake()
+    await stop_voice_pipeline()
+    await stop_idempotency()
+    await stop_stats_engine()
+    await stop_chat_log_writer()
+    await stop_cache_bus()
+    await stop_outbound_dispatcher()
+    await close_http_clients()
+    await dispose_engines()
 
 # Include Routers
 app.include_router(whatsapp.router, prefix="/api/whatsapp", tags=["WhatsApp"])
@@ -48,6 +105,13 @@ app.include_router(telegram.router, prefix="/api/telegram", tags=["Telegram"])
 app.include_router(leads.router, prefix="/api/leads", tags=["Leads"])
 from app.api import analytics
 app.include_router(analytics.router, prefix="/api/analytics", tags=["Analytics"])
+from app.api import appointments
+app.include_router(appointments.router, prefix="/api/appointments", tags=["Appointments"])
+from app.api import campaigns
+app.include_router(campaigns.router, prefix="/api/campaigns", tags=["Campaigns"])
+from app.api import metrics
+app.include_router(metrics.router, prefix="/api/metrics", tags=["Metrics"])
+app.include_router(metrics.prometheus_router, tags=["Metrics"])
 
 @app.get("/")
 def home():
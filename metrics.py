@@ -0,0 +1,131 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.services.http_client import get_http_metrics
+from app.services.outbound import get_outbound_metrics
+from app.services.cache import get_cache_stats
+from app.services.chat_log_writer import get_chat_log_metrics
+from app.services.broadcast import get_broadcast_metrics
+from app.services.ai_cache import get_ai_cache_metrics
+from app.services.faq import get_faq_metrics
+from app.services.prompt_builder import get_prompt_metrics
+from app.services.progressive import get_streaming_metrics
+from app.services.ai_gateway import get_gateway_metrics
+from app.services.llm import get_llm
+from app.services.idempotency import get_idempotency_metrics
+from app.services.voice import get_voice_metrics
+from app.services.document_intake import get_document_metrics
+from app.services.scheduling import get_scheduling_metrics
+from app.services.campaign_service import get_campaign_metrics
+from app.db.database import get_pool_metrics
+from app.services.instrumentation import get_route_metrics, render_prometheus
+
+router = APIRouter()
+# Served at /metrics for Prometheus scrapers
+prometheus_router = APIRouter()
+
+@router.get("/http")
+async def http_metrics():
+    # Per-provider outbound pool stats (handshakes, pool waits, HTTP/2 usage)
+    return get_http_metrics()
+
+@router.get("/outbound")
+async def outbound_metrics():
+    return get_outbound_metrics()
+
+@router.get("/cache")
+async def cache_metrics():
+    # Hit/miss/eviction counters for every in-process cache
+    return get_cache_stats()
+
+@router.get("/chat-logs")
+async def chat_log_metrics():
+    return get_chat_log_metrics()
+
+@router.get("/broadcast")
+async def broadcast_metrics():
+    return get_broadcast_metrics()
+
+@router.get("/ai-cache")
+async def ai_cache_metrics():
+    # Hit rate and Gemini latency saved by the response cache
+    return get_ai_cache_metrics()
+
+@router.get("/faq")
+async def faq_metrics():
+    return get_faq_metrics()
+
+@router.get("/prompts")
+async def prompt_metrics():
+    # Prompt size (estimated tokens) and Gemini latency per turn
+    return get_prompt_metrics()
+
+@router.get("/streaming")
+async def streaming_metrics():
+    # Time-to-first-token and progressive delivery counters
+    return get_streaming_metrics()
+
+@router.get("/ai-gateway")
+async def ai_gateway_metrics():
+    # Queue depth, in-flight calls and circuit-breaker state
+    return {**get_gateway_metrics(), "backend": get_llm().name}
+
+@router.get("/webhook-dedup")
+async def webhook_dedup_metrics():
+    # Re-delivered Telegram updates / WhatsApp messages dropped before any DB or AI work
+    return get_idempotency_metrics()
+
+@router.get("/voice")
+async def voice_metrics():
+    # Transcription queue depth, outcomes and time spent in the process pool
+    return get_voice_metrics()
+
+@router.get("/documents")
+async def document_metrics():
+    # Intake queue, dedupe hits and background analysis outcomes
+    return get_document_metrics()
+
+@router.get("/scheduling")
+async def scheduling_metrics():
+    # Slot index size, bookings, conflicts caught by the unique index, refreshes
+    return get_scheduling_metrics()
+
+@router.get("/campaigns")
+async def campaign_metrics():
+    # Campaign runs, sends and retries across all campaigns in this worker
+    return get_campaign_metrics()
+
+@router.get("/db")
+async def db_metrics():
+    # Connection pool usage and checkout wait, per engine (primary / replica)
+    return get_pool_metrics()
+
+@router.get("/routes")
+async def route_metrics():
+    # Per-route request count, latency percentiles and average DB queries
+    return get_route_metrics()
+
+
+def _gauges(prefix: str, values: dict, into: dict):
+    for key, value in values.items():
+        name = f"{prefix}_{key}".replace("-", "_").replace(".", "_")
+        if isinstance(value, dict):
+            _gauges(name, value, into)
+        elif isinstance(value, (int, float)):
+            into[name] = int(value) if isinstance(value, bool) else value
+
+@prometheus_router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    gauges = {}
+    _gauges("outbound", get_outbound_metrics(), gauges)
+    _gauges("http", get_http_metrics(), gauges)
+    _gauges("cache", get_cache_stats(), gauges)
+    _gauges("chat_log", get_chat_log_metrics(), gauges)
+    _gauges("ai_gateway", get_gateway_metrics(), gauges)
+    _gauges("ai_cache", get_ai_cache_metrics(), gauges)
+    _gauges("webhook_dedup", get_idempotency_metrics(), gauges)
+    _gauges("voice", get_voice_metrics(), gauges)
+    _gauges("documents", get_document_metrics(), gauges)
+    _gauges("scheduling", get_scheduling_metrics(), gauges)
+    _gauges("campaigns", get_campaign_metrics(), gauges)
+    _gauges("db_pool", get_pool_metrics(), gauges)
+    return PlainTextResponse(render_prometheus(gauges), media_type="text/plain; version=0.0.4")
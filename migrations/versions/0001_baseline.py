@@ -0,0 +1,22 @@
+"""Baseline: schema as created by Base.metadata.create_all
+
+Existing databases should be stamped with this revision
+(`alembic stamp 0001`) before running `alembic upgrade head`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    pass
+
+
+def downgrade():
+    pass
@@ -0,0 +1,38 @@
+"""Composite indexes for the hot query patterns
+
+Built with CREATE INDEX CONCURRENTLY on Postgres so live tables are not
+locked for writes. CONCURRENTLY cannot run inside a transaction, hence
+the autocommit block.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_chat_logs_student_id_created_at", "chat_logs", ["student_id", "created_at"]),
+    ("ix_chat_logs_created_at", "chat_logs", ["created_at"]),
+    ("ix_visa_applications_student_id_created_at", "visa_applications", ["student_id", "created_at"]),
+    ("ix_visa_applications_status", "visa_applications", ["status"]),
+    ("ix_visa_applications_updated_at_id", "visa_applications", ["updated_at", "id"]),
+    ("ix_appointments_student_id_date_time", "appointments", ["student_id", "date_time"]),
+    ("ix_documents_application_id_uploaded_at", "documents", ["application_id", "uploaded_at"]),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,46 @@
+"""One visa application per (student, country)
+
+Webhook retries used to create duplicate applications. Duplicates are merged
+into the most recently updated row (the one counselors edited and the profile
+showed; documents are re-pointed to it) before the unique index is built,
+concurrently on Postgres.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+INDEX = "uq_visa_applications_student_id_country"
+
+# The most recently touched application for the same student and country as {alias}
+KEEP_ID = (
+    "(SELECT keep.id FROM visa_applications keep "
+    "WHERE keep.student_id = {alias}.student_id AND keep.country = {alias}.country "
+    "ORDER BY COALESCE(keep.updated_at, keep.created_at) DESC, keep.id DESC LIMIT 1)"
+)
+
+
+def upgrade():
+    # Rows with a NULL student_id or country have no KEEP_ID and are left as they are
+    op.execute(
+        "UPDATE documents SET application_id = COALESCE(("
+        "SELECT " + KEEP_ID.format(alias="dup") + " FROM visa_applications dup "
+        "WHERE dup.id = documents.application_id), application_id) "
+        "WHERE application_id IS NOT NULL"
+    )
+    op.execute("DELETE FROM visa_applications WHERE id <> " + KEEP_ID.format(alias="visa_applications"))
+
+    with op.get_context().autocommit_block():
+        op.create_index(INDEX, "visa_applications", ["student_id", "country"], unique=True,
+                        if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(INDEX, table_name="visa_applications", if_exists=True, postgresql_concurrently=True)
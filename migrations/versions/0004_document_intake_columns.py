@@ -0,0 +1,39 @@
+"""Document intake metadata: content hash, size, sniffed type, pages, thumbnail
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    ("sha256", sa.String(64)),
+    ("size_bytes", sa.Integer()),
+    ("original_name", sa.String()),
+    ("source", sa.String()),
+    ("mime_type", sa.String()),
+    ("page_count", sa.Integer()),
+    ("thumbnail_url", sa.String()),
+]
+
+
+def upgrade():
+    # Nullable columns without defaults: a metadata-only change on Postgres
+    for name, column_type in COLUMNS:
+        op.add_column("documents", sa.Column(name, column_type, nullable=True))
+
+    with op.get_context().autocommit_block():
+        op.create_index("ix_documents_sha256", "documents", ["sha256"], if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_documents_sha256", table_name="documents", if_exists=True, postgresql_concurrently=True)
+    for name, _ in reversed(COLUMNS):
+        op.drop_column("documents", name)
@@ -0,0 +1,38 @@
+"""Appointment office/seat and a no-double-booking constraint
+
+A partial unique index on (office, date_time, seat) over scheduled rows:
+cancelled appointments free their slot. Legacy rows have no office, and
+NULLs never conflict.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+INDEX = "uq_appointments_office_date_time_seat"
+
+
+def upgrade():
+    op.add_column("appointments", sa.Column("office", sa.String(), nullable=True))
+    op.add_column("appointments", sa.Column("seat", sa.Integer(), nullable=True))
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            INDEX, "appointments", ["office", "date_time", "seat"], unique=True, if_not_exists=True,
+            postgresql_concurrently=True,
+            postgresql_where=sa.text("status = 'scheduled'"), sqlite_where=sa.text("status = 'scheduled'"),
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(INDEX, table_name="appointments", if_exists=True, postgresql_concurrently=True)
+    op.drop_column("appointments", "seat")
+    op.drop_column("appointments", "office")
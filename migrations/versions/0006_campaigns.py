@@ -0,0 +1,54 @@
+"""Campaigns and per-recipient outcomes
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "campaigns",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String()),
+        sa.Column("channel", sa.String()),
+        sa.Column("message", sa.Text()),
+        sa.Column("country", sa.String(), nullable=True),
+        sa.Column("application_status", sa.String(), nullable=True),
+        sa.Column("state", sa.String()),
+        sa.Column("last_student_id", sa.Integer()),
+        sa.Column("sent_count", sa.Integer()),
+        sa.Column("failed_count", sa.Integer()),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_campaigns_id", "campaigns", ["id"])
+
+    op.create_table(
+        "campaign_recipients",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("campaign_id", sa.Integer(), sa.ForeignKey("campaigns.id")),
+        sa.Column("student_id", sa.Integer(), sa.ForeignKey("students.id")),
+        sa.Column("status", sa.String()),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("attempts", sa.Integer()),
+        sa.Column("sent_at", sa.DateTime(), nullable=True),
+    )
+    # New, empty tables: no need for CONCURRENTLY
+    op.create_index("ix_campaign_recipients_id", "campaign_recipients", ["id"])
+    op.create_index("uq_campaign_recipients_campaign_id_student_id", "campaign_recipients",
+                    ["campaign_id", "student_id"], unique=True)
+    op.create_index("ix_campaign_recipients_campaign_id_status", "campaign_recipients", ["campaign_id", "status"])
+
+
+def downgrade():
+    op.drop_table("campaign_recipients")
+    op.drop_table("campaigns")
@@ -0,0 +1,21 @@
+"""Campaign runner lease, so only one worker runs a campaign at a time
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("campaigns", sa.Column("lease_expires_at", sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("campaigns", "lease_expires_at")
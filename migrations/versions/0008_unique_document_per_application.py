@@ -0,0 +1,34 @@
+"""One document row per (application, file hash)
+
+Concurrent intake of the same file could insert it twice. Later duplicates are
+removed before the unique index is built, concurrently on Postgres.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+INDEX = "uq_documents_application_id_sha256"
+
+
+def upgrade():
+    op.execute(
+        "DELETE FROM documents WHERE sha256 IS NOT NULL AND id > ("
+        "SELECT MIN(keep.id) FROM documents keep "
+        "WHERE keep.application_id = documents.application_id AND keep.sha256 = documents.sha256)"
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(INDEX, "documents", ["application_id", "sha256"], unique=True,
+                        if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(INDEX, table_name="documents", if_exists=True, postgresql_concurrently=True)
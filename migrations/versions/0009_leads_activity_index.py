@@ -0,0 +1,32 @@
+"""Leads list keyset on coalesce(updated_at, created_at)
+
+Legacy applications have no updated_at. The list orders by the coalesced
+value, so the plain (updated_at, id) index is replaced by an expression index.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+OLD_INDEX = "ix_visa_applications_updated_at_id"
+INDEX = "ix_visa_applications_activity_at_id"
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(INDEX, "visa_applications", [sa.text("(coalesce(updated_at, created_at))"), "id"],
+                        if_not_exists=True, postgresql_concurrently=True)
+        op.drop_index(OLD_INDEX, table_name="visa_applications", if_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(OLD_INDEX, "visa_applications", ["updated_at", "id"], if_not_exists=True, postgresql_concurrently=True)
+        op.drop_index(INDEX, table_name="visa_applications", if_exists=True, postgresql_concurrently=True)
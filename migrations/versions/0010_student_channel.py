@@ -0,0 +1,32 @@
+"""Record which channel each student wrote from
+
+whatsapp_id holds either a WhatsApp number or a Telegram chat id; campaigns
+need to know which. Students who sent documents get the documents' source;
+the rest are filled in by their next message.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("students", sa.Column("channel", sa.String(), nullable=True))
+    op.execute(
+        "UPDATE students SET channel = ("
+        "SELECT documents.source FROM documents "
+        "JOIN visa_applications ON visa_applications.id = documents.application_id "
+        "WHERE visa_applications.student_id = students.id AND documents.source IS NOT NULL "
+        "ORDER BY documents.id DESC LIMIT 1)"
+    )
+
+
+def downgrade():
+    op.drop_column("students", "channel")
@@ -0,0 +1,21 @@
+"""Campaign lease owner, so a runner that lost its lease cannot renew it
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0011"
+down_revision = "0010"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("campaigns", sa.Column("lease_owner", sa.String(32), nullable=True))
+
+
+def downgrade():
+    op.drop_column("campaigns", "lease_owner")
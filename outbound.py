@@ -0,0 +1,345 @@
+import os
+import logging
+import json
+import time
+import random
+import asyncio
+import sqlite3
+import threading
+from collections import deque, OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", "4"))
+OUTBOUND_MAX_PENDING = int(os.getenv("OUTBOUND_MAX_PENDING", "10000"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "5"))
+OUTBOUND_BACKOFF_BASE = float(os.getenv("OUTBOUND_BACKOFF_BASE", "0.5"))
+OUTBOUND_BACKOFF_MAX = float(os.getenv("OUTBOUND_BACKOFF_MAX", "30"))
+# Empty disables the spool; with several uvicorn workers give each its own file
+OUTBOUND_SPOOL_PATH = os.getenv("OUTBOUND_SPOOL_PATH", "")
+
+# (messages per second, burst). Telegram allows ~30 msg/s overall and ~1 msg/s
+# per chat; WhatsApp Cloud API allows ~80 msg/s per number.
+RATE_LIMITS = {
+    "telegram": {
+        "global": (float(os.getenv("TELEGRAM_GLOBAL_RATE", "30")), 30),
+        "chat": (float(os.getenv("TELEGRAM_CHAT_RATE", "1")), 3),
+    },
+    "whatsapp": {
+        "global": (float(os.getenv("WHATSAPP_GLOBAL_RATE", "80")), 80),
+        "chat": (float(os.getenv("WHATSAPP_CHAT_RATE", "1")), 3),
+    },
+}
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        # Seconds until a token is available (0 means one can be taken now)
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+    async def acquire(self):
+        while True:
+            wait = self.delay()
+            if wait == 0:
+                self.tokens -= 1
+                return
+            await asyncio.sleep(wait)
+
+
+# --- Dispatcher state ---
+_pending = {}  # (provider, chat_id) -> deque of messages, in send order
+_ready = None  # asyncio.Queue of chat keys that have work and no worker on them
+_scheduled = set()  # chat keys currently in _ready, being sent, or waiting on a timer
+_size = 0
+_not_full = None
+_workers = []
+_global_buckets = {}
+_chat_buckets = OrderedDict()
+_spool = None
+_spool_lock = threading.Lock()
+_idle_waiters = {}  # chat key -> futures resolved when that chat's queue empties
+_stats = {"queued": 0, "sent": 0, "retried": 0, "dropped": 0}
+
+
+def _senders():
+    # Imported lazily: the API modules import this dispatcher
+    from app.services.telegram_service import deliver_telegram_message
+    from app.api.whatsapp import deliver_whatsapp_message
+    return {"telegram": deliver_telegram_message, "whatsapp": deliver_whatsapp_message}
+
+
+def _chat_bucket(key):
+    bucket = _chat_buckets.get(key)
+    if bucket is None:
+        rate, burst = RATE_LIMITS[key[0]]["chat"]
+        bucket = _chat_buckets[key] = TokenBucket(rate, burst)
+        if len(_chat_buckets) > MAX_CHAT_BUCKETS:
+            # An evicted chat just starts again with a full burst
+            _chat_buckets.popitem(last=False)
+    else:
+        _chat_buckets.move_to_end(key)
+    return bucket
+
+
+# --- SQLite spool (survives restarts) ---
+
+def _spool_open(path: str):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS outbound_spool ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, provider TEXT, chat_id TEXT, "
+        "payload TEXT, created_at REAL)"
+    )
+    conn.commit()
+    return conn
+
+
+def _spool_insert(provider: str, chat_id: str, text: str) -> int:
+    with _spool_lock:
+        cursor = _spool.execute(
+            "INSERT INTO outbound_spool (provider, chat_id, payload, created_at) VALUES (?, ?, ?, ?)",
+            (provider, chat_id, json.dumps({"text": text}), time.time()),
+        )
+        _spool.commit()
+        return cursor.lastrowid
+
+
+def _spool_delete(spool_id: int):
+    with _spool_lock:
+        _spool.execute("DELETE FROM outbound_spool WHERE id = ?", (spool_id,))
+        _spool.commit()
+
+
+def _spool_load():
+    with _spool_lock:
+        rows = _spool.execute(
+            "SELECT id, provider, chat_id, payload FROM outbound_spool ORDER BY id"
+        ).fetchall()
+    return [
+        {"id": row[0], "provider": row[1], "chat_id": row[2], "text": json.loads(row[3])["text"]}
+        for row in rows
+    ]
+
+
+# --- Queue operations ---
+
+def _schedule(key, delay: float = 0.0):
+    if delay > 0:
+        asyncio.get_running_loop().call_later(delay, _ready.put_nowait, key)
+    else:
+        _ready.put_nowait(key)
+
+
+def _push(message: dict):
+    global _size
+    key = (message["provider"], message["chat_id"])
+    _pending.setdefault(key, deque()).append(message)
+    _size += 1
+    if _size >= OUTBOUND_MAX_PENDING:
+        _not_full.clear()
+    if key not in _scheduled:
+        _scheduled.add(key)
+        _schedule(key)
+
+
+async def _finish(key, message: dict):
+    global _size
+    queue = _pending[key]
+    queue.popleft()
+    _size -= 1
+    if _size < OUTBOUND_MAX_PENDING:
+        _not_full.set()
+    if message.get("id") is not None:
+        await asyncio.to_thread(_spool_delete, message["id"])
+    if not queue:
+        del _pending[key]
+        for waiter in _idle_waiters.pop(key, []):
+            if not waiter.done():
+                waiter.set_result(True)
+
+
+def _retry_after(response) -> float:
+    try:
+        return float(response.json().get("parameters", {}).get("retry_after"))
+    except Exception:
+        pass
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _backoff(attempt: int) -> float:
+    delay = min(OUTBOUND_BACKOFF_MAX, OUTBOUND_BACKOFF_BASE * (2 ** attempt))
+    return delay * (0.5 + random.random() / 2)
+
+
+async def _send_head(key, senders) -> float:
+    """Try the oldest message for a chat. Returns a delay if it must wait."""
+    message = _pending[key][0]
+
+    wait = message.get("not_before", 0) - time.monotonic()
+    if wait > 0:
+        return wait
+
+    chat_bucket = _chat_bucket(key)
+    wait = chat_bucket.delay()
+    if wait > 0:
+        return wait
+    chat_bucket.take()
+    await _global_buckets[key[0]].acquire()
+
+    retry_in = None
+    try:
+        response = await senders[key[0]](message["chat_id"], message["text"])
+        if response is None or response.is_success:
+            _stats["sent"] += 1
+        elif response.status_code == 429:
+            retry_in = _retry_after(response) or _backoff(message.get("attempts", 0))
+        elif response.status_code >= 500:
+            retry_in = _backoff(message.get("attempts", 0))
+        else:
+            logger.error("Outbound %s message to %s rejected: %s %s", key[0], key[1], response.status_code, response.text)
+            _stats["dropped"] += 1
+    except Exception as e:
+        # Network errors are worth retrying too
+        logger.warning("Outbound %s send failed: %s", key[0], e)
+        retry_in = _backoff(message.get("attempts", 0))
+
+    if retry_in is not None:
+        message["attempts"] = message.get("attempts", 0) + 1
+        if message["attempts"] <= OUTBOUND_MAX_RETRIES:
+            _stats["retried"] += 1
+            message["not_before"] = time.monotonic() + retry_in
+            return retry_in
+        logger.error("Outbound %s message to %s dropped after %d retries", key[0], key[1], OUTBOUND_MAX_RETRIES)
+        _stats["dropped"] += 1
+
+    await _finish(key, message)
+    return 0.0
+
+
+async def _worker():
+    senders = _senders()
+    while True:
+        key = await _ready.get()
+        try:
+            delay = await _send_head(key, senders)
+        except Exception:
+            logger.exception("Outbound worker error")
+            delay = _backoff(0)
+
+        # One message per turn, so a chatty or rate-limited chat never holds a worker
+        if key in _pending:
+            _schedule(key, delay)
+        else:
+            _scheduled.discard(key)
+
+
+def _ensure_started():
+    global _ready, _not_full
+    if _workers:
+        return
+    _ready = asyncio.Queue()
+    _not_full = asyncio.Event()
+    _not_full.set()
+    for provider, limits in RATE_LIMITS.items():
+        _global_buckets[provider] = TokenBucket(*limits["global"])
+    for _ in range(OUTBOUND_WORKERS):
+        _workers.append(asyncio.create_task(_worker()))
+
+
+async def start_outbound_dispatcher():
+    global _spool
+    _ensure_started()
+    if OUTBOUND_SPOOL_PATH and _spool is None:
+        _spool = _spool_open(OUTBOUND_SPOOL_PATH)
+        restored = await asyncio.to_thread(_spool_load)
+        for message in restored:
+            _push(message)
+        if restored:
+            logger.info("Outbound dispatcher restored %d spooled messages", len(restored))
+
+
+async def stop_outbound_dispatcher(timeout: float = 5.0):
+    global _spool
+    # Give in-flight replies a chance to go out; whatever is left stays spooled
+    deadline = time.monotonic() + timeout
+    while _size and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    if _spool is not None:
+        _spool.close()
+        _spool = None
+
+
+async def enqueue_message(provider: str, chat_id: str, text: str):
+    """Queue a reply; returns once it is accepted (and spooled, if enabled)."""
+    _ensure_started()
+    # Backpressure: hold the caller while the dispatcher is saturated
+    await _not_full.wait()
+
+    message = {"provider": provider, "chat_id": str(chat_id), "text": text}
+    if _spool is not None:
+        message["id"] = await asyncio.to_thread(_spool_insert, provider, message["chat_id"], text)
+    _stats["queued"] += 1
+    _push(message)
+
+
+async def acquire_send_slot(provider: str, chat_id: str):
+    """Wait for the chat and provider rate limits before a direct (unqueued) call."""
+    _ensure_started()
+    key = (provider, str(chat_id))
+    chat_bucket = _chat_bucket(key)
+    await chat_bucket.acquire()
+    await _global_buckets[provider].acquire()
+
+
+async def wait_chat_idle(provider: str, chat_id: str, timeout: float) -> bool:
+    """Wait until nothing is queued for this chat, so a direct send can't overtake it. False on timeout."""
+    key = (provider, str(chat_id))
+    if key not in _pending:
+        return True
+    waiter = asyncio.get_running_loop().create_future()
+    _idle_waiters.setdefault(key, []).append(waiter)
+    try:
+        return await asyncio.wait_for(waiter, timeout=timeout)
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        waiters = _idle_waiters.get(key)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del _idle_waiters[key]
+
+
+def get_outbound_metrics() -> dict:
+    return {**_stats, "pending": _size, "chats_pending": len(_pending), "workers": len(_workers)}
@@ -0,0 +1,142 @@
+import os
+import re
+import time
+from dotenv import load_dotenv
+from app.services.outbound import enqueue_message, acquire_send_slot, wait_chat_idle
+from app.services.telegram_service import send_telegram_message_returning_id, edit_telegram_message
+
+load_dotenv()
+
+AI_STREAMING = os.getenv("AI_STREAMING", "false").lower() == "true"
+# Telegram tolerates roughly one edit per second per chat
+TELEGRAM_EDIT_INTERVAL = float(os.getenv("TELEGRAM_EDIT_INTERVAL", "1.0"))
+# WhatsApp has no edits, so send complete sentences once this much text is ready
+WHATSAPP_MIN_CHUNK_CHARS = int(os.getenv("WHATSAPP_MIN_CHUNK_CHARS", "160"))
+# How long a streamed reply waits for earlier queued replies to the chat before it stops streaming
+STREAM_ORDER_WAIT = float(os.getenv("STREAM_ORDER_WAIT", "5"))
+
+_SENTENCE_END = re.compile(r"[.!?](\s|$)|\n")
+
+_stats = {
+    "streams": 0,
+    "first_token_count": 0,
+    "first_token_seconds": 0.0,
+    "first_token_max": 0.0,
+    "first_delivery_seconds": 0.0,
+    "telegram_edits": 0,
+    "whatsapp_chunks": 0,
+    "queued_fallbacks": 0,
+}
+
+
+def _record_first_token(seconds: float):
+    _stats["first_token_count"] += 1
+    _stats["first_token_seconds"] += seconds
+    _stats["first_token_max"] = max(_stats["first_token_max"], seconds)
+
+
+async def _timed(chunks, started: float):
+    first = True
+    async for chunk in chunks:
+        if first:
+            _record_first_token(time.perf_counter() - started)
+            first = False
+        yield chunk
+
+
+async def _telegram(chat_id: str, chunks, started: float) -> str:
+    text = ""
+    message_id = None
+    # Direct sends bypass the outbound queue; after a failure the answer goes through it once, at the end
+    direct = True
+    last_edit = 0.0
+    shown = ""
+
+    async for chunk in chunks:
+        text += chunk
+        if not direct:
+            continue
+        if message_id is None:
+            # Replies already queued for this chat go first (per-chat ordering)
+            if not await wait_chat_idle("telegram", chat_id, STREAM_ORDER_WAIT):
+                direct = False
+                continue
+            # First words go out as soon as they exist
+            await acquire_send_slot("telegram", chat_id)
+            message_id = await send_telegram_message_returning_id(chat_id, text)
+            if message_id is None:
+                direct = False
+                continue
+            _stats["first_delivery_seconds"] += time.perf_counter() - started
+            shown, last_edit = text, time.monotonic()
+        elif time.monotonic() - last_edit >= TELEGRAM_EDIT_INTERVAL:
+            # Partial Markdown may not parse, so intermediate edits are plain text
+            await acquire_send_slot("telegram", chat_id)
+            if await edit_telegram_message(chat_id, message_id, text):
+                _stats["telegram_edits"] += 1
+            shown, last_edit = text, time.monotonic()
+
+    text = text.strip()
+    if message_id is None:
+        if text:
+            _stats["queued_fallbacks"] += 1
+            await enqueue_message("telegram", chat_id, text)
+        return text
+
+    await acquire_send_slot("telegram", chat_id)
+    if not await edit_telegram_message(chat_id, message_id, text, parse_mode="Markdown"):
+        if text != shown.strip():
+            await edit_telegram_message(chat_id, message_id, text)
+    _stats["telegram_edits"] += 1
+    return text
+
+
+async def _sentences(channel: str, chat_id: str, chunks, started: float) -> str:
+    full = ""
+    buffer = ""
+    first = True
+
+    async for chunk in chunks:
+        full += chunk
+        buffer += chunk
+        if len(buffer) < WHATSAPP_MIN_CHUNK_CHARS:
+            continue
+        # Cut at the last sentence boundary seen so far
+        ends = [match.end() for match in _SENTENCE_END.finditer(buffer)]
+        if not ends:
+            continue
+        ready, buffer = buffer[:ends[-1]].strip(), buffer[ends[-1]:]
+        if ready:
+            await enqueue_message(channel, chat_id, ready)
+            _stats["whatsapp_chunks"] += 1
+            if first:
+                _stats["first_delivery_seconds"] += time.perf_counter() - started
+                first = False
+
+    if buffer.strip():
+        await enqueue_message(channel, chat_id, buffer.strip())
+        _stats["whatsapp_chunks"] += 1
+    return full.strip()
+
+
+async def deliver_progressively(channel: str, chat_id: str, chunks) -> str:
+    """Deliver a streamed answer as it arrives; returns the final text."""
+    _stats["streams"] += 1
+    started = time.perf_counter()
+    timed = _timed(chunks, started)
+    if channel == "telegram":
+        return await _telegram(chat_id, timed, started)
+    return await _sentences(channel, chat_id, timed, started)
+
+
+def get_streaming_metrics() -> dict:
+    count = _stats["first_token_count"] or 1
+    streams = _stats["streams"] or 1
+    return {
+        **_stats,
+        "enabled": AI_STREAMING,
+        "avg_first_token_seconds": round(_stats["first_token_seconds"] / count, 4),
+        "avg_first_delivery_seconds": round(_stats["first_delivery_seconds"] / streams, 4),
+        "first_token_seconds": round(_stats["first_token_seconds"], 4),
+        "first_delivery_seconds": round(_stats["first_delivery_seconds"], 4),
+    }
@@ -0,0 +1,204 @@
+import os
+import re
+from datetime import datetime
+from sqlalchemy.future import select
+from dotenv import load_dotenv
+from app.db.database import AsyncSessionLocal
+from app.models.chat_log import ChatLog
+from app.services.chat_log_writer import pending_entries, entry_key
+
+load_dotenv()
+
+# Recent turns sent verbatim; older ones are folded into a rolling summary
+HISTORY_TURNS = int(os.getenv("PROMPT_HISTORY_TURNS", "8"))
+# Summarize once this many turns have scrolled out of the verbatim window
+SUMMARY_BATCH = int(os.getenv("PROMPT_SUMMARY_BATCH", "10"))
+# Cap on unsummarized turns loaded per AI turn (only reached by long pre-summary histories)
+SUMMARY_MAX_TURNS = int(os.getenv("PROMPT_SUMMARY_MAX_TURNS", "200"))
+# Budget for the per-turn prompt (the system instruction is sent separately)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1200"))
+
+SYSTEM_PROMPT = """
+You are the AI assistant for **Dashboard Visa Business**, an expert Study Visa Consultancy based in **Pakistan**.
+Your name is 'VisaBot'.
+
+Your Context:
+- **Target Audience**: Pakistani Students (Matric, FSc, O/A Levels).
+- **Currency**: Convert costs to **PKR (Lakhs/Crores)** where helpful (Approx 1 USD = 280 PKR).
+- **Local Docs**: Mention FRC (Family Registration Certificate), Polio Card, and IBCC attestation.
+
+Your goal is to:
+1. EXCLUSIVELY discuss **Study Visas** for Canada, UK, USA, and Australia.
+2. Collect student details if missing (Name, Age, Target Country).
+3. Guide them to "Apply Now".
+
+If asked about other topics (cooking, sports, etc.), politely decline and steer back to Study Visas.
+Keep responses concise (max 3 sentences) suitable for WhatsApp/Telegram.
+"""
+
+SUMMARY_KEY = "conversation_summary"
+
+# Words that point back into the conversation ("what about that one?"); such questions need the history
+_FOLLOW_UP = re.compile(r"\b(it|its|that|this|those|these|them|they|above|earlier|previous|same|else|more|again)\b")
+
+_stats = {"prompts": 0, "prompt_tokens": 0, "max_prompt_tokens": 0, "trimmed_turns": 0,
+          "llm_calls": 0, "llm_seconds": 0.0, "summaries": 0}
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting English/Roman Urdu
+    return len(text) // 4 + 1
+
+
+async def _load_turns(student_id: int, limit: int, after: datetime = None) -> list:
+    query = (
+        select(ChatLog.student_id, ChatLog.sender, ChatLog.message, ChatLog.created_at)
+        .where(ChatLog.student_id == student_id)
+        .order_by(ChatLog.created_at.desc(), ChatLog.id.desc())
+        .limit(limit)
+    )
+    if after is not None:
+        query = query.where(ChatLog.created_at > after)
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(query)
+        return [
+            {"student_id": row.student_id, "sender": row.sender, "message": row.message, "created_at": row.created_at}
+            for row in reversed(result.all())
+        ]
+
+
+async def load_recent_turns(student_id: int, context: dict = None, exclude: tuple = None) -> list:
+    """Every turn not yet in the summary (at least the verbatim window), oldest first (incl. unflushed).
+
+    `exclude` is the entry_key of a row to leave out, e.g. the message being answered.
+    """
+    if not student_id:
+        return []
+    through = _summary(context).get("through")
+    through = datetime.fromisoformat(through) if through else None
+    rows = await _load_turns(student_id, SUMMARY_MAX_TURNS, after=through)
+    if len(rows) < HISTORY_TURNS:
+        # Few new turns since the summary: the prompt still gets the full verbatim window
+        rows = await _load_turns(student_id, HISTORY_TURNS)
+
+    seen = {entry_key(r["student_id"], r["sender"], r["message"], r["created_at"]) for r in rows}
+    for row in pending_entries(student_id):
+        if entry_key(row["student_id"], row["sender"], row["message"], row["created_at"]) not in seen:
+            rows.append(row)
+    if exclude is not None:
+        rows = [r for r in rows if entry_key(r["student_id"], r["sender"], r["message"], r["created_at"]) != exclude]
+    return rows
+
+
+def _summary(context: dict) -> dict:
+    return ((context or {}).get("profile_data") or {}).get(SUMMARY_KEY) or {}
+
+
+def is_context_free(context: dict = None, history: list = None) -> bool:
+    """True if there is no conversation yet (history or summary)."""
+    return not history and not _summary(context).get("text")
+
+
+def is_shareable(user_message: str, context: dict = None, history: list = None, has_notes: bool = False) -> bool:
+    """True if this turn can be answered from the shared prompt (see build_shared_prompt).
+
+    A student's first question qualifies, and so does a later one that matched the FAQ notes
+    and does not refer back to the conversation.
+    """
+    if is_context_free(context, history):
+        return True
+    return has_notes and not _FOLLOW_UP.search(user_message.lower())
+
+
+def build_prompt(user_message: str, context: dict = None, history: list = None, notes: str = "") -> str:
+    """Per-turn prompt: student context, rolling summary, recent turns, question."""
+    context_str = ""
+    if context:
+        name = context.get("name") or "Student"
+        country = context.get("country") or "Unknown"
+        status = context.get("status") or "New"
+        context_str = f"Current Student Context:\n- Name: {name}\n- Interested Info: {country}\n- Application Status: {status}\n"
+
+    summary = _summary(context).get("text")
+    summary_str = f"\nEarlier conversation (summary): {summary}\n" if summary else ""
+    question_str = f"\nUser: {user_message}\nVisaGenie:"
+
+    # Newest turns first until the budget runs out
+    budget = PROMPT_TOKEN_BUDGET - estimate_tokens(context_str + summary_str + notes + question_str)
+    lines = []
+    for turn in reversed((history or [])[-HISTORY_TURNS:]):
+        speaker = "VisaGenie" if turn["sender"] == "bot" else "User"
+        line = f"{speaker}: {turn['message']}"
+        cost = estimate_tokens(line)
+        if cost > budget:
+            _stats["trimmed_turns"] += 1
+            break
+        budget -= cost
+        lines.append(line)
+    history_str = "\nConversation so far:\n" + "\n".join(reversed(lines)) + "\n" if lines else ""
+
+    return _record_prompt(f"{context_str}{summary_str}{notes}{history_str}{question_str}")
+
+
+def build_shared_prompt(user_message: str, context: dict = None, notes: str = "") -> str:
+    """Per-turn prompt without the name, summary or history, so its answer can be cached and shared.
+
+    It only carries what ai_cache.cache_key is built from: country, status and the question
+    (the FAQ notes follow from the question).
+    """
+    context = context or {}
+    country = context.get("country") or "Unknown"
+    status = context.get("status") or "New"
+    context_str = f"Current Student Context:\n- Interested Info: {country}\n- Application Status: {status}\n"
+    return _record_prompt(f"{context_str}{notes}\nUser: {user_message}\nVisaGenie:")
+
+
+def _record_prompt(prompt: str) -> str:
+    tokens = estimate_tokens(prompt)
+    _stats["prompts"] += 1
+    _stats["prompt_tokens"] += tokens
+    _stats["max_prompt_tokens"] = max(_stats["max_prompt_tokens"], tokens)
+    return prompt
+
+
+def record_llm_call(seconds: float):
+    _stats["llm_calls"] += 1
+    _stats["llm_seconds"] += seconds
+
+
+def turns_to_summarize(context: dict, history: list) -> list:
+    """Turns that left the verbatim window after the last summary, once a batch is due."""
+    through = _summary(context).get("through")
+    older = (history or [])[:-HISTORY_TURNS]
+    if through:
+        through = datetime.fromisoformat(through)
+        older = [turn for turn in older if turn["created_at"] > through]
+    return older if len(older) >= SUMMARY_BATCH else []
+
+
+def summary_prompt(previous: str, turns: list) -> str:
+    transcript = "\n".join(
+        f"{'VisaGenie' if turn['sender'] == 'bot' else 'User'}: {turn['message']}" for turn in turns
+    )
+    return (
+        "Update the running summary of a study-visa counselling chat. Keep facts the counselor needs "
+        "(name, age, education, target country, budget, test scores, concerns). Max 80 words.\n\n"
+        f"Current summary: {previous or 'None'}\n\nNew messages:\n{transcript}\n\nUpdated summary:"
+    )
+
+
+def summary_update(text: str, turns: list) -> dict:
+    _stats["summaries"] += 1
+    return {SUMMARY_KEY: {"text": text, "through": turns[-1]["created_at"].isoformat()}}
+
+
+def get_prompt_metrics() -> dict:
+    prompts = _stats["prompts"] or 1
+    calls = _stats["llm_calls"] or 1
+    return {
+        **_stats,
+        "llm_seconds": round(_stats["llm_seconds"], 3),
+        "avg_prompt_tokens": round(_stats["prompt_tokens"] / prompts, 1),
+        "avg_llm_seconds": round(_stats["llm_seconds"] / calls, 3),
+        "system_prompt_tokens": estimate_tokens(SYSTEM_PROMPT),
+    }
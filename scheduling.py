@@ -0,0 +1,366 @@
+import os
+import re
+import asyncio
+import logging
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import datetime, date, time, timedelta, timezone
+from dotenv import load_dotenv
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.future import select
+from app.db.database import AsyncSessionLocal
+from app.models.appointment import Appointment
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+try:
+    from zoneinfo import ZoneInfo
+    PKT = ZoneInfo("Asia/Karachi")
+except Exception:
+    # No tz database (e.g. Windows without tzdata); Pakistan has no DST
+    PKT = timezone(timedelta(hours=5), "PKT")
+
+SLOT_MINUTES = int(os.getenv("APPOINTMENT_SLOT_MINUTES", "30"))
+# Earliest bookable slot, counted from now
+MIN_NOTICE_MINUTES = int(os.getenv("APPOINTMENT_MIN_NOTICE_MINUTES", "60"))
+SEARCH_DAYS = int(os.getenv("APPOINTMENT_SEARCH_DAYS", "14"))
+DEFAULT_OFFICE = os.getenv("APPOINTMENT_DEFAULT_OFFICE", "Online")
+SCHEDULE_REFRESH_INTERVAL = float(os.getenv("SCHEDULE_REFRESH_INTERVAL", "60"))
+
+# Local opening hours (PKT), working weekdays (Mon=0) and counselors available per slot
+OFFICES = {
+    "Lahore": {"hours": (10, 18), "days": {0, 1, 2, 3, 4, 5}, "counselors": int(os.getenv("LAHORE_COUNSELORS", "2"))},
+    "Islamabad": {"hours": (10, 18), "days": {0, 1, 2, 3, 4, 5}, "counselors": int(os.getenv("ISLAMABAD_COUNSELORS", "1"))},
+    "Online": {"hours": (10, 20), "days": {0, 1, 2, 3, 4, 5}, "counselors": int(os.getenv("ONLINE_COUNSELORS", "3"))},
+}
+
+SLOT = timedelta(minutes=SLOT_MINUTES)
+
+
+class SlotIndex:
+    """Scheduled appointments per office, sorted by start time.
+
+    Every appointment lasts one slot, so the bookings overlapping [start, end)
+    are the ones starting in (start - SLOT, end): one bisect plus a short scan.
+    """
+
+    def __init__(self):
+        self._by_office = defaultdict(list)  # office -> sorted [(start_utc, seat, appointment_id)]
+        self._by_id = {}
+
+    def add(self, office: str, start: datetime, seat: int, appointment_id=None):
+        entry = (start, seat, appointment_id or 0)
+        insort(self._by_office[office], entry)
+        if appointment_id:
+            self._by_id[appointment_id] = (office, entry)
+
+    def remove(self, appointment_id: int):
+        found = self._by_id.pop(appointment_id, None)
+        if found is None:
+            return
+        office, entry = found
+        entries = self._by_office[office]
+        position = bisect_left(entries, entry)
+        if position < len(entries) and entries[position] == entry:
+            entries.pop(position)
+
+    def seats_taken(self, office: str, start: datetime, end: datetime) -> set:
+        entries = self._by_office.get(office, [])
+        taken = set()
+        position = bisect_left(entries, (start - SLOT + timedelta(microseconds=1),))
+        while position < len(entries) and entries[position][0] < end:
+            taken.add(entries[position][1])
+            position += 1
+        return taken
+
+    def free_seats(self, office: str, start: datetime) -> list:
+        taken = self.seats_taken(office, start, start + SLOT)
+        return [seat for seat in range(1, OFFICES[office]["counselors"] + 1) if seat not in taken]
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._by_office.values())
+
+
+_index = {"slots": SlotIndex(), "task": None, "loaded_at": None}
+_stats = {"booked": 0, "conflicts": 0, "unavailable": 0, "cancelled": 0, "refreshes": 0}
+
+
+# --- Time helpers (DB stores naive UTC, like every other timestamp here) ---
+
+def now_local() -> datetime:
+    return datetime.now(PKT)
+
+
+def to_utc(local: datetime) -> datetime:
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def to_local(utc: datetime) -> datetime:
+    return utc.replace(tzinfo=timezone.utc).astimezone(PKT)
+
+
+def format_slot(local: datetime) -> str:
+    return f"{local:%a %d %b}, {local.hour % 12 or 12}:{local:%M} {'AM' if local.hour < 12 else 'PM'}"
+
+
+def is_bookable(office: str, local: datetime) -> bool:
+    """Inside opening hours, on the slot grid, and far enough in the future."""
+    hours = OFFICES[office]
+    opens, closes = hours["hours"]
+    minutes = local.hour * 60 + local.minute
+    return (
+        local.weekday() in hours["days"]
+        and opens * 60 <= minutes <= closes * 60 - SLOT_MINUTES
+        and local.minute % SLOT_MINUTES == 0 and local.second == 0
+        and local >= now_local() + timedelta(minutes=MIN_NOTICE_MINUTES)
+    )
+
+
+def available_slots(office: str, after: datetime = None, limit: int = 3) -> list:
+    """Next free slots (local datetimes) for an office, straight from the index."""
+    hours = OFFICES[office]
+    earliest = now_local() + timedelta(minutes=MIN_NOTICE_MINUTES)
+    after = max(after or earliest, earliest)
+    slots = []
+    for offset in range(SEARCH_DAYS + 1):
+        day = (after + timedelta(days=offset)).date()
+        if day.weekday() not in hours["days"]:
+            continue
+        local = datetime.combine(day, time(hours["hours"][0]), tzinfo=PKT)
+        closes = datetime.combine(day, time(hours["hours"][1]), tzinfo=PKT)
+        while local + SLOT <= closes:
+            if local >= after and _index["slots"].free_seats(office, to_utc(local)):
+                slots.append(local)
+                if len(slots) >= limit:
+                    return slots
+            local += SLOT
+    return slots
+
+
+# --- Free-text parsing ("Tomorrow 3 PM", "kal 11am lahore", "25 oct 4:30pm") ---
+
+WEEKDAYS = {name: index for index, names in enumerate([
+    ("monday", "mon"), ("tuesday", "tue", "tues"), ("wednesday", "wed"), ("thursday", "thu", "thur", "thurs"),
+    ("friday", "fri"), ("saturday", "sat"), ("sunday", "sun"),
+]) for name in names}
+MONTHS = {name: index + 1 for index, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"])}
+PARTS_OF_DAY = {"morning": 10, "noon": 12, "afternoon": 15, "evening": 17}
+
+_ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_NUMERIC_DATE = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b")  # day/month, as written in Pakistan
+_DAY_MONTH = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(" + "|".join(MONTHS) + r")[a-z]*\b")
+_MONTH_DAY = re.compile(r"\b(" + "|".join(MONTHS) + r")[a-z]*\s+(\d{1,2})(?:st|nd|rd|th)?\b")
+_RELATIVE = re.compile(r"\b(day after tomorrow|parson|today|tonight|aaj|tomorrow|tmrw|tmr|kal)\b")
+_WEEKDAY = re.compile(r"\b(" + "|".join(sorted(WEEKDAYS, key=len, reverse=True)) + r")\b")
+_TIME = re.compile(r"\b(\d{1,2})(?:[:.](\d{2}))?\s*(am|pm|a\.m\.?|p\.m\.?)?(?![\d/])")
+_OFFICE = re.compile(r"\b(" + "|".join(name.lower() for name in OFFICES) + r"|isb|lhr|zoom|video)\b")
+_OFFICE_ALIASES = {"isb": "Islamabad", "lhr": "Lahore", "zoom": "Online", "video": "Online"}
+
+
+def _resolve_year(month: int, day: int, today: date) -> date:
+    candidate = date(today.year, month, day)
+    return candidate if candidate >= today else date(today.year + 1, month, day)
+
+
+def _parse_day(text: str, today: date):
+    """Returns (date or None, text with the date words removed)."""
+    match = _ISO_DATE.search(text)
+    if match:
+        return date(*map(int, match.groups())), text.replace(match.group(0), " ")
+    match = _DAY_MONTH.search(text)
+    if match:
+        return _resolve_year(MONTHS[match.group(2)[:3]], int(match.group(1)), today), text.replace(match.group(0), " ")
+    match = _MONTH_DAY.search(text)
+    if match:
+        return _resolve_year(MONTHS[match.group(1)[:3]], int(match.group(2)), today), text.replace(match.group(0), " ")
+    match = _NUMERIC_DATE.search(text)
+    if match:
+        day, month, year = match.groups()
+        if year:
+            year = int(year) + (2000 if len(year) == 2 else 0)
+            parsed = date(year, int(month), int(day))
+        else:
+            parsed = _resolve_year(int(month), int(day), today)
+        return parsed, text.replace(match.group(0), " ")
+    match = _RELATIVE.search(text)
+    if match:
+        word = match.group(1)
+        offset = 2 if word in ("day after tomorrow", "parson") else 0 if word in ("today", "tonight", "aaj") else 1
+        return today + timedelta(days=offset), text.replace(match.group(0), " ")
+    match = _WEEKDAY.search(text)
+    if match:
+        # "Monday" said on a Monday means next week
+        ahead = (WEEKDAYS[match.group(1)] - today.weekday()) % 7 or 7
+        return today + timedelta(days=ahead), text.replace(match.group(0), " ")
+    return None, text
+
+
+def _pick_time(text: str):
+    """The number most likely meant as the time: am/pm-qualified, then after "at", then with minutes."""
+    matches = list(_TIME.finditer(text))
+    for match in matches:
+        if match.group(3):
+            return match
+    for match in matches:
+        if re.search(r"(?:\bat|@)\s*$", text[:match.start()]):
+            return match
+    for match in matches:
+        if match.group(2):
+            return match
+    return None
+
+
+def _parse_time(text: str):
+    # "I have 2 questions tomorrow at 4pm": a bare count must not win over the qualified time
+    match = _pick_time(text)
+    if match is None:
+        for word, hour in PARTS_OF_DAY.items():
+            if re.search(rf"\b{word}\b", text):
+                return time(hour)
+        match = _TIME.search(text)
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2) or 0)
+    meridiem = (match.group(3) or "").replace(".", "")
+    if hour > 23 or minute > 59:
+        return None
+    if meridiem == "pm" and hour < 12:
+        hour += 12
+    elif meridiem == "am" and hour == 12:
+        hour = 0
+    elif not meridiem and 1 <= hour <= 7:
+        # "3" in office hours can only mean 3 PM
+        hour += 12
+    return time(hour, minute)
+
+
+def parse_request(text: str, now: datetime = None):
+    """Parse a booking request. Returns (local datetime or None, date or None, office or None)."""
+    now = now or now_local()
+    text = text.lower()
+    office = None
+    match = _OFFICE.search(text)
+    if match:
+        office = _OFFICE_ALIASES.get(match.group(1), match.group(1).title())
+        text = text.replace(match.group(0), " ")
+
+    try:
+        day, rest = _parse_day(text, now.date())
+    except ValueError:
+        # "31/02" and friends
+        return None, None, office
+    at = _parse_time(rest)
+    if at is None:
+        return None, day, office
+    if day is None:
+        # Only a time: today if it is still ahead, else tomorrow
+        day = now.date() if datetime.combine(now.date(), at, tzinfo=PKT) > now else now.date() + timedelta(days=1)
+    return datetime.combine(day, at, tzinfo=PKT), day, office
+
+
+# --- Booking ---
+
+async def book_slot(student_id: int, office: str, local: datetime, notes: str = None):
+    """Book `local` at `office`; returns the Appointment, or None if it can't be had."""
+    if not is_bookable(office, local):
+        _stats["unavailable"] += 1
+        return None
+    start = to_utc(local)
+    for seat in _index["slots"].free_seats(office, start):
+        appointment = Appointment(student_id=student_id, date_time=start, office=office,
+                                  seat=seat, status="scheduled", notes=notes)
+        async with AsyncSessionLocal() as session:
+            session.add(appointment)
+            try:
+                await session.commit()
+            except IntegrityError:
+                # Booked by another worker since our last refresh; the unique index is the arbiter
+                await session.rollback()
+                _stats["conflicts"] += 1
+                _index["slots"].add(office, start, seat)
+                continue
+        _index["slots"].add(office, start, seat, appointment.id)
+        _stats["booked"] += 1
+        return appointment
+    _stats["unavailable"] += 1
+    return None
+
+
+async def cancel_appointment(appointment_id: int) -> bool:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(Appointment)
+            .where(Appointment.id == appointment_id, Appointment.status == "scheduled")
+            .values(status="cancelled")
+        )
+        await session.commit()
+    if not result.rowcount:
+        return False
+    _index["slots"].remove(appointment_id)
+    _stats["cancelled"] += 1
+    return True
+
+
+async def upcoming_appointment(student_id: int):
+    async with AsyncSessionLocal() as session:
+        return await session.scalar(
+            select(Appointment)
+            .where(Appointment.student_id == student_id, Appointment.status == "scheduled",
+                   Appointment.date_time >= datetime.utcnow())
+            .order_by(Appointment.date_time)
+            .limit(1)
+        )
+
+
+# --- Index lifecycle ---
+
+async def load_schedule():
+    """Rebuild the index from the DB (picks up bookings and cancellations made by other workers)."""
+    index = SlotIndex()
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(Appointment.id, Appointment.office, Appointment.date_time, Appointment.seat)
+            .where(Appointment.status == "scheduled", Appointment.office.isnot(None),
+                   Appointment.date_time >= datetime.utcnow() - SLOT)
+        )
+        for row in result:
+            if row.office in OFFICES:
+                index.add(row.office, row.date_time, row.seat or 1, row.id)
+    _index["slots"] = index
+    _index["loaded_at"] = datetime.utcnow()
+    _stats["refreshes"] += 1
+
+
+async def _refresh_loop():
+    while True:
+        await asyncio.sleep(SCHEDULE_REFRESH_INTERVAL)
+        try:
+            await load_schedule()
+        except Exception:
+            logger.exception("Schedule refresh failed")
+
+
+async def start_scheduler():
+    try:
+        await load_schedule()
+    except Exception:
+        logger.exception("Initial schedule load failed")
+    if _index["task"] is None:
+        _index["task"] = asyncio.create_task(_refresh_loop())
+
+
+async def stop_scheduler():
+    task = _index["task"]
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        _index["task"] = None
+
+
+def get_scheduling_metrics() -> dict:
+    return {**_stats, "indexed_appointments": len(_index["slots"]),
+            "loaded_at": _index["loaded_at"].isoformat() if _index["loaded_at"] else None}
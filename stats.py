@@ -0,0 +1,145 @@
+import os
+import logging
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import case, func, select
+from dotenv import load_dotenv
+from app.db.database import AsyncSessionLocal
+from app.models.application import VisaApplication
+from app.models.student import Student
+from app.models.chat_log import ChatLog
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STATS_RECONCILE_INTERVAL = float(os.getenv("STATS_RECONCILE_INTERVAL", "60"))
+# A lead counts as AI-engaged once they have sent this many messages
+ENGAGED_MIN_MESSAGES = int(os.getenv("ENGAGED_MIN_MESSAGES", "2"))
+# Chat-log ids are not committed in order across writers; only scan rows older than this
+STATS_SETTLE_SECONDS = float(os.getenv("STATS_SETTLE_SECONDS", "60"))
+
+_state = {
+    "loaded": False,
+    "total_leads": 0,
+    "by_status": Counter(),
+    "by_country": Counter(),
+    "engaged": 0,
+    # Engagement is counted incrementally: chat_logs rows up to this id are already in "engaged"
+    "last_chat_log_id": 0,
+    "reconciled_at": None,
+    "task": None,
+}
+
+
+def _status_value(status) -> str:
+    return status.value if hasattr(status, "value") else status
+
+
+# --- Incremental updates (called from crm.py / leads.py after commit) ---
+
+def record_student_created():
+    _state["total_leads"] += 1
+
+
+def record_application_created(country: str, status):
+    _state["by_status"][_status_value(status)] += 1
+    _state["by_country"][country] += 1
+
+
+def record_status_change(old_status, new_status):
+    old_status, new_status = _status_value(old_status), _status_value(new_status)
+    if old_status == new_status:
+        return
+    _state["by_status"][old_status] -= 1
+    _state["by_status"][new_status] += 1
+
+
+# --- Reconciliation against the database ---
+
+async def _count_newly_engaged(session, last_id: int, max_id: int) -> int:
+    # Students with user messages in (last_id, max_id] who reached the threshold inside that range
+    user_logs = ChatLog.sender == "user"
+    active = select(ChatLog.student_id).where(user_logs, ChatLog.id > last_id, ChatLog.id <= max_id)
+    crossed = (
+        select(ChatLog.student_id)
+        .where(user_logs, ChatLog.id <= max_id, ChatLog.student_id.in_(active))
+        .group_by(ChatLog.student_id)
+        .having(func.count(ChatLog.id) >= ENGAGED_MIN_MESSAGES)
+        .having(func.sum(case((ChatLog.id <= last_id, 1), else_=0)) < ENGAGED_MIN_MESSAGES)
+        .subquery()
+    )
+    return await session.scalar(select(func.count()).select_from(crossed)) or 0
+
+
+async def reconcile():
+    settled_before = datetime.utcnow() - timedelta(seconds=STATS_SETTLE_SECONDS)
+    async with AsyncSessionLocal() as session:
+        total_leads = await session.scalar(select(func.count(Student.id)))
+        by_status = await session.execute(
+            select(VisaApplication.status, func.count(VisaApplication.id)).group_by(VisaApplication.status)
+        )
+        by_country = await session.execute(
+            select(VisaApplication.country, func.count(VisaApplication.id)).group_by(VisaApplication.country)
+        )
+        last_id = _state["last_chat_log_id"]
+        max_id = await session.scalar(select(func.max(ChatLog.id)).where(ChatLog.created_at < settled_before)) or 0
+        newly_engaged = await _count_newly_engaged(session, last_id, max_id) if max_id > last_id else 0
+
+    _state["total_leads"] = total_leads or 0
+    _state["by_status"] = Counter({_status_value(status): count for status, count in by_status})
+    _state["by_country"] = Counter({country: count for country, count in by_country})
+    _state["engaged"] += newly_engaged
+    _state["last_chat_log_id"] = max(last_id, max_id)
+    _state["reconciled_at"] = asyncio.get_running_loop().time()
+    _state["loaded"] = True
+
+
+async def _reconcile_loop():
+    while True:
+        await asyncio.sleep(STATS_RECONCILE_INTERVAL)
+        try:
+            await reconcile()
+        except Exception:
+            logger.exception("Stats reconcile failed")
+
+
+async def start_stats_engine():
+    try:
+        await reconcile()
+    except Exception:
+        logger.exception("Initial stats reconcile failed")
+    if _state["task"] is None:
+        _state["task"] = asyncio.create_task(_reconcile_loop())
+
+
+async def stop_stats_engine():
+    if _state["task"] is not None:
+        _state["task"].cancel()
+        await asyncio.gather(_state["task"], return_exceptions=True)
+        _state["task"] = None
+
+
+async def get_stats_snapshot() -> dict:
+    if not _state["loaded"]:
+        await reconcile()
+
+    by_status = _state["by_status"]
+    total_applications = sum(by_status.values())
+    total_leads = _state["total_leads"]
+    engagement = (100.0 * _state["engaged"] / total_leads) if total_leads else 0.0
+
+    return {
+        "total_leads": total_leads,
+        "approved_visas": by_status.get("approved", 0),
+        "active_applications": total_applications - by_status.get("rejected", 0),
+        "ai_engagement": f"{engagement:.1f}%",
+        "by_status": {status: count for status, count in by_status.items() if count},
+        "by_country": {country: count for country, count in _state["by_country"].items() if count},
+        # Counts are per process between reconciles; say which worker answered and how fresh it is
+        "worker": {
+            "pid": os.getpid(),
+            "reconciled_seconds_ago": round(asyncio.get_running_loop().time() - _state["reconciled_at"], 1),
+        },
+    }
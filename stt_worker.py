@@ -0,0 +1,24 @@
+"""Speech-to-text, run inside the voice process pool.
+
+Kept free of app imports: every pool process imports this module on start,
+and it must not open database engines or HTTP clients of its own.
+"""
+import io
+
+_model = {"whisper": None}
+
+
+def init_worker(model_size: str, compute_type: str, cpu_threads: int):
+    # Load once per process; a Whisper model takes seconds to load and a few hundred MB
+    from faster_whisper import WhisperModel
+    _model["whisper"] = WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads)
+
+
+def warmup() -> bool:
+    return _model["whisper"] is not None
+
+
+def transcribe(audio: bytes, language: str = None) -> str:
+    # PyAV inside faster-whisper decodes Telegram's OGG/Opus directly
+    segments, _ = _model["whisper"].transcribe(io.BytesIO(audio), language=language, beam_size=1, vad_filter=True)
+    return " ".join(segment.text.strip() for segment in segments).strip()
@@ -7,7 +7,8 @@ class Student(Base):
     __tablename__ = "students"
 
     id = Column(Integer, primary_key=True, index=True)
-    whatsapp_id = Column(String, unique=True, index=True) # Phone number
+    whatsapp_id = Column(String, unique=True, index=True) # Phone number, or Telegram chat id
+    channel = Column(String, nullable=True) # telegram, whatsapp: which provider whatsapp_id belongs to
     name = Column(String, nullable=True)
     email = Column(String, nullable=True)
     profile_data = Column(JSON, default={}) # AI extracted details: age, education, etc.
@@ -1,27 +1,101 @@
 import os
-import httpx
+import logging
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+from app.services.http_client import provider_request, provider_stream, FileTooLargeError
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 
-async def send_telegram_message(chat_id: str, text: str):
+async def deliver_telegram_message(chat_id: str, text: str):
+    # Raw send used by the outbound dispatcher; returns None if not configured
     if not TELEGRAM_BOT_TOKEN:
-        print("Telegram Bot Token missing.")
-        return
+        logger.warning("Telegram Bot Token missing.")
+        return None
+
+    url = f"/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
 
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    
     data = {
         "chat_id": chat_id,
         "text": text,
         "parse_mode": "Markdown"
     }
 
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        try:
-            response = await client.post(url, json=data)
+    return await provider_request("telegram", "POST", url, json=data)
+
+async def send_telegram_message(chat_id: str, text: str):
+    try:
+        response = await deliver_telegram_message(chat_id, text)
+        if response is not None:
             response.raise_for_status()
-        except Exception as e:
-            print(f"Failed to send Telegram message: {e}")
+    except Exception as e:
+        logger.error("Failed to send Telegram message: %s", e)
+
+# --- Progressive (streamed) replies ---
+
+async def send_telegram_message_returning_id(chat_id: str, text: str, parse_mode: str = None):
+    """Send immediately and return the Telegram message_id (None on failure)."""
+    if not TELEGRAM_BOT_TOKEN:
+        logger.warning("Telegram Bot Token missing.")
+        return None
+
+    data = {"chat_id": chat_id, "text": text}
+    if parse_mode:
+        data["parse_mode"] = parse_mode
+    try:
+        response = await provider_request("telegram", "POST", f"/bot{TELEGRAM_BOT_TOKEN}/sendMessage", json=data)
+        response.raise_for_status()
+        return response.json()["result"]["message_id"]
+    except Exception as e:
+        logger.error("Failed to send Telegram message: %s", e)
+        return None
+
+async def edit_telegram_message(chat_id: str, message_id: int, text: str, parse_mode: str = None) -> bool:
+    if not TELEGRAM_BOT_TOKEN:
+        return False
+
+    data = {"chat_id": chat_id, "message_id": message_id, "text": text}
+    if parse_mode:
+        data["parse_mode"] = parse_mode
+    try:
+        response = await provider_request("telegram", "POST", f"/bot{TELEGRAM_BOT_TOKEN}/editMessageText", json=data)
+        response.raise_for_status()
+        return True
+    except Exception as e:
+        logger.error("Failed to edit Telegram message: %s", e)
+        return False
+
+# --- Files (voice notes, documents) ---
+
+async def _telegram_file_info(file_id: str, max_bytes: int) -> dict:
+    response = await provider_request("telegram", "GET", f"/bot{TELEGRAM_BOT_TOKEN}/getFile", params={"file_id": file_id})
+    response.raise_for_status()
+    info = response.json()["result"]
+    if info.get("file_size", 0) > max_bytes:
+        raise FileTooLargeError(f"Telegram file {file_id} is {info['file_size']} bytes (limit {max_bytes})")
+    return info
+
+async def download_telegram_file(file_id: str, max_bytes: int) -> bytes:
+    """Fetch a small file (voice note) into memory; None if the bot is not configured."""
+    if not TELEGRAM_BOT_TOKEN:
+        logger.warning("Telegram Bot Token missing.")
+        return None
+
+    info = await _telegram_file_info(file_id, max_bytes)
+    response = await provider_request("telegram", "GET", f"/file/bot{TELEGRAM_BOT_TOKEN}/{info['file_path']}")
+    response.raise_for_status()
+    return response.content
+
+@asynccontextmanager
+async def open_telegram_file(file_id: str, max_bytes: int):
+    """Streaming response for a file the user sent (documents, photos)."""
+    if not TELEGRAM_BOT_TOKEN:
+        raise RuntimeError("Telegram Bot Token missing.")
+
+    info = await _telegram_file_info(file_id, max_bytes)
+    async with provider_stream("telegram", "GET", f"/file/bot{TELEGRAM_BOT_TOKEN}/{info['file_path']}") as response:
+        response.raise_for_status()
+        yield response
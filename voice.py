@@ -0,0 +1,191 @@
+import os
+import time
+import asyncio
+import logging
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+from app.services import stt_worker
+from app.services.instrumentation import record_span
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Transcription is CPU-bound: one process per spare core by default
+VOICE_WORKERS = int(os.getenv("VOICE_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+VOICE_THREADS_PER_WORKER = int(os.getenv("VOICE_THREADS_PER_WORKER", str(max(1, (os.cpu_count() or 1) // VOICE_WORKERS))))
+VOICE_QUEUE_SIZE = int(os.getenv("VOICE_QUEUE_SIZE", "100"))
+VOICE_JOB_TIMEOUT = float(os.getenv("VOICE_JOB_TIMEOUT", "60"))
+VOICE_MAX_SECONDS = int(os.getenv("VOICE_MAX_SECONDS", "120"))
+VOICE_MAX_BYTES = int(os.getenv("VOICE_MAX_BYTES", str(5 * 2 ** 20)))
+# faster-whisper model: tiny/base/small/medium; "small" handles Urdu-English mix reasonably
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "small")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+VOICE_LANGUAGE = os.getenv("VOICE_LANGUAGE") or None
+
+UNAVAILABLE_MESSAGE = "🎤 Sorry, I can't listen to voice notes right now. Please type your question."
+BUSY_MESSAGE = "🎤 I'm getting a lot of voice notes right now. Please type your question, or try again in a few minutes."
+TOO_LONG_MESSAGE = f"🎤 Please keep voice notes under {VOICE_MAX_SECONDS // 60} minutes, or type your question."
+FAILED_MESSAGE = "🎤 Sorry, I couldn't understand that voice note. Could you type your question?"
+
+_state = {"pool": None, "slots": None, "queue": None, "workers": [], "enabled": False}
+_stats = {"queued": 0, "rejected_busy": 0, "rejected_long": 0, "completed": 0, "failed": 0,
+          "timeouts": 0, "empty": 0, "pool_restarts": 0, "transcribe_seconds": 0.0, "wait_seconds": 0.0}
+
+
+def _new_pool() -> ProcessPoolExecutor:
+    # spawn, not fork: the parent has an event loop, DB pool and sockets open
+    pool = ProcessPoolExecutor(
+        max_workers=VOICE_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=stt_worker.init_worker,
+        initargs=(WHISPER_MODEL, WHISPER_COMPUTE_TYPE, VOICE_THREADS_PER_WORKER),
+    )
+    # Start the processes and load models now rather than on the first voice note
+    for _ in range(VOICE_WORKERS):
+        pool.submit(stt_worker.warmup)
+    return pool
+
+
+def _restart_pool(broken: ProcessPoolExecutor):
+    # Several jobs fail together when a process dies; only the first one rebuilds
+    if _state["pool"] is not broken:
+        return
+    logger.error("Voice process pool broke (worker killed?); starting a new one")
+    _stats["pool_restarts"] += 1
+    broken.shutdown(wait=False, cancel_futures=True)
+    _state["pool"] = _new_pool()
+
+
+async def start_voice_pipeline():
+    if _state["queue"] is not None:
+        return
+    _state["queue"] = asyncio.Queue(maxsize=VOICE_QUEUE_SIZE)
+    if importlib.util.find_spec("faster_whisper") is None:
+        logger.warning("faster-whisper is not installed; voice notes get a 'please type' reply.")
+        return
+
+    _state["pool"] = _new_pool()
+    # One slot per process, held until the process is really done with a job (even one we gave up on)
+    _state["slots"] = asyncio.Semaphore(VOICE_WORKERS)
+    # As many jobs in flight as processes; the rest wait in the bounded queue
+    _state["workers"] = [asyncio.create_task(_worker()) for _ in range(VOICE_WORKERS)]
+    _state["enabled"] = True
+
+
+async def stop_voice_pipeline():
+    for task in _state["workers"]:
+        task.cancel()
+    await asyncio.gather(*_state["workers"], return_exceptions=True)
+    _state["workers"] = []
+    if _state["pool"] is not None:
+        _state["pool"].shutdown(wait=False, cancel_futures=True)
+        _state["pool"] = None
+    _state["slots"] = None
+    _state["queue"] = None
+    _state["enabled"] = False
+
+
+def submit_voice(chat_id: str, file_id: str, duration: int = 0) -> str:
+    """Queue a Telegram voice note; returns None if accepted, else a message to send back."""
+    if not _state["enabled"]:
+        return UNAVAILABLE_MESSAGE
+    if duration > VOICE_MAX_SECONDS:
+        _stats["rejected_long"] += 1
+        return TOO_LONG_MESSAGE
+    try:
+        _state["queue"].put_nowait({"chat_id": chat_id, "file_id": file_id, "queued_at": time.monotonic()})
+    except asyncio.QueueFull:
+        _stats["rejected_busy"] += 1
+        return BUSY_MESSAGE
+    _stats["queued"] += 1
+    return None
+
+
+async def _transcribe(audio: bytes) -> str:
+    loop = asyncio.get_running_loop()
+    slots = _state["slots"]
+    # Submit only when a process is free, so the timeout below measures this job alone and
+    # never the time spent queued behind a job that an earlier timeout abandoned
+    await slots.acquire()
+    pool = _state["pool"]
+    try:
+        future = pool.submit(stt_worker.transcribe, audio, VOICE_LANGUAGE)
+    except BrokenProcessPool:
+        slots.release()
+        _restart_pool(pool)
+        raise
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(slots.release))
+
+    started = time.perf_counter()
+    ok = False
+    try:
+        text = await asyncio.wait_for(asyncio.wrap_future(future), timeout=VOICE_JOB_TIMEOUT)
+        ok = True
+        return text
+    except BrokenProcessPool:
+        _restart_pool(pool)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        _stats["transcribe_seconds"] += elapsed
+        record_span("voice.transcribe", elapsed, ok)
+
+
+async def _process(job: dict):
+    # Imported here: conversation pulls in the whole bot flow
+    from app.services.conversation import handle_text
+    from app.services.outbound import enqueue_message
+    from app.services.telegram_service import download_telegram_file
+
+    chat_id = job["chat_id"]
+    _stats["wait_seconds"] += time.monotonic() - job["queued_at"]
+    try:
+        audio = await download_telegram_file(job["file_id"], VOICE_MAX_BYTES)
+        text = await _transcribe(audio) if audio else ""
+    except asyncio.TimeoutError:
+        _stats["timeouts"] += 1
+        logger.warning("Voice transcription timed out for chat %s", chat_id)
+        await enqueue_message("telegram", chat_id, FAILED_MESSAGE)
+        return
+    except Exception:
+        _stats["failed"] += 1
+        logger.exception("Voice note processing failed for chat %s", chat_id)
+        await enqueue_message("telegram", chat_id, FAILED_MESSAGE)
+        return
+
+    if not text:
+        _stats["empty"] += 1
+        await enqueue_message("telegram", chat_id, FAILED_MESSAGE)
+        return
+    _stats["completed"] += 1
+    # From here it is an ordinary text message: intents, CRM, AI, chat log
+    await handle_text("telegram", chat_id, text)
+
+
+async def _worker():
+    while True:
+        job = await _state["queue"].get()
+        try:
+            await _process(job)
+        except Exception:
+            logger.exception("Voice worker error")
+        finally:
+            _state["queue"].task_done()
+
+
+def get_voice_metrics() -> dict:
+    done = _stats["completed"] + _stats["failed"] + _stats["timeouts"] + _stats["empty"]
+    return {
+        **_stats,
+        "enabled": _state["enabled"],
+        "workers": VOICE_WORKERS if _state["enabled"] else 0,
+        "queue_depth": _state["queue"].qsize() if _state["queue"] is not None else 0,
+        "queue_size": VOICE_QUEUE_SIZE,
+        "transcribe_seconds": round(_stats["transcribe_seconds"], 3),
+        "wait_seconds": round(_stats["wait_seconds"], 3),
+        "avg_transcribe_seconds": round(_stats["transcribe_seconds"] / done, 3) if done else 0.0,
+    }
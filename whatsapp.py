@@ -1,19 +1,30 @@
 import os
-import httpx
+from contextlib import asynccontextmanager
+import logging
+from fastapi import APIRouter, Request, Query, HTTPException
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
+from app.services.http_client import provider_request, provider_stream, FileTooLargeError
+from app.services.conversation import handle_text
+from app.services.idempotency import first_delivery
+from app.services.document_intake import submit_document
+from app.services.outbound import enqueue_message
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
 PHONE_NUMBER_ID = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
 VERIFY_TOKEN = os.getenv("VERIFY_TOKEN")
 
-async def send_whatsapp_message(to_number: str, message_body: str):
+async def deliver_whatsapp_message(to_number: str, message_body: str):
+    # Raw send used by the outbound dispatcher; returns None if not configured
     if not WHATSAPP_TOKEN or not PHONE_NUMBER_ID:
-        print("WhatsApp credentials missing.")
-        return
+        logger.warning("WhatsApp credentials missing.")
+        return None
 
-    url = f"https://graph.facebook.com/v17.0/{PHONE_NUMBER_ID}/messages"
+    url = f"/v17.0/{PHONE_NUMBER_ID}/messages"
     headers = {
         "Authorization": f"Bearer {WHATSAPP_TOKEN}",
         "Content-Type": "application/json",
@@ -24,14 +35,74 @@ async def send_whatsapp_message(to_number: str, message_body: str):
         "text": {"body": message_body},
     }
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, headers=headers, json=data)
+    return await provider_request("whatsapp", "POST", url, headers=headers, json=data)
+
+async def send_whatsapp_message(to_number: str, message_body: str):
+    try:
+        response = await deliver_whatsapp_message(to_number, message_body)
+        if response is not None:
             response.raise_for_status()
-        except Exception as e:
-            print(f"Failed to send WhatsApp message: {e}")
+    except Exception as e:
+        logger.error("Failed to send WhatsApp message: %s", e)
+
+@asynccontextmanager
+async def open_whatsapp_media(media_id: str, max_bytes: int):
+    """Streaming response for media the user sent (documents, images)."""
+    if not WHATSAPP_TOKEN:
+        raise RuntimeError("WhatsApp credentials missing.")
+
+    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}"}
+    # The media id resolves to a short-lived download URL that needs the same token
+    response = await provider_request("whatsapp", "GET", f"/v17.0/{media_id}", headers=headers)
+    response.raise_for_status()
+    info = response.json()
+    if info.get("file_size", 0) > max_bytes:
+        raise FileTooLargeError(f"WhatsApp media {media_id} is {info['file_size']} bytes (limit {max_bytes})")
+
+    async with provider_stream("whatsapp", "GET", info["url"], headers=headers) as media:
+        media.raise_for_status()
+        yield media
 
 def verify_webhook(hub_mode: str, hub_verify_token: str):
     if hub_mode == "subscribe" and hub_verify_token == VERIFY_TOKEN:
         return True
     return False
+
+router = APIRouter()
+
+@router.get("/webhook")
+async def whatsapp_verify(
+    hub_mode: str = Query(None, alias="hub.mode"),
+    hub_verify_token: str = Query(None, alias="hub.verify_token"),
+    hub_challenge: str = Query(None, alias="hub.challenge"),
+):
+    if verify_webhook(hub_mode, hub_verify_token):
+        return PlainTextResponse(hub_challenge)
+    raise HTTPException(status_code=403, detail="Verification failed")
+
+@router.post("/webhook")
+async def whatsapp_webhook(request: Request):
+    data = await request.json()
+    status = "received"
+
+    try:
+        for entry in data.get("entry", []):
+            for change in entry.get("changes", []):
+                for message in change.get("value", {}).get("messages", []):
+                    # Retried deliveries carry the same message id
+                    if not await first_delivery("whatsapp", message.get("id")):
+                        status = "duplicate"
+                        continue
+                    if message.get("type") == "text":
+                        status = await handle_text("whatsapp", message["from"], message["text"]["body"])
+                    elif message.get("type") in ("document", "image"):
+                        media = message[message["type"]]
+                        rejection = submit_document("whatsapp", message["from"], media["id"],
+                                                    media.get("filename"), media.get("caption"))
+                        if rejection:
+                            await enqueue_message("whatsapp", message["from"], rejection)
+                        status = "replied_document_rejected" if rejection else "document_queued"
+    except Exception:
+        logger.exception("Error processing WhatsApp webhook")
+
+    return {"status": status}